@@ -1,3 +1,4 @@
 """
 This is skurge apps module
 """
+default_app_config = 'webapp.apps.skurge.apps.AppsConfig'
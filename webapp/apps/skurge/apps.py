@@ -2,4 +2,9 @@ from django.apps import AppConfig
 
 
 class AppsConfig(AppConfig):
-    name = 'skurge'
+    name = 'webapp.apps.skurge'
+    label = 'skurge'
+
+    def ready(self):
+        # Connects the signal receivers
+        from webapp.apps.skurge import signals  # pylint: disable=unused-import,import-outside-toplevel
@@ -0,0 +1,67 @@
+import copy
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.test import override_settings
+from webapp.apps.skurge.benchmarks.stubs import StubGraphQLServer
+from webapp.apps.skurge.clients.graphql import GraphQLClient
+from webapp.apps.skurge.clients.graphql_batch import GraphQLBatcher
+from webapp.apps.skurge.common.metrics import Metrics
+
+QUERY = "query get_data($user_id: ID!) { userDetails(user_id: $user_id) { name email country_code } }"
+
+
+def run(queries=1000, concurrency=50, latency_ms=10, window_ms=5, mode=GraphQLBatcher.ALIAS):
+    """
+    Fires the queries from concurrent callers against a stub graphql server, once unbatched and once through the
+    micro-batching layer, and reports the requests per upstream call of both
+    :param queries:
+    :param concurrency:
+    :param latency_ms: Latency of the stub graphql server
+    :param window_ms: Batching window
+    :param mode: ALIAS or ARRAY batching
+    :return:
+    """
+    server = StubGraphQLServer(latency_ms=latency_ms).start()
+    external_services = copy.deepcopy(settings.EXTERNAL_SERVICES)
+    external_services["GRAPHQL_SERVER"]["HOST"] = server.host
+    external_services["GRAPHQL_SERVER"]["GATEWAY"] = {"ENABLED": False}
+    batching = dict(getattr(settings, "GRAPHQL_BATCHING", {}), WINDOW_MS=window_ms, MODE=mode)
+    try:
+        with override_settings(EXTERNAL_SERVICES=external_services, GRAPHQL_BATCHING=batching):
+            GraphQLBatcher._instance = None
+            # Warms up the schema and parsed document so only the queries are measured
+            GraphQLClient().prepare_document(QUERY)
+            unbatched = _measure(server, queries, concurrency,
+                                 lambda i: GraphQLClient().fetch_data(query=QUERY, variables={"user_id": i}))
+            batched = _measure(server, queries, concurrency,
+                               lambda i: GraphQLBatcher.get_instance().fetch(query=QUERY, variables={"user_id": i}))
+            GraphQLBatcher._instance = None
+    finally:
+        server.stop()
+    return {
+        "queries": queries,
+        "concurrency": concurrency,
+        "latency_ms": latency_ms,
+        "window_ms": window_ms,
+        "mode": mode,
+        "unbatched": unbatched,
+        "batched": batched
+    }
+
+
+def _measure(server, queries, concurrency, fetch):
+    server.reset()
+    Metrics().reset("graphql.batch")
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(fetch, range(queries)))
+    elapsed = time.monotonic() - started_at
+    mismatches = sum(1 for i, result in enumerate(results) if result["userDetails"]["name"] != "user-%s" % i)
+    return {
+        "upstream_calls": server.requests,
+        "requests_per_upstream_call": round(queries / server.requests, 2) if server.requests else 0,
+        "seconds": round(elapsed, 3),
+        "queries_per_second": round(queries / elapsed, 1) if elapsed else 0,
+        "mismatched_results": mismatches
+    }
@@ -0,0 +1,56 @@
+import time
+from json_logic import jsonLogic
+from webapp.apps.skurge.common.logic import JsonLogicRegistry
+
+# Shaped like the relay_data_locator, relay_event_rules and relay_http_endpoint_rules of registered events
+RULES = {
+    "relay_data_locator": {"if": [
+        {"==": [{"var": "userDetails.country_code"}, "IN"]},
+        {"template_id": "email-template-for-india", "template_data.name": "userDetails.name"},
+        {"in": [{"var": "userDetails.country_code"}, ["AE", "SG", "MY"]]},
+        {"template_id": "email-template-for-gulf", "template_data.name": "userDetails.name"},
+        {"template_id": "email-template-for-others", "template_data.name": "userDetails.name"}]},
+    "relay_event_rules": {"if": [
+        {"and": [{"==": [{"var": "status"}, "CONFIRMED"]}, {">=": [{"var": "order.amount"}, 1000]},
+                 {"!": [{"var": "order.is_test"}]}]}, "HIGH_VALUE_ORDER_CONFIRMED",
+        {"==": [{"var": "status"}, "CONFIRMED"]}, "ORDER_CONFIRMED", None]},
+    "relay_http_endpoint_rules": {"if": [
+        {"==": [{"var": "country_code"}, "IN"]},
+        {"headers": {"Content-Type": "application/json"}, "http_method": "post",
+         "http_endpoint": "https://api.abc.com/{country_code}/orders"}]},
+}
+
+DATA = {
+    "userDetails": {"name": "user", "email": "user@abc.com", "country_code": "SG"},
+    "status": "CONFIRMED",
+    "order": {"amount": 1500, "is_test": False},
+    "country_code": "IN",
+}
+
+
+def run(iterations=100000):
+    """
+    Evaluates rules shaped like those of registered events with the json_logic interpreter and with their compiled
+    closures, and reports the time per evaluation of both
+    :param iterations: Evaluations per rule
+    :return:
+    """
+    results = {}
+    registry = JsonLogicRegistry()
+    for name, rule in RULES.items():
+        interpreted_us = _measure(lambda rule=rule: jsonLogic(rule, DATA), iterations)
+        compiled_us = _measure(lambda rule=rule: registry.apply(rule, DATA), iterations)
+        results[name] = {
+            "interpreted_us": interpreted_us,
+            "compiled_us": compiled_us,
+            "speedup": round(interpreted_us / compiled_us, 2) if compiled_us else 0,
+            "matches_interpreter": registry.apply(rule, DATA) == jsonLogic(rule, DATA)
+        }
+    return {"iterations": iterations, "rules": results}
+
+
+def _measure(evaluate, iterations):
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        evaluate()
+    return round((time.perf_counter() - started_at) / iterations * 1000000, 3)
@@ -0,0 +1,257 @@
+import copy
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import requests
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from webapp.apps.skurge.benchmarks.stubs import StubGraphQLServer, StubAPIServer, StubBroker
+from webapp.apps.skurge.constants import RelayType
+from webapp.apps.skurge.models import SourceEvent, DataProcessor, RelayProcessor, RelayEventLogs
+from webapp.apps.skurge.services.log import RelayLogWriter
+
+SAMPLE_EVENT = "SKURGE_LOAD_TEST"
+QUERY = "query get_data($user_id: ID!) { userDetails(user_id: $user_id) { name email country_code } }"
+DEFAULT_FAULTS = {
+    "graphql": {"latency_ms": 20, "error_rate": 0},
+    "api": {"latency_ms": 20, "error_rate": 0},
+    "broker": {"latency_ms": 1, "error_rate": 0},
+}
+
+
+class QuietWSGIRequestHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+def run(event=None, payload=None, url=None, rate=50, duration=10, concurrency=50, timeout=30, faults=None, seed=None):
+    """
+    Drives the relay endpoint at the target rate and reports the throughput, latency percentiles and errors.
+    Skurge is served in-process on a local port against stub graphql, api and rabbitmq servers, unless the url of a
+    running deployment is given. In-process the stubs and the senders share the interpreter with skurge, so use the
+    url of a deployment to size its workers. A sample event relayed to both an event and an api is registered for the
+    in-process run, unless a registered event is given
+    :param event: Registered source event to post, the sample event by default, required along with the url
+    :param payload: Source data posted for the event, {"user_id": <request number>} by default
+    :param url: Base url of a running skurge to drive instead of the in-process one, stubs are not used then
+    :param rate: Requests per second
+    :param duration: Seconds to drive the endpoint for
+    :param concurrency: Requests in flight at most, the rate is not reached if they are all busy
+    :param timeout: Seconds to wait for a response
+    :param faults: Latency and error rate injected by the stubs, eg. {"api": {"latency_ms": 50, "error_rate": 0.1}},
+    the error rate being the fraction of graphql requests or api relays answered with a 500, or of publishes failing
+    with a channel error. Stubs left out get the DEFAULT_FAULTS
+    :param seed: Seed of the error injection
+    :return:
+    """
+    load = {"rate": rate, "duration": duration, "concurrency": concurrency, "timeout": timeout}
+    if url:
+        if not event:
+            raise ValueError("The event to post to %s is required, the sample event is only registered in-process"
+                             % url)
+        return dict(target=url, **_drive(url, event, payload, load))
+
+    stubs = _start_stubs(faults=faults, seed=seed)
+    try:
+        result = _run_in_process(event, payload, load, stubs)
+    finally:
+        stubs["graphql"].stop()
+        stubs["api"].stop()
+    result["stubs"] = {
+        "graphql": {"requests": stubs["graphql"].requests, "injected_errors": stubs["graphql"].faults.errors},
+        "api": {"requests": stubs["api"].requests, "injected_errors": stubs["api"].faults.errors},
+        "broker": {"published": len(stubs["broker"].published), "injected_errors": stubs["broker"].faults.errors}
+    }
+    return dict(target="in-process", **result)
+
+
+def _start_stubs(faults, seed):
+    faults = {name: dict(defaults, **(faults or {}).get(name, {})) for name, defaults in DEFAULT_FAULTS.items()}
+    return {
+        "graphql": StubGraphQLServer(seed=seed, **faults["graphql"]).start(),
+        "api": StubAPIServer(seed=seed, **faults["api"]).start(),
+        "broker": StubBroker(seed=seed, **faults["broker"])
+    }
+
+
+def _run_in_process(event, payload, load, stubs):
+    """
+    Serves skurge on a local port, pointed at the stubs, and drives it
+    """
+    external_services = copy.deepcopy(settings.EXTERNAL_SERVICES)
+    external_services["GRAPHQL_SERVER"]["HOST"] = stubs["graphql"].host
+    external_services["GRAPHQL_SERVER"]["GATEWAY"] = {"ENABLED": False}
+    external_services["EVENT_SERVICE"] = {"url": "amqp://skurge-load-test", "exchange": "skurge-load-test"}
+    # The stub broker does not confirm publishes
+    publisher = dict(getattr(settings, "RABBITMQ_PUBLISHER", {}), CONFIRMS={"ENABLED": False})
+    server, sample_event = None, None
+    # Relay failures are reported in the results instead of being logged one by one
+    logging.disable(logging.ERROR)
+    try:
+        with override_settings(EXTERNAL_SERVICES=external_services, RABBITMQ_PUBLISHER=publisher,
+                               ALLOWED_HOSTS=list(settings.ALLOWED_HOSTS) + ["127.0.0.1"]), \
+                patch("pika.BlockingConnection", stubs["broker"].connect):
+            if not event:
+                sample_event = _register_sample_event(stubs["api"].host)
+            server = _serve()
+            started_at = timezone.now()
+            result = _drive("http://%s:%s" % server.server_address, event or SAMPLE_EVENT, payload, load)
+            result["relays"] = _get_relays(event or SAMPLE_EVENT, started_at)
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+        if sample_event:
+            _unregister_sample_event(sample_event)
+        logging.disable(logging.NOTSET)
+    return result
+
+
+def _drive(base_url, event, payload, load):
+    """
+    Posts the event at the rate from a pool of concurrent senders, every request is sent at its scheduled time so
+    that slow responses do not slow down the rate, unless all the senders are busy
+    """
+    url = base_url.rstrip("/") + reverse(viewname="skurge-relayer", kwargs={"event_name": event})
+    sessions = threading.local()
+    started_at = time.monotonic()
+
+    def send(index):
+        scheduled_at = started_at + index / load["rate"]
+        delay = scheduled_at - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if not hasattr(sessions, "session"):
+            sessions.session = requests.Session()
+        sent_at = time.monotonic()
+        try:
+            response = sessions.session.post(url, json=payload if payload is not None else {"user_id": index},
+                                             timeout=load["timeout"])
+            outcome = _get_outcome(response)
+        except requests.RequestException as e:
+            outcome = type(e).__name__
+        return time.monotonic() - sent_at, sent_at - scheduled_at, outcome
+
+    with ThreadPoolExecutor(max_workers=load["concurrency"]) as executor:
+        results = list(executor.map(send, range(max(int(load["rate"] * load["duration"]), 1))))
+    return _get_report(event, load, results, time.monotonic() - started_at)
+
+
+def _get_report(event, load, results, elapsed):
+    """
+    Reports the throughput, the latency percentiles and the errors of the requests sent
+    """
+    latencies = sorted(latency for latency, _, _ in results)
+    outcomes = Counter(outcome for _, _, outcome in results)
+    succeeded = outcomes.pop("SUCCESS", 0)
+    return {
+        "event": event,
+        "target_rate": load["rate"],
+        "duration": load["duration"],
+        "concurrency": load["concurrency"],
+        "requests": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "seconds": round(elapsed, 3),
+        "throughput": round(len(results) / elapsed, 1) if elapsed else 0,
+        "latency_ms": {
+            "p50": _get_percentile(latencies, 50),
+            "p95": _get_percentile(latencies, 95),
+            "p99": _get_percentile(latencies, 99),
+            "max": round(latencies[-1] * 1000, 1),
+            "mean": round(sum(latencies) / len(latencies) * 1000, 1)
+        },
+        # Requests sent later than scheduled because every sender was busy
+        "max_send_lag_ms": round(max(lag for _, lag, _ in results) * 1000, 1),
+        "errors": dict(outcomes.most_common())
+    }
+
+
+def _get_outcome(response):
+    if response.status_code != 200:
+        return "HTTP %s" % response.status_code
+    try:
+        body = response.json().get("response") or {}
+    except ValueError:
+        return "Invalid response"
+    if body.get("status") == "SUCCESS":
+        return "SUCCESS"
+    return "FAILED: %s" % (body.get("reason") or "")[:100]
+
+
+def _get_percentile(latencies, percentile):
+    index = min(max(int(round(percentile / 100.0 * len(latencies))) - 1, 0), len(latencies) - 1)
+    return round(latencies[index] * 1000, 1)
+
+
+def _get_relays(event, started_at):
+    """
+    Counts the relay logs of the run by status, and the failed ones by reason
+    """
+    if RelayLogWriter.is_enabled():
+        RelayLogWriter.get_instance().flush()
+    relay_logs = RelayEventLogs.objects.filter(source_event_name=event, created_at__gte=started_at)
+    statuses = Counter(relay_logs.values_list("status", flat=True))
+    reasons = Counter(reason[:160] for reason in relay_logs.filter(status="FAILED").values_list("reason", flat=True)
+                      if reason)
+    return {"statuses": dict(statuses.most_common()), "failure_reasons": dict(reasons.most_common(10))}
+
+
+def _serve():
+    server = ThreadedWSGIServer(("127.0.0.1", 0), QuietWSGIRequestHandler)
+    server.set_app(WSGIHandler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _register_sample_event(api_host):
+    """
+    Registers the sample event, relayed as an event and to the stub api with the user details fetched from graphql
+    """
+    # Left over by an interrupted run
+    for source_event in SourceEvent.objects.filter(source_event=SAMPLE_EVENT, is_deleted=False):
+        relay_processors = list(RelayProcessor.objects.filter(source_event_id=source_event.id, is_deleted=False))
+        data_processors = list(DataProcessor.objects.filter(
+            id__in=[relay_processor.data_processor_id for relay_processor in relay_processors]))
+        _unregister_sample_event((source_event, data_processors, relay_processors))
+
+    source_event = SourceEvent.objects.create(source_event=SAMPLE_EVENT, input_json_schema={
+        "type": "object", "required": ["user_id"], "properties": {"user_id": {"type": "integer"}}})
+    data_processor = DataProcessor.objects.create(
+        graphql_query=QUERY,
+        relay_data_locator={"if": [{"==": [{"var": "userDetails.country_code"}, "IN"]},
+                                   {"template_id": "load-test-india", "template_data.name": "userDetails.name"},
+                                   {"template_id": "load-test-others", "template_data.name": "userDetails.name"}]},
+        default_response={"from": "care@abc.com", "to": "{userDetails[email]}"},
+        relay_json_schema={"type": "object", "required": ["from", "to"],
+                           "properties": {"from": {"type": "string"}, "to": {"type": "string"}}})
+    relay_processors = [
+        RelayProcessor.objects.create(source_event_id=source_event.id, data_processor_id=data_processor.id,
+                                      relay_type=RelayType.EVENT.value, relay_system="load-test",
+                                      relay_event_rules={"if": [{"==": [1, 1]}, "SKURGE_LOAD_TEST_RELAYED"]},
+                                      context_data_locator={}),
+        RelayProcessor.objects.create(source_event_id=source_event.id, data_processor_id=data_processor.id,
+                                      relay_type=RelayType.API.value, relay_system="load-test",
+                                      context_data_locator={"country_code": "userDetails.country_code"},
+                                      relay_http_endpoint_rules={"if": [True, {
+                                          "headers": {"Content-Type": "application/json"}, "http_method": "post",
+                                          "http_endpoint": "http://%s/relay/{country_code}" % api_host}]})
+    ]
+    return source_event, [data_processor], relay_processors
+
+
+def _unregister_sample_event(sample_event):
+    # Soft deleted, which invalidates the cached event config
+    source_event, data_processors, relay_processors = sample_event
+    for instance in relay_processors + data_processors + [source_event]:
+        instance.delete()
@@ -0,0 +1,313 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from graphql import GraphQLSchema, GraphQLObjectType, GraphQLField, GraphQLArgument, GraphQLNonNull, \
+    GraphQLString, GraphQLID
+from graphql.error import format_error
+from graphql.execution import execute
+from graphql.language.parser import parse
+from pika.exceptions import AMQPChannelError, ConnectionWrongStateError
+
+USER_DETAILS_TYPE = GraphQLObjectType("UserDetails", fields={
+    "name": GraphQLField(GraphQLString),
+    "email": GraphQLField(GraphQLString),
+    "country_code": GraphQLField(GraphQLString)
+})
+
+STUB_GRAPHQL_SCHEMA = GraphQLSchema(query=GraphQLObjectType("Query", fields={
+    "userDetails": GraphQLField(USER_DETAILS_TYPE, args={"user_id": GraphQLArgument(GraphQLNonNull(GraphQLID))},
+                                resolver=lambda root, info, user_id: {"name": "user-%s" % user_id,
+                                                                      "email": "user-%s@abc.com" % user_id,
+                                                                      "country_code": "IN"})
+}))
+
+
+class FaultInjector:
+    """
+    Latency and error injection of the stub servers. Every request is delayed by the latency and fails at the error
+    rate, failures are drawn from a seeded random generator so that runs are reproducible.
+    """
+
+    def __init__(self, latency_ms=0, error_rate=0, seed=None):
+        self.latency = latency_ms / 1000.0
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def inject(self):
+        """
+        Delays the request by the latency and returns True if the request is to fail
+        :return:
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.error_rate:
+            return False
+        with self.lock:
+            failed = self.random.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+
+class StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class StubServer:
+    """
+    Base class for the in-process stub servers used by benchmarks and load tests.
+    Serves http on a free local port from a background thread, counts the requests it receives and can delay them by
+    a fixed latency or fail them with a 500 at a given error rate.
+    """
+
+    def __init__(self, latency_ms=0, error_rate=0, seed=None):
+        self.faults = FaultInjector(latency_ms=latency_ms, error_rate=error_rate, seed=seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = StubHTTPServer(("127.0.0.1", 0), self.get_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def host(self):
+        return "%s:%s" % self.server.server_address
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+
+    def handle(self, body):
+        """
+        Returns the (status, response body) for the posted json body
+        :param body:
+        :return:
+        """
+        raise NotImplementedError
+
+    def get_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keeps connections alive like the real servers
+
+            def do_POST(self):
+                with stub.lock:
+                    stub.requests += 1
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"null")
+                if stub.faults.inject():
+                    status, response = 500, {"error": "Injected error"}
+                else:
+                    status, response = stub.handle(body)
+                payload = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class StubGraphQLServer(StubServer):
+    """
+    Stand-in for the graphql server, executes queries against a stub user schema.
+    Supports single requests as well as batched array requests.
+    """
+
+    def handle(self, body):
+        if isinstance(body, list):
+            return 200, [self.execute(payload) for payload in body]
+        return 200, self.execute(body)
+
+    def execute(self, payload):
+        result = execute(STUB_GRAPHQL_SCHEMA, parse(payload["query"]), variable_values=payload.get("variables"),
+                         operation_name=payload.get("operationName"))
+        response = {"data": result.data}
+        if result.errors:
+            response["errors"] = [format_error(error) for error in result.errors]
+        return response
+
+
+class StubAPIServer(StubServer):
+    """
+    Stand-in for the destination of api relays, accepts every request
+    """
+
+    def handle(self, body):
+        return 200, {"status": "OK"}
+
+
+class StubBroker:  # pylint: disable=too-many-instance-attributes
+    """
+    In-process stand-in for rabbitmq, used in place of pika.BlockingConnection by tests, benchmarks and load tests.
+    Supports topic routing from the exchange to bound queues, consuming with a prefetch count, acks and nacks, requeued
+    messages being flagged as redelivered. The published, acked and rejected messages are kept for tests to assert on.
+    With stop_when_idle, consuming stops once every queue is drained and all messages are settled.
+    Publishes can be delayed by a fixed latency or fail with a channel error at a given error rate.
+    """
+
+    def __init__(self, stop_when_idle=True, latency_ms=0, error_rate=0, seed=None):
+        self.stop_when_idle = stop_when_idle
+        self.faults = FaultInjector(latency_ms=latency_ms, error_rate=error_rate, seed=seed)
+        self.queues = {}
+        self.bindings = []
+        self.published = []
+        self.acked = []
+        self.rejected = []
+        self.lock = threading.Condition()
+
+    def connect(self, parameters=None):
+        return StubBrokerConnection(self)
+
+    def publish(self, exchange, routing_key, body, properties=None):
+        with self.lock:
+            self.published.append((exchange, routing_key, body))
+            # A message is routed once to every queue having a matching binding
+            queues = {queue for bound_exchange, pattern, queue in self.bindings
+                      if bound_exchange == exchange and pattern.match(routing_key)}
+            for queue in queues:
+                self.queues[queue].append((routing_key, body, properties, False))
+            self.lock.notify_all()
+
+    def bind(self, queue, exchange, routing_key):
+        # Topic matching, * matches a single word and # any number of words
+        pattern = re.escape(routing_key).replace(r"\*", r"[^.]+").replace(r"\#", r".*")
+        binding = (exchange, re.compile("^%s$" % pattern), queue)
+        with self.lock:
+            self.queues.setdefault(queue, deque())
+            if binding not in self.bindings:
+                self.bindings.append(binding)
+
+
+class StubBrokerConnection:
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+        self.callbacks = deque()
+        self.channels = []
+
+    def channel(self):
+        channel = StubBrokerChannel(self)
+        self.channels.append(channel)
+        return channel
+
+    def add_callback_threadsafe(self, callback):
+        if not self.is_open:
+            raise ConnectionWrongStateError("Connection is closed")
+        with self.broker.lock:
+            self.callbacks.append(callback)
+            self.broker.lock.notify_all()
+
+    def process_data_events(self, time_limit=0):
+        while self.callbacks:
+            self.callbacks.popleft()()
+
+    def close(self):
+        self.is_open = False
+        for channel in self.channels:
+            channel.is_open = False
+
+
+class StubBrokerChannel:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.is_open = True
+        self.prefetch_count = 0
+        self.consumers = []
+        self.unacked = {}
+        self.delivery_tag = 0
+        self.consuming = False
+
+    @property
+    def broker(self):
+        return self.connection.broker
+
+    def basic_qos(self, prefetch_size=0, prefetch_count=0, global_qos=False):
+        self.prefetch_count = prefetch_count
+
+    def queue_declare(self, queue, durable=False, **kwargs):
+        with self.broker.lock:
+            self.broker.queues.setdefault(queue, deque())
+
+    def queue_bind(self, queue, exchange, routing_key=None, arguments=None):
+        self.broker.bind(queue=queue, exchange=exchange, routing_key=routing_key)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if self.broker.faults.inject():
+            # The broker closes the channel on channel errors
+            self.is_open = False
+            raise AMQPChannelError("Injected error")
+        self.broker.publish(exchange=exchange, routing_key=routing_key, body=body, properties=properties)
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False, **kwargs):
+        self.consumers.append((queue, on_message_callback))
+
+    def basic_ack(self, delivery_tag=None, multiple=False):
+        with self.broker.lock:
+            self.broker.acked.append(self.unacked.pop(delivery_tag))
+
+    def basic_nack(self, delivery_tag=None, multiple=False, requeue=True):
+        with self.broker.lock:
+            queue, message = self.unacked.pop(delivery_tag)
+            if requeue:
+                # Requeued messages are flagged as redelivered
+                self.broker.queues[queue].appendleft(message[:3] + (True,))
+            else:
+                self.broker.rejected.append((queue, message))
+
+    def stop_consuming(self):
+        self.consuming = False
+
+    def start_consuming(self):
+        """
+        Delivers messages to the consumers within the prefetch count and runs the callbacks of other threads
+        :return:
+        """
+        self.consuming = True
+        while self.consuming:
+            self.connection.process_data_events()
+            delivery = self.__next_delivery()
+            if delivery:
+                queue, callback, (routing_key, body, properties, redelivered) = delivery
+                method = SimpleNamespace(delivery_tag=self.delivery_tag, routing_key=routing_key, exchange="",
+                                         redelivered=redelivered)
+                callback(self, method, properties, body)
+                continue
+            with self.broker.lock:
+                if self.broker.stop_when_idle and not self.unacked and not self.connection.callbacks and \
+                        not any(self.broker.queues[queue] for queue, _ in self.consumers):
+                    return
+                if not self.connection.callbacks:
+                    self.broker.lock.wait(0.01)
+
+    def __next_delivery(self):
+        with self.broker.lock:
+            if self.prefetch_count and len(self.unacked) >= self.prefetch_count:
+                return None
+            for queue, callback in self.consumers:
+                if self.broker.queues[queue]:
+                    message = self.broker.queues[queue].popleft()
+                    self.delivery_tag += 1
+                    self.unacked[self.delivery_tag] = (queue, message)
+                    return queue, callback, message
+        return None
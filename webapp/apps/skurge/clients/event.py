@@ -1,6 +1,13 @@
 import logging
 import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import pika
+from pika.exceptions import AMQPConnectionError, AMQPChannelError
 from django.conf import settings
 
 
@@ -14,20 +21,388 @@ class RabbitMQClient:
     def publish(self, routing_key, data):
         """
         Publishes data to rabbitmq with given routing_key
+        In confirm mode it returns once the broker has confirmed the message, else raises PublishNotConfirmedException,
+        or PublishConfirmTimeoutException if the confirm did not come in time
         @param routing_key:
         @param data:
         """
         logging.info("Publishing event - %s - %s", routing_key, data)
-        connection = self._connect()
-        channel = connection.channel()
-        channel.basic_publish(exchange=self.config['exchange'], routing_key=routing_key, body=json.dumps(data))
-        connection.close()
+        confirms = getattr(settings, "RABBITMQ_PUBLISHER", {}).get("CONFIRMS", {})
+        if confirms.get("ENABLED"):
+            # Waits for the broker to confirm the message, raises if it is nacked or not confirmed in time
+            future = ConfirmingPublisher.get_instance(self.config).publish(
+                exchange=self.config['exchange'], routing_key=routing_key, body=json.dumps(data),
+                properties=pika.BasicProperties(content_type="application/json", delivery_mode=2))
+            try:
+                future.result(timeout=confirms.get("TIMEOUT", 10))
+            except FutureTimeoutError as e:
+                raise PublishConfirmTimeoutException("Message not confirmed by rabbitmq in time") from e
+            logging.info("Event has been published and confirmed")
+            return
+        RabbitMQPublisher.get_instance(self.config).publish(exchange=self.config['exchange'], routing_key=routing_key,
+                                                            body=json.dumps(data))
         logging.info("Event has been published")
 
-    def _connect(self):
+    def publish_batch(self, routing_key, messages):
         """
-        Connects to rabbitmq and returns connection object
-        @return:
+        Publishes the messages to rabbitmq with given routing_key, in confirm mode the messages are pipelined and
+        confirmed together
+        @param routing_key:
+        @param messages: list of data to publish
+        @return: list of errors for the messages, None for the published ones
+        """
+        logging.info("Publishing %s events - %s", len(messages), routing_key)
+        confirms = getattr(settings, "RABBITMQ_PUBLISHER", {}).get("CONFIRMS", {})
+        if not confirms.get("ENABLED"):
+            errors = []
+            for index, data in enumerate(messages):
+                try:
+                    RabbitMQPublisher.get_instance(self.config).publish(exchange=self.config['exchange'],
+                                                                        routing_key=routing_key, body=json.dumps(data))
+                    errors.append(None)
+                except Exception as e:
+                    # Reconnects were already retried by the publisher, the rest of the messages would fail as well
+                    return errors + [e] * (len(messages) - index)
+            return errors
+
+        publisher = ConfirmingPublisher.get_instance(self.config)
+        futures = [publisher.publish(exchange=self.config['exchange'], routing_key=routing_key, body=json.dumps(data),
+                                     properties=pika.BasicProperties(content_type="application/json", delivery_mode=2))
+                   for data in messages]
+        deadline = time.monotonic() + confirms.get("TIMEOUT", 10)
+        errors = []
+        for future in futures:
+            try:
+                future.result(timeout=max(deadline - time.monotonic(), 0))
+                errors.append(None)
+            except FutureTimeoutError:
+                errors.append(PublishConfirmTimeoutException("Message not confirmed by rabbitmq in time"))
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+
+class RabbitMQPublisher:
+    """
+    Long lived per worker publisher.
+    Keeps a small pool of connections open instead of connecting for every message. A blocking connection is not thread
+    safe, so every publish takes an idle connection and its channel out of the pool for itself, and concurrent relayers
+    publish on separate connections, up to the pool size. Broken connections and channels are replaced transparently,
+    retrying with exponential backoff while the broker restarts.
+    The publisher is created lazily and tied to the process id, so uwsgi workers open their own connections after the
+    fork and never share a socket with the master.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, config):
+        self.config = config
+        self.publisher_config = getattr(settings, "RABBITMQ_PUBLISHER", {})
+        self.pid = os.getpid()
+        self.idle = queue.LifoQueue()
+        # Publishes in flight, each one holds a connection of its own
+        self.slots = threading.BoundedSemaphore(self.publisher_config.get("CONNECTION_POOL_SIZE", 4))
+
+    @classmethod
+    def get_instance(cls, config):
+        """
+        Gets the publisher of the current worker process for the broker url
+        :param config:
+        :return:
+        """
+        key = config.get('url')
+        instance = cls._instances.get(key)
+        if instance and instance.pid == os.getpid():
+            return instance
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if not instance or instance.pid != os.getpid():
+                instance = cls(config)
+                cls._instances[key] = instance
+            return instance
+
+    def publish(self, exchange, routing_key, body, properties=None):
+        """
+        Publishes the message on a pooled connection, reconnecting with backoff on connection or channel failures
+        :param exchange:
+        :param routing_key:
+        :param body:
+        :param properties:
+        :return:
+        """
+        max_retries = self.publisher_config.get("MAX_RETRIES", 3)
+        attempt = 0
+        while True:
+            with self.slots:
+                connection, channel, published = None, None, False
+                try:
+                    connection, channel = self.acquire_channel()
+                    channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body,
+                                          properties=properties)
+                    published = True
+                    return
+                except (AMQPConnectionError, AMQPChannelError) as e:
+                    if attempt >= max_retries:
+                        raise
+                    backoff = min(self.publisher_config.get("BACKOFF", 0.1) * (2 ** attempt),
+                                  self.publisher_config.get("MAX_BACKOFF", 2))
+                    logging.warning("Publishing to rabbitmq failed: %s, retrying in %ss", str(e), backoff)
+                finally:
+                    # Any error may have left the connection unusable, only a connection that published goes back
+                    if published:
+                        self.release_channel(connection, channel)
+                    else:
+                        self.close(connection)
+            # Backs off without holding on to a connection slot
+            time.sleep(backoff)
+            attempt += 1
+
+    def acquire_channel(self):
+        """
+        Takes an idle connection and its channel out of the pool, connecting to rabbitmq if none is left
+        :return: tuple of (connection, channel)
+        """
+        while True:
+            try:
+                connection, channel = self.idle.get_nowait()
+            except queue.Empty:
+                logging.info("Connecting to rabbitmq")
+                connection = pika.BlockingConnection(pika.URLParameters(self.config.get('url')))
+                return connection, connection.channel()
+            if not connection.is_open:
+                continue
+            # Services heartbeats and broker notifications of the idle connection
+            connection.process_data_events(time_limit=0)
+            if channel.is_open:
+                return connection, channel
+            # The broker closed the channel after a channel error, the connection itself is still usable
+            return connection, connection.channel()
+
+    def release_channel(self, connection, channel):
+        """
+        Returns the connection and its channel to the pool
+        :param connection:
+        :param channel:
+        :return:
+        """
+        if connection.is_open:
+            self.idle.put((connection, channel))
+
+    @staticmethod
+    def close(connection):
+        """
+        Drops a broken connection, the next publish takes another one or reconnects
+        :param connection:
+        :return:
         """
-        params = pika.URLParameters(self.config.get('url'))
-        return pika.BlockingConnection(params)
+        if connection and connection.is_open:
+            try:
+                connection.close()
+            except Exception as e:
+                logging.warning("Error closing rabbitmq connection: %s", str(e))
+
+
+class PublishNotConfirmedException(Exception):
+    """
+    Raised for messages nacked by the broker or lost with the connection before being confirmed
+    """
+
+
+class PublishConfirmTimeoutException(PublishNotConfirmedException):
+    """
+    Raised for messages whose confirm did not come in time, the broker may still ack them afterwards
+    """
+
+
+class ConfirmingPublisher:
+    """
+    Per worker publisher with publisher confirms.
+    Messages are buffered and published in batches, once the batch size is reached or the max wait has passed, back to
+    back on one confirm mode channel without waiting for the broker in between. The broker acks or nacks them, often
+    many at once, and the future returned for every message is resolved with its outcome. This gives at-least-once
+    delivery without paying a round trip per message.
+    The connection runs its own io loop in a background thread, it reconnects with backoff when the connection drops.
+    Messages not confirmed before a connection drop are failed so that their callers can retry them.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, config):
+        self.config = config
+        self.confirms_config = getattr(settings, "RABBITMQ_PUBLISHER", {}).get("CONFIRMS", {})
+        self.pid = os.getpid()
+        self.state = ConfirmState()
+        self.connection = None
+        self.channel = None
+        self.thread = threading.Thread(target=self.run, name="rabbitmq-confirming-publisher", daemon=True)
+
+    @classmethod
+    def get_instance(cls, config):
+        """
+        Gets the started publisher of the current worker process for the broker url
+        :param config:
+        :return:
+        """
+        key = config.get('url')
+        instance = cls._instances.get(key)
+        if instance and instance.pid == os.getpid():
+            return instance
+        with cls._instances_lock:
+            instance = cls._instances.get(key)
+            if not instance or instance.pid != os.getpid():
+                instance = cls(config)
+                instance.thread.start()
+                cls._instances[key] = instance
+            return instance
+
+    def publish(self, exchange, routing_key, body, properties=None):
+        """
+        Buffers the message for the next batch and returns a future resolved once the broker confirms it
+        :param exchange:
+        :param routing_key:
+        :param body:
+        :param properties:
+        :return:
+        """
+        future = Future()
+        with self.state.lock:
+            self.state.pending.append((exchange, routing_key, body, properties, future))
+            buffered = len(self.state.pending)
+        if buffered >= self.confirms_config.get("BATCH_SIZE", 100):
+            self.__call_threadsafe(self.flush)
+        elif buffered == 1:
+            self.__call_threadsafe(self.__start_timer)
+        return future
+
+    def run(self):
+        """
+        Runs the io loop of the connection, reconnecting with backoff whenever it stops
+        :return:
+        """
+        publisher_config = getattr(settings, "RABBITMQ_PUBLISHER", {})
+        attempt = 0
+        while True:
+            try:
+                self.connection = pika.SelectConnection(pika.URLParameters(self.config.get('url')),
+                                                        on_open_callback=self.on_connection_open,
+                                                        on_open_error_callback=self.on_connection_closed,
+                                                        on_close_callback=self.on_connection_closed)
+                self.connection.ioloop.start()
+                attempt = 0 if self.state.delivery_tag else attempt + 1
+            except Exception as e:
+                logging.error("Rabbitmq confirming publisher stopped: %s", str(e))
+                attempt += 1
+            self.channel = None
+            self.fail_unconfirmed("Connection to rabbitmq closed before the message was confirmed")
+            time.sleep(min(publisher_config.get("BACKOFF", 0.1) * (2 ** attempt), publisher_config.get("MAX_BACKOFF", 2)))
+
+    def on_connection_open(self, connection):
+        connection.channel(on_open_callback=self.on_channel_open)
+
+    def on_connection_closed(self, connection, reason):
+        logging.warning("Rabbitmq connection of confirming publisher closed: %s", reason)
+        connection.ioloop.stop()
+
+    def on_channel_open(self, channel):
+        channel.add_on_close_callback(self.on_channel_closed)
+        channel.confirm_delivery(ack_nack_callback=self.on_delivery_confirmation,
+                                 callback=lambda frame: self.on_confirm_mode(channel))
+
+    def on_channel_closed(self, channel, reason):
+        logging.warning("Rabbitmq channel of confirming publisher closed: %s", reason)
+        self.channel = None
+        if self.connection and self.connection.is_open:
+            self.connection.close()
+
+    def on_confirm_mode(self, channel):
+        # Delivery tags restart with every channel
+        self.state.delivery_tag = 0
+        self.channel = channel
+        logging.info("Rabbitmq confirming publisher ready")
+        self.flush()
+
+    def on_delivery_confirmation(self, method_frame):
+        method = method_frame.method
+        self.handle_confirmation(delivery_tag=method.delivery_tag, multiple=method.multiple,
+                                 ack=isinstance(method, pika.spec.Basic.Ack))
+
+    def handle_confirmation(self, delivery_tag, multiple, ack):
+        """
+        Resolves the futures of the confirmed messages, all messages up to the delivery tag if multiple is set
+        :param delivery_tag:
+        :param multiple:
+        :param ack:
+        :return:
+        """
+        with self.state.lock:
+            if multiple:
+                tags = [tag for tag in self.state.unconfirmed if tag <= delivery_tag]
+            else:
+                tags = [delivery_tag] if delivery_tag in self.state.unconfirmed else []
+            futures = [self.state.unconfirmed.pop(tag) for tag in tags]
+        for future in futures:
+            if ack:
+                future.set_result(True)
+            else:
+                future.set_exception(PublishNotConfirmedException("Message was nacked by rabbitmq"))
+
+    def flush(self):
+        """
+        Publishes all buffered messages back to back, runs on the io loop thread
+        :return:
+        """
+        if self.state.timer and self.connection:
+            self.connection.ioloop.remove_timeout(self.state.timer)
+        self.state.timer = None
+        if not self.channel:
+            return
+        with self.state.lock:
+            batch, self.state.pending = self.state.pending, deque()
+        if batch:
+            logging.info("Publishing batch of %s messages to rabbitmq", len(batch))
+        for exchange, routing_key, body, properties, future in batch:
+            try:
+                self.channel.basic_publish(exchange=exchange, routing_key=routing_key, body=body,
+                                           properties=properties)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            with self.state.lock:
+                self.state.delivery_tag += 1
+                self.state.unconfirmed[self.state.delivery_tag] = future
+
+    def fail_unconfirmed(self, reason):
+        with self.state.lock:
+            futures, self.state.unconfirmed = list(self.state.unconfirmed.values()), OrderedDict()
+        for future in futures:
+            future.set_exception(PublishNotConfirmedException(reason))
+
+    def __start_timer(self):
+        if not self.state.timer and self.connection:
+            max_wait = self.confirms_config.get("MAX_WAIT_MS", 5) / 1000.0
+            self.state.timer = self.connection.ioloop.call_later(max_wait, self.flush)
+
+    def __call_threadsafe(self, callback):
+        """
+        Schedules the callback on the io loop thread, buffered messages are flushed on connect if the loop is down
+        :param callback:
+        :return:
+        """
+        try:
+            self.connection.ioloop.add_callback_threadsafe(callback)
+        except Exception as e:
+            logging.warning("Rabbitmq confirming publisher not connected: %s", str(e))
+
+
+class ConfirmState:
+    """
+    Batch state of a confirming publisher: the messages buffered for the next batch, the timer flushing them and the
+    futures of the published messages waiting for their confirm by delivery tag
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = deque()
+        self.unconfirmed = OrderedDict()
+        self.delivery_tag = 0
+        self.timer = None
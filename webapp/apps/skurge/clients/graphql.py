@@ -1,8 +1,15 @@
 import logging
 import copy
+import os
+import threading
+import time
+from collections import OrderedDict
 from django.conf import settings
-from gql import gql, Client
+from gql import gql
 from gql.transport.requests import RequestsHTTPTransport
+from graphql import build_client_schema, introspection_query, parse
+from graphql.validation import validate
+from requests.adapters import HTTPAdapter
 from webapp.apps.skurge.common.exceptions import InvalidInputException
 
 
@@ -10,11 +17,22 @@ class GraphQLClient:
     """
     Base class for a graphql server.
     Can connect to any graphql server to fetch data
+
+    Transports, introspected schemas and parsed query documents are kept per worker and shared by all instances, so a
+    fetch costs a single round trip on a pooled keep-alive connection. The schema is introspected again once the
+    configured refresh interval has passed.
     """
     graphql_endpoint = None
     headers = None
     secure = None
 
+    _transports = {}
+    _schemas = {}
+    _documents = OrderedDict()
+    _validated = set()
+    _lock = threading.Lock()
+    _pid = None
+
     def __init__(self, extra_headers=None):
         service_conf = copy.deepcopy(settings.EXTERNAL_SERVICES.get("GRAPHQL_SERVER", {}))
         gateway_conf = copy.deepcopy(settings.GATEWAY)
@@ -31,6 +49,8 @@ class GraphQLClient:
             for key, value in extra_headers.items():
                 self.headers[key] = value
 
+        self.client_conf = getattr(settings, "GRAPHQL_CLIENT", {})
+
     def get_baseurl(self):
         protocol = "https://" if self.secure else "http://"
         return protocol + self.graphql_endpoint
@@ -44,11 +64,137 @@ class GraphQLClient:
         :return:
         """
         url = self.get_baseurl()
-        headers = self.get_headers()
         logging.info("Fetching data for query %s and variables %s from %s graphql server", query, variables, url)
-        transport = RequestsHTTPTransport(url=url, use_json=True, headers=headers)
-        client = Client(transport=transport, fetch_schema_from_transport=True)
-        query = gql(query)
-        response = client.execute(query, variable_values=variables)
-        logging.info("Response from graphql server: %s", response)
-        return response
+        document = self.prepare_document(query)
+        result = self.get_transport().execute(document, variable_values=variables)
+        if result.errors:
+            raise Exception(str(result.errors[0]))
+        logging.info("Response from graphql server: %s", result.data)
+        return result.data
+
+    def prepare_document(self, query):
+        """
+        Gets the parsed document of the query validated against the server schema
+        :param query:
+        :return:
+        """
+        document = self.get_document(query)
+        self.validate_document(transport=self.get_transport(), query=query, document=document)
+        return document
+
+    def execute_document(self, document, variables):
+        """
+        Executes an already prepared document and returns the raw execution result including errors
+        :param document:
+        :param variables:
+        :return:
+        """
+        return self.get_transport().execute(document, variable_values=variables)
+
+    def execute_batch(self, payloads):
+        """
+        Sends a list of {query, variables} payloads as one batched array request, for servers supporting it.
+        Returns the list of results in the order of the payloads.
+        :param payloads:
+        :return:
+        """
+        transport = self.get_transport()
+        response = transport.session.post(transport.url, json=payloads, headers=transport.headers,
+                                          timeout=transport.default_timeout)
+        response.raise_for_status()
+        results = response.json()
+        if not isinstance(results, list) or len(results) != len(payloads):
+            raise Exception("Graphql server did not return a batched result")
+        return results
+
+    def get_transport(self):
+        """
+        Gets the worker's transport for the server url and headers, creating it with a pooled keep-alive session on
+        first use. Transports are dropped after a fork so that connections are never shared between processes.
+        :return:
+        """
+        self.__reset_after_fork()
+        url = self.get_baseurl()
+        headers = self.get_headers() or {}
+        key = (url, tuple(sorted(headers.items())))
+        transport = self._transports.get(key)
+        if transport:
+            return transport
+        with self._lock:
+            transport = self._transports.get(key)
+            if not transport:
+                transport = RequestsHTTPTransport(url=url, use_json=True, headers=headers,
+                                                  timeout=self.client_conf.get("TIMEOUT"))
+                adapter = HTTPAdapter(pool_connections=self.client_conf.get("POOL_CONNECTIONS", 1),
+                                      pool_maxsize=self.client_conf.get("POOL_MAXSIZE", 10))
+                transport.session.mount("http://", adapter)
+                transport.session.mount("https://", adapter)
+                self._transports[key] = transport
+        return transport
+
+    def get_schema(self, transport):
+        """
+        Gets the introspected schema of the server, introspecting again after the refresh interval
+        :param transport:
+        :return:
+        """
+        cached = self._schemas.get(transport.url)
+        refresh_interval = self.client_conf.get("SCHEMA_REFRESH_INTERVAL", 600)
+        if cached and time.monotonic() - cached[1] < refresh_interval:
+            return cached[0]
+        logging.info("Fetching schema from %s graphql server", transport.url)
+        introspection = transport.execute(parse(introspection_query)).data
+        schema = build_client_schema(introspection)
+        with self._lock:
+            self._schemas[transport.url] = (schema, time.monotonic())
+            # Queries have to be validated again against the refreshed schema
+            self._validated.clear()
+        return schema
+
+    def get_document(self, query):
+        """
+        Gets the parsed document of the query, parsing it only on first use
+        :param query:
+        :return:
+        """
+        document = self._documents.get(query)
+        if document:
+            return document
+        document = gql(query)
+        with self._lock:
+            self._documents[query] = document
+            while len(self._documents) > self.client_conf.get("MAX_DOCUMENTS", 512):
+                self._documents.popitem(last=False)
+        return document
+
+    def validate_document(self, transport, query, document):
+        """
+        Validates the document against the server schema, once per query and introspected schema
+        :param transport:
+        :param query:
+        :param document:
+        :return:
+        """
+        if not self.client_conf.get("VALIDATE_QUERIES", True):
+            return
+        schema = self.get_schema(transport)
+        key = (transport.url, query)
+        if key in self._validated:
+            return
+        validation_errors = validate(schema, document)
+        if validation_errors:
+            raise validation_errors[0]
+        with self._lock:
+            if len(self._validated) > self.client_conf.get("MAX_DOCUMENTS", 512):
+                self._validated.clear()
+            self._validated.add(key)
+
+    def __reset_after_fork(self):
+        if GraphQLClient._pid == os.getpid():
+            return
+        with self._lock:
+            if GraphQLClient._pid != os.getpid():
+                GraphQLClient._transports = {}
+                GraphQLClient._schemas = {}
+                GraphQLClient._validated = set()
+                GraphQLClient._pid = os.getpid()
@@ -0,0 +1,267 @@
+import copy
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from django.conf import settings
+from graphql.language import ast
+from webapp.apps.skurge.clients.graphql import GraphQLClient
+from webapp.apps.skurge.common.metrics import Metrics
+
+
+class GraphQLBatcher:
+    """
+    Micro-batching layer under GraphQLClient.
+    Queries issued within a short window are collected and shipped to the graphql server in one request, either merged
+    into a single aliased operation or as a batched array request when the server supports it. Results are then
+    demultiplexed back to each waiting caller.
+    One batcher runs per worker, it is created lazily so that its threads always belong to the forked worker.
+    """
+    ALIAS = "ALIAS"
+    ARRAY = "ARRAY"
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.config = getattr(settings, "GRAPHQL_BATCHING", {})
+        self.window = self.config.get("WINDOW_MS", 5) / 1000.0
+        self.max_batch_size = self.config.get("MAX_BATCH_SIZE", 25)
+        self.pid = os.getpid()
+        self.queue = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=self.config.get("DISPATCH_WORKERS", 4),
+                                           thread_name_prefix="graphql-batch")
+        self.collector = threading.Thread(target=self.__collect, name="graphql-batch-collector", daemon=True)
+        self.collector.start()
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Gets the batcher of the current worker process
+        :return:
+        """
+        instance = cls._instance
+        if instance and instance.pid == os.getpid():
+            return instance
+        with cls._instance_lock:
+            if not cls._instance or cls._instance.pid != os.getpid():
+                cls._instance = cls()
+            return cls._instance
+
+    def fetch(self, query, variables):
+        """
+        Queues the query for the next batch and waits for its result
+        :param query:
+        :param variables:
+        :return:
+        """
+        future = Future()
+        self.queue.put((query, variables, future))
+        return future.result(timeout=self.config.get("TIMEOUT", 30))
+
+    def stats(self):
+        """
+        Returns the number of batched queries, the upstream calls made for them and the queries per upstream call
+        :return:
+        """
+        metrics = Metrics()
+        queries = metrics.get("graphql.batched_queries")
+        upstream_calls = metrics.get("graphql.batch_upstream_calls")
+        return {
+            "queries": queries,
+            "upstream_calls": upstream_calls,
+            "queries_per_upstream_call": round(queries / upstream_calls, 2) if upstream_calls else 0
+        }
+
+    def __collect(self):
+        """
+        Collects the queries issued within the batching window and hands every batch over to the dispatchers
+        :return:
+        """
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.executor.submit(self.dispatch, batch)
+
+    def dispatch(self, batch):
+        """
+        Sends the batch to the graphql server and resolves the waiting futures
+        :param batch: list of (query, variables, future)
+        :return:
+        """
+        Metrics().incr("graphql.batched_queries", len(batch))
+        try:
+            if len(batch) == 1:
+                self.__dispatch_single(batch[0])
+            elif self.config.get("MODE", self.ALIAS) == self.ARRAY:
+                self.__dispatch_array(batch)
+            else:
+                self.__dispatch_aliased(batch)
+        except Exception as e:
+            logging.error("Error dispatching graphql batch of %s queries: %s", len(batch), str(e))
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def __dispatch_single(self, item):
+        query, variables, future = item
+        Metrics().incr("graphql.batch_upstream_calls")
+        try:
+            future.set_result(GraphQLClient().fetch_data(query=query, variables=variables))
+        except Exception as e:
+            future.set_exception(e)
+
+    def __dispatch_array(self, batch):
+        client = GraphQLClient()
+        prepared = [item for item in batch if self.__prepare(client, item) is not None]
+        if not prepared:
+            return
+        Metrics().incr("graphql.batch_upstream_calls")
+        logging.info("Fetching %s batched queries from graphql server", len(prepared))
+        results = client.execute_batch([{"query": query, "variables": variables} for query, variables, _ in prepared])
+        for (_, _, future), result in zip(prepared, results):
+            if result.get("errors"):
+                future.set_exception(Exception(str(result["errors"][0])))
+            else:
+                future.set_result(result.get("data"))
+
+    def __dispatch_aliased(self, batch):
+        client = GraphQLClient()
+        mergeable = []
+        for item in batch:
+            document = self.__prepare(client, item)
+            if document is None:
+                continue
+            operation = self.get_mergeable_operation(document)
+            if operation:
+                mergeable.append((item, operation))
+            else:
+                self.__dispatch_single(item)
+        if len(mergeable) == 1:
+            self.__dispatch_single(mergeable[0][0])
+        elif mergeable:
+            self.__dispatch_merged(client, mergeable)
+
+    def __prepare(self, client, item):
+        """
+        Returns the parsed and validated document of the query, or fails the query alone if it is invalid so that the
+        other queries of the batch are still sent
+        :param client:
+        :param item: (query, variables, future)
+        :return:
+        """
+        try:
+            return client.prepare_document(item[0])
+        except Exception as e:
+            logging.warning("Graphql query left out of the batch: %s", str(e))
+            item[2].set_exception(e)
+            return None
+
+    def __dispatch_merged(self, client, mergeable):
+        """
+        Merges the operations into one aliased query. Variables and top level fields of the n-th operation are
+        prefixed with b<n>_ so that they do not clash and responses can be demultiplexed by the prefix.
+        :param client:
+        :param mergeable: list of ((query, variables, future), operation)
+        :return:
+        """
+        merged = []
+        for index, ((_, item_variables, future), operation) in enumerate(mergeable):
+            try:
+                merged.append((future, self.__merge_operation(operation, "b%s_" % index, item_variables)))
+            except Exception as e:
+                logging.warning("Graphql query left out of the batch: %s", str(e))
+                future.set_exception(e)
+        if not merged:
+            return
+
+        Metrics().incr("graphql.batch_upstream_calls")
+        document = ast.Document(definitions=[ast.OperationDefinition(
+            operation="query", name=ast.Name(value="skurge_batch"),
+            variable_definitions=[definition for _, part in merged for definition in part["variable_definitions"]],
+            directives=[], selection_set=ast.SelectionSet(
+                selections=[selection for _, part in merged for selection in part["selections"]]))])
+        variables = {}
+        for _, part in merged:
+            variables.update(part["variables"])
+        logging.info("Fetching %s merged queries from graphql server", len(merged))
+        result = client.execute_document(document, variables)
+
+        for future, part in merged:
+            errors = [error for error in result.errors or []
+                      if not error.get("path") or str(error["path"][0]).startswith(part["prefix"])]
+            if errors or result.data is None:
+                future.set_exception(Exception(str(errors[0] if errors else result.errors[0])))
+            else:
+                future.set_result({response_key: result.data.get(alias)
+                                   for alias, response_key in part["response_keys"].items()})
+
+    def __merge_operation(self, operation, prefix, item_variables):
+        """
+        Returns the variable definitions, aliased selections and variables of the operation prefixed for the merged
+        query, along with the response key of every alias
+        :param operation:
+        :param prefix:
+        :param item_variables:
+        :return:
+        """
+        operation = copy.deepcopy(operation)
+        self.__prefix_variables(operation, prefix)
+        part = {"prefix": prefix, "variable_definitions": [], "selections": [], "variables": {}, "response_keys": {}}
+        for field in operation.selection_set.selections:
+            response_key = (field.alias or field.name).value
+            field.alias = ast.Name(value=prefix + response_key)
+            part["response_keys"][prefix + response_key] = response_key
+            part["selections"].append(field)
+        for definition in operation.variable_definitions or []:
+            name = definition.variable.name.value
+            if item_variables and name[len(prefix):] in item_variables:
+                part["variables"][name] = item_variables[name[len(prefix):]]
+            part["variable_definitions"].append(definition)
+        return part
+
+    def get_mergeable_operation(self, document):
+        """
+        Returns the query operation of the document if it can be merged into an aliased batch, ie. the document has a
+        single query operation selecting plain fields without fragments
+        :param document:
+        :return:
+        """
+        if len(document.definitions) != 1:
+            return None
+        operation = document.definitions[0]
+        if not isinstance(operation, ast.OperationDefinition) or operation.operation != "query":
+            return None
+        if operation.directives or not all(isinstance(selection, ast.Field)
+                                           for selection in operation.selection_set.selections):
+            return None
+        return operation
+
+    def __prefix_variables(self, node, prefix):
+        """
+        Renames every variable used or defined within the node
+        :param node:
+        :param prefix:
+        :return:
+        """
+        if isinstance(node, ast.Variable):
+            node.name = ast.Name(value=prefix + node.name.value)
+            return
+        if isinstance(node, list):
+            for child in node:
+                self.__prefix_variables(child, prefix)
+            return
+        if isinstance(node, ast.Node):
+            for slot in node.__slots__:
+                if slot != "loc":
+                    self.__prefix_variables(getattr(node, slot, None), prefix)
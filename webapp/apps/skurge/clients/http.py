@@ -1,54 +1,30 @@
 import logging
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
 import requests
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 from django.conf import settings
+from webapp.apps.skurge.common.metrics import Metrics
 
 
 class HttpClient:
     """
     HttpClient implementation for python projects.
+    Requests go through the session of the destination host from the worker's HttpSessionPool, so keep-alive
+    connections are reused across relays.
     """
 
-    def __init__(self, timeout=60):
+    def __init__(self, timeout=None):
         """
-        :param timeout: Timeout in seconds
+        :param timeout: Timeout in seconds, defaults to the timeout of the destination host
 
-        The following params can be specified in settings as HTTP:
-        :backoff: Backoff factor for the exponential backoff
-        :status_forcelist: A list of statuses on which to retry the HTTP(S) calls
+        Pool size, keep-alive, timeouts and retries are specified per host in settings as HTTP_CLIENT
         """
         self.__timeout = timeout
 
-        # Create the session
-        self.__session = requests.Session()
-
-        # Setup the retries object
-        try:
-            max_retries = settings.HTTP.get("max_retries")
-        except:
-            # Default max_retries to 5
-            max_retries = 5
-
-        try:
-            backoff = settings.HTTP.get("backoff")
-        except:
-            # Default backoff_factor of Retry to 0.1
-            backoff = 0.1
-
-        try:
-            status_forcelist = settings.HTTP.get("status_forcelist")
-        except:
-            # Default status_checklist to 501...503
-            status_forcelist = [500, 501, 502, 503]
-
-        retries = Retry(total=max_retries, backoff_factor=backoff,
-                        status_forcelist=status_forcelist)
-
-        # Ensure all http and https called made via the session are retried
-        self.__session.mount('http://', HTTPAdapter(max_retries=retries))
-        self.__session.mount('https://', HTTPAdapter(max_retries=retries))
-
     def set_timeout(self, timeout):
         self.__timeout = timeout
         return self
@@ -63,8 +39,7 @@ class HttpClient:
         """
 
         logging.info("GET URL: %s, HEADERS: %s", kwargs.get("url", ""), kwargs.get("headers", ""))
-        kwargs["timeout"] = self.__timeout
-        r = self.__session.get(**kwargs)
+        r = self.__get_session(kwargs).get(**kwargs)
         r.raise_for_status()
         return r
 
@@ -76,8 +51,7 @@ class HttpClient:
         :rtype: requests.Response
         """
         logging.info("DELETE URL: %s, HEADERS: %s", kwargs.get("url", ""), kwargs.get("headers", ""))
-        kwargs["timeout"] = self.__timeout
-        r = self.__session.delete(**kwargs)
+        r = self.__get_session(kwargs).delete(**kwargs)
         r.raise_for_status()
         return r
 
@@ -91,8 +65,7 @@ class HttpClient:
         :rtype: requests.Response
         """
         logging.info("POST URL: %s, HEADERS: %s", kwargs.get("url", ""), kwargs.get("headers", ""))
-        kwargs["timeout"] = self.__timeout
-        r = self.__session.post(**kwargs)
+        r = self.__get_session(kwargs).post(**kwargs)
         r.raise_for_status()
         return r
 
@@ -105,8 +78,7 @@ class HttpClient:
         :rtype: requests.Response
         """
         logging.info("PUT URL: %s, HEADERS: %s", kwargs.get("url", ""), kwargs.get("headers", ""))
-        kwargs["timeout"] = self.__timeout
-        r = self.__session.put(**kwargs)
+        r = self.__get_session(kwargs).put(**kwargs)
         r.raise_for_status()
         return r
 
@@ -119,7 +91,126 @@ class HttpClient:
         :rtype: requests.Response
         """
         logging.info("PATCH URL: %s, HEADERS: %s", kwargs.get("url", ""), kwargs.get("headers", ""))
-        kwargs["timeout"] = self.__timeout
-        r = self.__session.patch(**kwargs)
+        r = self.__get_session(kwargs).patch(**kwargs)
         r.raise_for_status()
         return r
+
+    def __get_session(self, kwargs):
+        """
+        Gets the pooled session of the destination host and sets the request timeout
+        :param kwargs:
+        :return:
+        """
+        session, policy = HttpSessionPool.get_instance().get_session(kwargs.get("url", ""))
+        kwargs["timeout"] = self.__timeout if self.__timeout else policy.get("TIMEOUT", 60)
+        return session
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter counting the requests sent and the connections opened for them, to measure connection reuse
+    """
+
+    def send(self, request, *args, **kwargs):
+        pool = self.get_connection(request.url, kwargs.get("proxies"))
+        opened = pool.num_connections
+        try:
+            return super().send(request, *args, **kwargs)
+        finally:
+            metrics = Metrics()
+            metrics.incr("http.requests")
+            metrics.incr("http.new_connections", pool.num_connections - opened)
+
+
+class HttpSessionPool:
+    """
+    Per worker pool of http sessions keyed by destination host.
+    Every host gets its own session and connection pool with the pool size, keep-alive, timeout and retry policy from
+    the HTTP_CLIENT settings, overridable per host, so api relays skip the tcp and tls handshake once a connection to
+    the host is open. Sessions do not keep cookies, relays to a host never see cookies set by earlier relays.
+    The pool is tied to the process id, forked uwsgi workers do not share sockets with the master.
+    """
+    # Retry settings of the former HTTP settings, still honoured for deployments setting them
+    LEGACY_SETTINGS = {"max_retries": "MAX_RETRIES", "backoff": "BACKOFF", "status_forcelist": "STATUS_FORCELIST"}
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.config = getattr(settings, "HTTP_CLIENT", {})
+        self.pid = os.getpid()
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Gets the session pool of the current worker process
+        :return:
+        """
+        instance = cls._instance
+        if instance and instance.pid == os.getpid():
+            return instance
+        with cls._instance_lock:
+            if not cls._instance or cls._instance.pid != os.getpid():
+                cls._instance = cls()
+            return cls._instance
+
+    def get_session(self, url):
+        """
+        Gets the session of the url's host along with the host's policy, creating it on first use
+        :param url:
+        :return: (session, policy)
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        entry = self.sessions.get(key)
+        if entry:
+            return entry
+        with self.lock:
+            if key not in self.sessions:
+                policy = self.get_policy(parts.hostname)
+                self.sessions[key] = (self.create_session(policy), policy)
+            return self.sessions[key]
+
+    def get_policy(self, host):
+        """
+        Returns the settings for the host, ie. the defaults updated with the former HTTP settings, if set, and with the
+        overrides of the host
+        :param host:
+        :return:
+        """
+        policy = {key: value for key, value in self.config.items() if key != "HOSTS"}
+        legacy = getattr(settings, "HTTP", None) or {}
+        policy.update({name: legacy[key] for key, name in self.LEGACY_SETTINGS.items() if legacy.get(key) is not None})
+        policy.update(self.config.get("HOSTS", {}).get(host, {}))
+        return policy
+
+    def create_session(self, policy):
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        if not policy.get("KEEP_ALIVE", True):
+            session.headers["Connection"] = "close"
+        retries = Retry(total=policy.get("MAX_RETRIES", 5), backoff_factor=policy.get("BACKOFF", 0.1),
+                        status_forcelist=policy.get("STATUS_FORCELIST", [500, 501, 502, 503]))
+        # Ensure all http and https called made via the session are retried
+        adapter = PooledHTTPAdapter(pool_connections=1, pool_maxsize=policy.get("POOL_MAXSIZE", 10),
+                                    pool_block=policy.get("POOL_BLOCK", False), max_retries=retries)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def stats(self):
+        """
+        Returns the requests sent, the connections opened for them and the ratio of requests on reused connections
+        :return:
+        """
+        metrics = Metrics()
+        requests_sent = metrics.get("http.requests")
+        new_connections = metrics.get("http.new_connections")
+        return {
+            "hosts": len(self.sessions),
+            "requests": requests_sent,
+            "new_connections": new_connections,
+            "reuse_ratio": round(1 - new_connections / requests_sent, 4) if requests_sent else 0
+        }
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from webapp.apps.skurge.common.metrics import Metrics
+
+
+class CompiledCache:
+    """
+    Per worker LRU cache of the objects compiled from json configs, eg. rules or schemas, keyed by the content hash of
+    the config so that equal configs share one compiled object.
+    Configs coming from the event config cache are the same objects on every request, so they are additionally looked
+    up by identity to skip hashing them every time. Configs with a cheap key of their own, eg. strings, are looked up
+    by that key instead.
+    """
+
+    def __init__(self, name, compile_config, max_size, get_key=None):
+        """
+        :param name: Prefix of the hit/miss counters
+        :param compile_config: Function compiling a config
+        :param max_size: Compiled objects kept at most, the least recently used are evicted
+        :param get_key: Function returning the key of a config, the content hash by default
+        """
+        self.name = name
+        self.compile_config = compile_config
+        self.max_size = max_size
+        self.get_key = get_key
+        self.compiled = OrderedDict()
+        self.identities = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, config):
+        """
+        Returns the compiled config, compiling it on first use
+        :param config:
+        :return:
+        """
+        if self.get_key:
+            key = self.get_key(config)
+        else:
+            identity = self.identities.get(id(config))
+            if identity and identity[0] is config:
+                self.__touch(key=identity[1], identity=id(config))
+                Metrics().incr(self.name + ".hits")
+                return identity[2]
+            key = self.get_hash(config)
+
+        compiled = self.compiled.get(key)
+        if compiled is not None:
+            self.__touch(key=key)
+            Metrics().incr(self.name + ".hits")
+        else:
+            with self.lock:
+                compiled = self.compiled.get(key)
+                if compiled is None:
+                    compiled = self.compile_config(config)
+                    self.compiled[key] = compiled
+                    Metrics().incr(self.name + ".misses")
+                self.__evict()
+        if not self.get_key:
+            with self.lock:
+                # Keeping a reference to the config makes sure its id is not reused while the entry is alive
+                self.identities[id(config)] = (config, key, compiled)
+                self.__evict()
+        return compiled
+
+    @staticmethod
+    def get_hash(config):
+        return hashlib.sha1(json.dumps(config, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the number of compiled objects
+        :return:
+        """
+        metrics = Metrics()
+        return {
+            "hits": metrics.get(self.name + ".hits"),
+            "misses": metrics.get(self.name + ".misses"),
+            "size": len(self.compiled)
+        }
+
+    def clear(self):
+        with self.lock:
+            self.compiled.clear()
+            self.identities.clear()
+
+    def __touch(self, key, identity=None):
+        """
+        Marks the entries as recently used, without taking the lock as moving an entry is atomic. The entries may have
+        been evicted in the meantime.
+        """
+        try:
+            if identity is not None:
+                self.identities.move_to_end(identity)
+            self.compiled.move_to_end(key)
+        except KeyError:
+            pass
+
+    def __evict(self):
+        while len(self.compiled) > self.max_size:
+            self.compiled.popitem(last=False)
+        while len(self.identities) > self.max_size:
+            self.identities.popitem(last=False)
@@ -0,0 +1,45 @@
+from collections import ChainMap
+
+
+class EventContext(ChainMap):
+    """
+    Data of a source event as seen by a relayer, layering the data fetched for the relayer over the source data without
+    copying either, so all relayers of the event share the source data however large it is.
+    The layers are never modified, values set on the context are copied on write into a layer of the context's own and
+    keys cannot be removed.
+    """
+
+    def __init__(self, *maps):
+        super().__init__(*maps)
+        self.own_layer = None
+
+    def new_child(self, m=None, **kwargs):
+        """
+        Returns a context with the mapping layered over the layers of this one, which stays as it is
+        :param m:
+        :param kwargs: Keys layered along with the mapping, the mapping itself is not updated with them
+        :return:
+        """
+        if m is None:
+            m = kwargs
+        elif kwargs:
+            m = dict(m, **kwargs)
+        return self.__class__(m, *self.maps)
+
+    def __setitem__(self, key, value):
+        if self.own_layer is None:
+            self.own_layer = {}
+            self.maps.insert(0, self.own_layer)
+        self.own_layer[key] = value
+
+    def __delitem__(self, key):
+        raise TypeError("Keys of an event context can not be removed")
+
+    def popitem(self):
+        raise TypeError("Keys of an event context can not be removed")
+
+    def pop(self, key, *args):
+        raise TypeError("Keys of an event context can not be removed")
+
+    def clear(self):
+        raise TypeError("Keys of an event context can not be removed")
@@ -0,0 +1,270 @@
+import warnings
+from functools import reduce
+
+from json_logic import jsonLogic, is_logic, operations
+
+from webapp.apps.skurge.common.compiled import CompiledCache
+
+
+class JsonLogicCompiler:
+    """
+    Compiles jsonLogic rules into python closures with the semantics of json_logic.jsonLogic.
+    The rule tree is walked once, evaluating a compiled rule only calls the closures of its operations, whereas the
+    interpreter dispatches on the operator and normalizes the arguments of every node on every evaluation.
+    Common operations call the functions of json_logic itself, so their type coercions stay identical. Dot-notated
+    custom operations are left to the interpreter.
+    """
+    LOGICAL_OPERATIONS = ("if", "?:", "and", "or")
+    SCOPED_OPERATIONS = ("filter", "map", "reduce", "all", "none", "some")
+    DATA_OPERATIONS = ("var", "missing", "missing_some")
+    UNSUPPORTED_OPERATIONS = ("count",)
+    # Compile method of every operator, other operations of json_logic are compiled by compile_common and the rest are
+    # left to the interpreter
+    COMPILERS = {
+        **{operator: "compile_logical" for operator in LOGICAL_OPERATIONS},
+        **{operator: "compile_scoped" for operator in SCOPED_OPERATIONS},
+        **{operator: "compile_data" for operator in DATA_OPERATIONS},
+    }
+
+    def compile(self, rule):
+        """
+        Compiles the rule into a function of the data returning what jsonLogic(rule, data) returns
+        :param rule:
+        :return:
+        """
+        if isinstance(rule, (list, tuple)):
+            items = [self.compile(item) for item in rule]
+            return lambda data: [item(data) for item in items]
+        if not is_logic(rule):
+            return lambda data: rule
+
+        operator = str(next(iter(rule.keys())))
+        values = rule[operator]
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        compiler = self.COMPILERS.get(operator, "compile_common" if operator in operations else "compile_interpreted")
+        return getattr(self, compiler)(rule, operator, values)
+
+    def compile_interpreted(self, rule, operator, values):
+        # Dot-notated custom operations and unknown operators, the latter raise on evaluation as in the interpreter
+        return lambda data: jsonLogic(rule, data)
+
+    def compile_logical(self, rule, operator, values):
+        branches = [self.compile(value) for value in values]
+        if operator == "and":
+            def apply_and(data):
+                current = False
+                for branch in branches:
+                    current = branch(data or {})
+                    if not current:
+                        return current
+                return current
+            return apply_and
+        if operator == "or":
+            def apply_or(data):
+                current = False
+                for branch in branches:
+                    current = branch(data or {})
+                    if current:
+                        return current
+                return current
+            return apply_or
+        if operator == "?:" and len(branches) != 3:
+            return lambda data: jsonLogic(rule, data)  # Raises the TypeError of the interpreter
+
+        pairs = [(branches[i], branches[i + 1]) for i in range(0, len(branches) - 1, 2)]
+        otherwise = branches[-1] if len(branches) % 2 else None
+
+        def apply_if(data):
+            data = data or {}
+            for condition, consequent in pairs:
+                if condition(data):
+                    return consequent(data)
+            return otherwise(data) if otherwise else None
+        return apply_if
+
+    def compile_scoped(self, rule, operator, values):
+        if len(values) not in ((2, 3) if operator == "reduce" else (2,)):
+            return lambda data: jsonLogic(rule, data)  # Raises the TypeError of the interpreter
+        scoped_data, scoped_logic = self.compile(values[0]), self.compile(values[1])
+        initial = values[2] if len(values) > 2 else None
+
+        def get_items(data):
+            items = scoped_data(data or {})
+            return items if isinstance(items, (list, tuple)) else None
+
+        if operator == "reduce":
+            def apply_reduce(data):
+                items = get_items(data)
+                if items is None:
+                    return initial
+                return reduce(lambda accumulator, current: scoped_logic({"accumulator": accumulator,
+                                                                         "current": current}), items, initial)
+            return apply_reduce
+        if operator == "map":
+            def apply_map(data):
+                items = get_items(data)
+                return [] if items is None else [scoped_logic(item) for item in items]
+            return apply_map
+        if operator == "all":
+            def apply_all(data):
+                items = get_items(data)
+                if not items:
+                    return False
+                return all(scoped_logic(item) for item in items)
+            return apply_all
+
+        def apply_filter(data):
+            items = get_items(data)
+            return [] if items is None else [item for item in items if scoped_logic(item)]
+        if operator in ("none", "some"):
+            some = operator == "some"
+            return lambda data: (len(apply_filter(data)) > 0) == some
+        return apply_filter
+
+    def compile_data(self, rule, operator, values):
+        args = [self.compile(value) for value in values]
+        if operator == "var":
+            if len(values) in (1, 2) and isinstance(values[0], (str, int, float)) and values[0] != "":
+                return self.compile_var(str(values[0]).split("."), args[1] if len(args) > 1 else None)
+            get_var = operations["var"]
+            return lambda data: get_var(data or {}, *[arg(data or {}) for arg in args])
+        data_operation = operations[operator]
+        return lambda data: data_operation(data or {}, *[arg(data or {}) for arg in args])
+
+    def compile_var(self, keys, default):
+        """
+        Compiles a var of a constant path, the path is split once instead of on every lookup
+        :param keys:
+        :param default: Compiled default value
+        :return:
+        """
+        def get_var(data):
+            data = data or {}
+            default_value = default(data) if default else None
+            value = data
+            try:
+                for key in keys:
+                    try:
+                        value = value[key]
+                    except TypeError:
+                        value = value[int(key)]
+            except (KeyError, TypeError, ValueError):
+                return default_value
+            return value
+        return get_var
+
+    def compile_common(self, rule, operator, values):
+        operation = operations[operator]
+        args = [self.compile(value) for value in values]
+        if operator in self.UNSUPPORTED_OPERATIONS:
+            def apply_unsupported(data):
+                data = data or {}
+                values = [arg(data) for arg in args]
+                warnings.warn(("%r operation is not officially supported by JsonLogic and " +
+                               "is not guarantied to work in other JsonLogic ports") % operator,
+                              PendingDeprecationWarning)
+                return operation(*values)
+            return apply_unsupported
+        if len(args) == 1:
+            arg = args[0]
+            return lambda data: operation(arg(data or {}))
+        if len(args) == 2:
+            first, second = args
+            return lambda data: operation(first(data or {}), second(data or {}))
+        return lambda data: operation(*[arg(data or {}) for arg in args])
+
+
+class JsonLogicAnalyzer:
+    """
+    Static analysis of the data a jsonLogic rule reads
+    """
+
+    def get_data_keys(self, rule):
+        """
+        Returns the top level keys of the data read by the rule, or None if they cannot be known before evaluating it,
+        eg. for vars of computed paths, vars of the whole data, missing operations and dot-notated custom operations
+        :param rule:
+        :return:
+        """
+        if isinstance(rule, (list, tuple)):
+            return self.get_all_data_keys(rule)
+        if not is_logic(rule):
+            return set()
+
+        operator = str(next(iter(rule.keys())))
+        values = rule[operator]
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        if operator == "var":
+            return self.get_var_keys(values)
+        if operator in JsonLogicCompiler.SCOPED_OPERATIONS:
+            # The logic of scoped operations reads the items of the scoped data, not the data itself
+            return self.get_data_keys(values[0]) if values else set()
+        if operator in JsonLogicCompiler.LOGICAL_OPERATIONS or \
+                (operator in operations and operator not in JsonLogicCompiler.DATA_OPERATIONS):
+            return self.get_all_data_keys(values)
+        return None
+
+    def get_all_data_keys(self, rules):
+        """
+        Returns the keys read by all the rules, or None if the keys of any of them cannot be known
+        :param rules:
+        :return:
+        """
+        keys = set()
+        for rule in rules:
+            rule_keys = self.get_data_keys(rule)
+            if rule_keys is None:
+                return None
+            keys |= rule_keys
+        return keys
+
+    def get_var_keys(self, values):
+        """
+        Returns the first key of the var's path along with the keys read by its default, or None for computed paths
+        and vars of the whole data
+        :param values:
+        :return:
+        """
+        if not values or not isinstance(values[0], (str, int, float)) or values[0] == "":
+            return None
+        default_keys = self.get_all_data_keys(values[1:])
+        return None if default_keys is None else default_keys | {str(values[0]).split(".", 1)[0]}
+
+
+class JsonLogicRegistry:
+    """
+    Per worker registry of compiled jsonLogic rules keyed by the content hash of the rule.
+    """
+    MAX_SIZE = 4096
+
+    _cache = CompiledCache(name="json_logic", compile_config=lambda rule: JsonLogicCompiler().compile(rule),
+                           max_size=MAX_SIZE)
+
+    def get_rule(self, rule):
+        """
+        Returns the compiled rule, compiling it on first use
+        :param rule:
+        :return:
+        """
+        return self._cache.get(rule)
+
+    def apply(self, rule, data):
+        """
+        Evaluates the rule against the data, as jsonLogic(rule, data) does
+        :param rule:
+        :param data:
+        :return:
+        """
+        return self.get_rule(rule)(data)
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the number of compiled rules
+        :return:
+        """
+        return self._cache.stats()
+
+    def clear(self):
+        self._cache.clear()
@@ -0,0 +1,43 @@
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    """
+    Per worker counters for the relay hot path, eg. cache hits and misses or saved upstream calls.
+    Counters are plain in memory integers, they are reset on worker restart.
+    """
+    _counters = defaultdict(int)
+    _lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        """
+        Increments the counter by the given value
+        :param name:
+        :param value:
+        :return:
+        """
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name):
+        return self._counters.get(name, 0)
+
+    def snapshot(self, prefix=""):
+        """
+        Returns a copy of all counters starting with the given prefix
+        :param prefix:
+        :return:
+        """
+        with self._lock:
+            return {name: value for name, value in self._counters.items() if name.startswith(prefix)}
+
+    def reset(self, prefix=""):
+        """
+        Resets all counters starting with the given prefix
+        :param prefix:
+        :return:
+        """
+        with self._lock:
+            for name in [name for name in self._counters if name.startswith(prefix)]:
+                del self._counters[name]
@@ -0,0 +1,172 @@
+import copy
+from collections.abc import Mapping, Sequence
+from operator import attrgetter
+
+from pydash.helpers import base_set
+from pydash.utilities import PathToken, to_path_tokens
+
+from webapp.apps.skurge.common.compiled import CompiledCache
+
+
+class PathGetter:
+    """
+    Compiled pydash.get of a path. The path is parsed once into its keys, along with the index and attribute getters
+    pydash falls back to for every key, so a lookup only walks the keys.
+    """
+    _NOT_FOUND = object()
+
+    def __init__(self, path):
+        tokens = to_path_tokens(path)
+        if not isinstance(tokens, list):
+            tokens = [tokens]
+        self.steps = [self.get_step(token.key if isinstance(token, PathToken) else token) for token in tokens]
+
+    @classmethod
+    def get_step(cls, key):
+        """
+        Returns the (key, index, attribute getter) tried in turn by pydash to get the key from an object
+        :param key:
+        :return:
+        """
+        try:
+            index = int(key)
+        except Exception:
+            index = cls._NOT_FOUND
+        try:
+            getter = attrgetter(key)
+        except Exception:
+            getter = None
+        return key, index, getter
+
+    def get(self, obj, default=None):
+        """
+        Returns the value at the path of the object, or the default if the path does not exist, as pydash.get does
+        :param obj:
+        :param default:
+        :return:
+        """
+        for key, index, getter in self.steps:
+            try:
+                obj = obj[key]
+                continue
+            except Exception:
+                pass
+            if index is not self._NOT_FOUND:
+                try:
+                    obj = obj[index]
+                    continue
+                except Exception:
+                    pass
+            # Attributes are only looked up on objects other than dicts and lists, and on namedtuples
+            if getter and (not isinstance(obj, (Mapping, Sequence)) or
+                           (isinstance(obj, tuple) and hasattr(obj, "_fields"))):
+                try:
+                    obj = getter(obj)
+                    continue
+                except Exception:
+                    pass
+            return default
+        return obj
+
+
+class PathSetter:
+    """
+    Compiled pydash.set_ of a path. The path is parsed once into the keys to walk, each along with the type of the
+    container created for it when missing, ie. a list before an index like `[0]` and a dict otherwise.
+    """
+
+    def __init__(self, path):
+        tokens = to_path_tokens(path)
+        if not isinstance(tokens, list):
+            tokens = [tokens]
+        keys = [token.key if isinstance(token, PathToken) else token for token in tokens]
+        # None stands for the type of the object being set, as in pydash
+        factories = [token.default_factory if isinstance(token, PathToken) else None for token in tokens]
+        self.steps = list(zip(keys[:-1], factories[1:]))
+        self.last_key = keys[-1] if keys else None
+
+    def set(self, obj, value):
+        """
+        Sets the value at the path of the object in place, creating the missing containers, as pydash.set_ does
+        :param obj:
+        :param value:
+        :return:
+        """
+        default_type = dict if isinstance(obj, dict) else list
+        target = obj
+        for key, factory in self.steps:
+            if isinstance(target, dict):
+                if key not in target:
+                    target[key] = (factory or default_type)()
+            elif isinstance(target, list):
+                base_set(target, key, (factory or default_type)(), allow_override=False)
+            try:
+                target = target[key]
+            except TypeError as exc:
+                try:
+                    target = target[int(key)]
+                except Exception as inner_exc:
+                    raise TypeError("Unable to update object at index {!r}. {}".format(key, exc)) from inner_exc
+        base_set(target, self.last_key, value)
+        return obj
+
+
+class LocatorPlan:
+    """
+    Compiled locator mapping, ie. the relay_data_locator fields of a data processor or the context_data_locator of a
+    relay processor, holding the getter and setter of each of its paths
+    """
+
+    def __init__(self, locator):
+        self.fields = [(field, path, PathGetter(path), PathSetter(field)) for field, path in locator.items()]
+
+    def extract(self, data, target):
+        """
+        Sets every key path of the mapping in the target to the value at its value path in the data, or to the value
+        path itself when the data does not have it
+        Nested values are copied as the data may be shared with the other relayers of the event
+        :param data:
+        :param target:
+        :return:
+        """
+        for _, path, getter, setter in self.fields:
+            value = getter.get(data, default=path)
+            if isinstance(value, (dict, list)):
+                value = copy.deepcopy(value)
+            setter.set(target, value)
+        return target
+
+    def get_values(self, data):
+        """
+        Returns the dict of every field of the mapping to the value at its path in the data
+        :param data:
+        :return:
+        """
+        return {field: getter.get(data) for field, _, getter, _ in self.fields}
+
+
+class LocatorPlanRegistry:
+    """
+    Per worker registry of compiled locator plans keyed by the content hash of the locator.
+    """
+    MAX_SIZE = 4096
+
+    _cache = CompiledCache(name="locator_plan", compile_config=LocatorPlan, max_size=MAX_SIZE)
+
+    def get_plan(self, locator):
+        """
+        Returns the compiled plan of the locator, compiling it on first use
+        :param locator:
+        :return:
+        """
+        return self._cache.get(locator)
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the number of compiled plans
+        :return:
+        """
+        return self._cache.stats()
+
+    def clear(self):
+        self._cache.clear()
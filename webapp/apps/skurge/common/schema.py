@@ -0,0 +1,41 @@
+from jsonschema import Draft7Validator
+
+from webapp.apps.skurge.common.compiled import CompiledCache
+
+
+class SchemaValidatorRegistry:
+    """
+    Per worker registry of compiled json schema validators keyed by the content hash of the schema.
+    Each validator is built once and reused across requests.
+    """
+    MAX_SIZE = 1024
+
+    _cache = CompiledCache(name="schema_validator", compile_config=Draft7Validator, max_size=MAX_SIZE)
+
+    def get_validator(self, schema):
+        """
+        Returns the compiled validator for the schema, building it on first use
+        :param schema:
+        :return:
+        """
+        return self._cache.get(schema)
+
+    def get_errors(self, schema, data):
+        """
+        Validates the data against the schema and returns the list of error messages
+        :param schema:
+        :param data:
+        :return:
+        """
+        validator = self.get_validator(schema)
+        return [error.message for error in validator.iter_errors(data) if hasattr(error, "message")]
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the number of compiled validators
+        :return:
+        """
+        return self._cache.stats()
+
+    def clear(self):
+        self._cache.clear()
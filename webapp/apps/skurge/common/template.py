@@ -0,0 +1,167 @@
+import _string
+import copy
+from string import Formatter
+
+from webapp.apps.skurge.common.compiled import CompiledCache
+from webapp.apps.skurge.common.path import PathSetter
+
+
+class Template:
+    """
+    Compiled str.format template formatted with keyword arguments only, ie. template.format(**data).
+    The template is parsed once into its literal text and the fields it references, so formatting only looks up the
+    referenced keys of the data instead of expanding the whole data as keyword arguments. Templates without fields are
+    constants and are not formatted at all.
+    Templates str.format could not parse or having nested format specs are formatted by str.format, raising the same
+    errors as before.
+    """
+    CONVERSIONS = {"r": repr, "s": str, "a": ascii}
+
+    def __init__(self, template):
+        self.template = template
+        self.parts = None
+        self.constant = None
+        try:
+            parts = [(literal, self.compile_field(field_name, spec, conversion) if field_name is not None else None)
+                     for literal, field_name, spec, conversion in Formatter().parse(template)]
+        except (ValueError, _UnsupportedField):
+            return
+        if all(field is None for _, field in parts):
+            self.constant = "".join(literal for literal, _ in parts)
+        else:
+            self.parts = parts
+
+    @property
+    def is_constant(self):
+        return self.constant is not None
+
+    def get_keys(self):
+        """
+        Returns the keys of the data referenced by the template, or None if the template is not compiled
+        :return:
+        """
+        if self.constant is not None:
+            return set()
+        if self.parts is None:
+            return None
+        return {str(field[0]) for _, field in self.parts if field is not None}
+
+    def compile_field(self, field_name, spec, conversion):
+        """
+        Returns the (first key, [(is attribute, key)...], format spec, conversion function) of a field
+        :param field_name:
+        :param spec:
+        :param conversion:
+        :return:
+        """
+        if "{" in spec or (conversion and conversion not in self.CONVERSIONS):
+            raise _UnsupportedField()
+        first, rest = _string.formatter_field_name_split(field_name)
+        return first, list(rest), spec, self.CONVERSIONS.get(conversion)
+
+    def render(self, data):
+        """
+        Formats the template with the data, as template.format(**data) does
+        :param data:
+        :return:
+        """
+        if self.constant is not None:
+            return self.constant
+        if self.parts is None:
+            return self.template.format(**data)
+        rendered = []
+        for literal, field in self.parts:
+            rendered.append(literal)
+            if field is None:
+                continue
+            first, rest, spec, conversion = field
+            if isinstance(first, int) or first == "":
+                # Positional fields, no positional arguments are passed
+                raise IndexError("Replacement index %s out of range for positional args tuple" % (first or 0))
+            value = data[first]
+            for is_attribute, key in rest:
+                value = getattr(value, key) if is_attribute else value[key]
+            if conversion:
+                value = conversion(value)
+            rendered.append(format(value, spec))
+        return "".join(rendered)
+
+
+class _UnsupportedField(Exception):
+    pass
+
+
+class DefaultResponsePlan:
+    """
+    Compiled default_response of a data processor, holding the setter of each key path along with the compiled
+    template of its string value
+    """
+
+    def __init__(self, default_response):
+        registry = TemplateRegistry()
+        self.fields = [(PathSetter(key_path), registry.get_template(value) if isinstance(value, str) else None, value)
+                       for key_path, value in default_response.items()]
+
+    def apply(self, data, target):
+        """
+        Sets the default values in the target, formatting the string values with the data
+        Nested values are copied as the default response is shared with every event through the event config cache
+        :param data:
+        :param target:
+        :return:
+        """
+        for setter, template, value in self.fields:
+            if template:
+                value = template.render(data)
+            elif isinstance(value, (dict, list)):
+                value = copy.deepcopy(value)
+            setter.set(target, value)
+        return target
+
+
+class TemplateRegistry:
+    """
+    Per worker registry of compiled templates keyed by the template string, and of the compiled default responses of
+    the data processors keyed by their content hash.
+    """
+    MAX_SIZE = 4096
+
+    _templates = CompiledCache(name="template", compile_config=Template, max_size=MAX_SIZE,
+                               get_key=lambda template: template)
+    _plans = CompiledCache(name="default_response_plan", compile_config=DefaultResponsePlan, max_size=MAX_SIZE)
+
+    def get_template(self, template):
+        """
+        Returns the compiled template, compiling it on first use
+        :param template:
+        :return:
+        """
+        return self._templates.get(template)
+
+    def format(self, template, data):
+        """
+        Formats the template with the data, as template.format(**data) does
+        :param template:
+        :param data:
+        :return:
+        """
+        return self.get_template(template).render(data)
+
+    def get_default_response_plan(self, default_response):
+        """
+        Returns the compiled plan of the default response, compiling it on first use
+        :param default_response:
+        :return:
+        """
+        return self._plans.get(default_response)
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and the number of compiled templates
+        :return:
+        """
+        return self._templates.stats()
+
+    def clear(self):
+        self._templates.clear()
+        self._plans.clear()
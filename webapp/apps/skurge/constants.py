@@ -8,3 +8,17 @@ class RelayType(Enum):
     @staticmethod
     def list():
         return list(map(lambda rt: rt.value, RelayType))
+
+
+class QueuedEventStatus(Enum):
+    PENDING = "PENDING"
+    PROCESSING = "PROCESSING"
+    SUCCESS = "SUCCESS"
+    FAILED = "FAILED"
+
+
+class OutboxStatus(Enum):
+    PENDING = "PENDING"
+    PROCESSING = "PROCESSING"
+    DELIVERED = "DELIVERED"
+    FAILED = "FAILED"
@@ -0,0 +1,32 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from webapp.apps.skurge.benchmarks import graphql_batching, json_logic
+
+
+class Command(BaseCommand):
+    help = "Runs a micro benchmark of the relay hot path and prints the results as json"
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest="benchmark")
+        subparsers.required = True
+
+        batching = subparsers.add_parser("graphql-batching", help="Requests per upstream call with micro-batching")
+        batching.add_argument("--queries", type=int, default=1000)
+        batching.add_argument("--concurrency", type=int, default=50)
+        batching.add_argument("--latency-ms", type=int, default=10)
+        batching.add_argument("--window-ms", type=int, default=5)
+        batching.add_argument("--mode", choices=["ALIAS", "ARRAY"], default="ALIAS")
+
+        logic = subparsers.add_parser("json-logic", help="Compiled jsonLogic rules against the interpreter")
+        logic.add_argument("--iterations", type=int, default=100000)
+
+    def handle(self, *args, **options):
+        if options["benchmark"] == "graphql-batching":
+            result = graphql_batching.run(queries=options["queries"], concurrency=options["concurrency"],
+                                          latency_ms=options["latency_ms"], window_ms=options["window_ms"],
+                                          mode=options["mode"])
+        elif options["benchmark"] == "json-logic":
+            result = json_logic.run(iterations=options["iterations"])
+        else:
+            raise CommandError("Unknown benchmark %s" % options["benchmark"])
+        self.stdout.write(json.dumps(result, indent=2))
@@ -0,0 +1,20 @@
+import signal
+from django.core.management.base import BaseCommand
+from webapp.apps.skurge.processors.event_consumer import EventConsumer
+
+
+class Command(BaseCommand):
+    help = "Consumes source events from the rabbitmq queues configured in EVENT_CONSUMER and relays them"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queue", action="append", help="Consumes only the given configured queue, repeatable")
+        parser.add_argument("--prefetch-count", type=int, help="Messages in flight at a time")
+        parser.add_argument("--concurrency", type=int, help="Threads processing messages")
+
+    def handle(self, *args, **options):
+        consumer = EventConsumer(queues=options["queue"], prefetch_count=options["prefetch_count"],
+                                 concurrency=options["concurrency"])
+        # Finishes the messages in flight on shutdown
+        signal.signal(signal.SIGTERM, lambda signum, frame: consumer.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: consumer.stop())
+        consumer.run()
@@ -0,0 +1,26 @@
+import signal
+from django.core.management.base import BaseCommand
+from webapp.apps.skurge.processors.event_queue import EventQueueWorker
+
+
+class Command(BaseCommand):
+    help = "Processes the events queued in async mode, run as many workers as needed across nodes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Events claimed at a time")
+        parser.add_argument("--visibility-timeout", type=int, help="Seconds before events of a crashed worker are "
+                                                                   "claimed again")
+        parser.add_argument("--poll-interval", type=float, help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Processes a single batch and exits")
+
+    def handle(self, *args, **options):
+        worker = EventQueueWorker(batch_size=options["batch_size"], visibility_timeout=options["visibility_timeout"],
+                                  poll_interval=options["poll_interval"])
+        if options["once"]:
+            processed = worker.run_once()
+            self.stdout.write("Processed %s queued events" % processed)
+            return
+        # Finishes the event in hand on shutdown and hands the rest of the batch back to the queue
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+        worker.run()
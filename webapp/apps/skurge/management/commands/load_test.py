@@ -0,0 +1,36 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from webapp.apps.skurge.benchmarks import load_test
+
+
+class Command(BaseCommand):
+    help = "Drives the relay endpoint at a target rate, against stub graphql, api and rabbitmq servers by default, " \
+           "and prints the throughput, latency percentiles and errors as json"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--event", help="Registered source event to post, required along with --url, a sample "
+                                            "event is registered in-process if empty")
+        parser.add_argument("--payload", type=json.loads, help="Source data to post as json")
+        parser.add_argument("--url", help="Base url of a running skurge to drive instead of an in-process one")
+        parser.add_argument("--rate", type=float, default=50, help="Requests per second")
+        parser.add_argument("--duration", type=float, default=10, help="Seconds")
+        parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight at most")
+        parser.add_argument("--timeout", type=float, default=30, help="Seconds to wait for a response")
+        parser.add_argument("--graphql-latency-ms", type=int, default=20)
+        parser.add_argument("--graphql-error-rate", type=float, default=0)
+        parser.add_argument("--api-latency-ms", type=int, default=20)
+        parser.add_argument("--api-error-rate", type=float, default=0)
+        parser.add_argument("--broker-latency-ms", type=int, default=1)
+        parser.add_argument("--broker-error-rate", type=float, default=0)
+        parser.add_argument("--seed", type=int, help="Seed of the error injection")
+
+    def handle(self, *args, **options):
+        if options["url"] and not options["event"]:
+            raise CommandError("--event is required along with --url, the sample event is only registered in-process")
+        faults = {name: {"latency_ms": options["%s_latency_ms" % name], "error_rate": options["%s_error_rate" % name]}
+                  for name in ("graphql", "api", "broker")}
+        result = load_test.run(event=options["event"], payload=options["payload"], url=options["url"],
+                               rate=options["rate"], duration=options["duration"],
+                               concurrency=options["concurrency"], timeout=options["timeout"], faults=faults,
+                               seed=options["seed"])
+        self.stdout.write(json.dumps(result, indent=2))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from webapp.apps.skurge.services.relay_log_partition import RelayLogPartitionService
+
+
+class Command(BaseCommand):
+    help = "Creates the relay_logs partitions of the months ahead and prunes the partitions past retention, " \
+           "run it periodically, eg. daily"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months-ahead", type=int, help="Months to create partitions for beyond the current one")
+        parser.add_argument("--retention-months", type=int, help="Full months of logs kept before the current one")
+        parser.add_argument("--archive", action="store_true", default=None,
+                            help="Detaches expired partitions as relay_logs_archive_* tables instead of dropping them")
+        parser.add_argument("--dry-run", action="store_true", help="Lists the expired partitions without pruning")
+
+    def handle(self, *args, **options):
+        service = RelayLogPartitionService(months_ahead=options["months_ahead"],
+                                           retention_months=options["retention_months"], archive=options["archive"])
+        if options["dry_run"]:
+            self.stdout.write("Expired relay log partitions: %s" % (", ".join(service.get_expired_partitions()) or "-"))
+            return
+        created = service.create_partitions()
+        pruned = service.prune_partitions()
+        self.stdout.write("Created %s relay log partitions, %s %s" % (
+            len(created), "archived" if service.archive else "dropped", len(pruned)))
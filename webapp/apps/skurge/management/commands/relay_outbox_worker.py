@@ -0,0 +1,23 @@
+import signal
+from django.core.management.base import BaseCommand
+from webapp.apps.skurge.processors.outbox import RelayOutboxWorker
+
+
+class Command(BaseCommand):
+    help = "Delivers the relays queued in the relay outbox, run as many workers as needed across nodes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Entries claimed at a time")
+        parser.add_argument("--poll-interval", type=float, help="Seconds to sleep when nothing is due")
+        parser.add_argument("--once", action="store_true", help="Delivers a single batch and exits")
+
+    def handle(self, *args, **options):
+        worker = RelayOutboxWorker(batch_size=options["batch_size"], poll_interval=options["poll_interval"])
+        if options["once"]:
+            claimed = worker.run_once()
+            self.stdout.write("Processed %s relay outbox entries" % claimed)
+            return
+        # Finishes the batch in hand on shutdown
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+        worker.run()
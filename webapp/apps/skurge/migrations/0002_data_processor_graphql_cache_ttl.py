@@ -0,0 +1,23 @@
+# Generated by Django 2.2.6 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skurge', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataprocessor',
+            name='graphql_cache_ttl',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='historicaldataprocessor',
+            name='graphql_cache_ttl',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
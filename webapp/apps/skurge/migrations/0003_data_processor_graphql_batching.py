@@ -0,0 +1,23 @@
+# Generated by Django 2.2.6 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skurge', '0002_data_processor_graphql_cache_ttl'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dataprocessor',
+            name='graphql_batching',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='historicaldataprocessor',
+            name='graphql_batching',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.6 on 2026-10-18 10:59
+
+import uuid
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skurge', '0003_data_processor_graphql_batching'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('event_id', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('source_event_name', models.CharField(max_length=100)),
+                ('source_data', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('status', models.CharField(default='PENDING', max_length=20)),
+                ('reason', models.CharField(max_length=256, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'event_queue',
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.6 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skurge', '0004_queued_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedevent',
+            name='locked_by',
+            field=models.CharField(max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name='queuedevent',
+            name='locked_until',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='queuedevent',
+            index=models.Index(condition=models.Q(status__in=['PENDING', 'PROCESSING']), fields=['id'], name='event_queue_claimable_idx'),
+        ),
+    ]
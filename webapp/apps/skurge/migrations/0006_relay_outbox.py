@@ -0,0 +1,44 @@
+# Generated by Django 2.2.6 on 2026-10-18 11:01
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skurge', '0005_queued_event_lock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelayOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('relay_log_id', models.IntegerField(null=True)),
+                ('source_event_name', models.CharField(max_length=100)),
+                ('relay_type', models.CharField(max_length=20)),
+                ('destination', models.CharField(max_length=512)),
+                ('http_method', models.CharField(max_length=10, null=True)),
+                ('headers', django.contrib.postgres.fields.jsonb.JSONField(null=True)),
+                ('relay_data', django.contrib.postgres.fields.jsonb.JSONField(null=True)),
+                ('status', models.CharField(default='PENDING', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(null=True)),
+                ('last_error', models.CharField(max_length=256, null=True)),
+                ('delivered_at', models.DateTimeField(null=True)),
+            ],
+            options={
+                'db_table': 'relay_outbox',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='relayoutbox',
+            index=models.Index(condition=models.Q(status__in=['PENDING', 'PROCESSING']), fields=['next_attempt_at'], name='relay_outbox_claimable_idx'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+from django.db import migrations, models
+
+from webapp.apps.skurge.services.relay_log_partition import RelayLogPartitionService
+
+
+# relay_logs becomes a table partitioned by month of created_at. The existing table is attached as the partition of
+# everything up to the end of the current month, so no rows are copied, and is dropped as a whole once all of it is
+# past retention. Partitions of the months ahead are created by RelayLogPartitionService as per RELAY_LOG_PARTITIONS,
+# once by the migration and then by `manage.py relay_log_partitions`, logs not covered by any partition land in
+# relay_logs_default.
+# Postgres needs the partition key in the primary key, ids stay unique as they are still drawn from relay_logs_id_seq.
+#
+# The migration is not atomic so that the full passes over the existing table run without blocking relays: the unique
+# index the partition needs and the indexes of the partitioned table are built concurrently, and the bound of the
+# partition is validated under a lock that lets logs be written. The swap itself then only attaches the table, reusing
+# the indexes and skipping the scan for rows outside the bound, within a short transaction.
+
+CREATE_LEGACY_INDEXES = [
+    ("CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS relay_logs_legacy_id_created ON relay_logs (id, created_at)",
+     "DROP INDEX CONCURRENTLY IF EXISTS relay_logs_legacy_id_created"),
+    ("CREATE INDEX CONCURRENTLY IF NOT EXISTS relay_logs_legacy_event_created "
+     "ON relay_logs (source_event_name, created_at)",
+     "DROP INDEX CONCURRENTLY IF EXISTS relay_logs_legacy_event_created"),
+    ("CREATE INDEX CONCURRENTLY IF NOT EXISTS relay_logs_legacy_status_created ON relay_logs (status, created_at)",
+     "DROP INDEX CONCURRENTLY IF EXISTS relay_logs_legacy_status_created"),
+]
+
+# Logs are created at the current time, the existing table holds the logs up to the end of the current month
+ADD_LEGACY_BOUND = """
+DO $$
+BEGIN
+    EXECUTE format('ALTER TABLE relay_logs ADD CONSTRAINT relay_logs_legacy_bound CHECK (created_at < %L) NOT VALID',
+                   date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' + interval '1 month');
+END $$;
+"""
+
+PARTITION_RELAY_LOGS = """
+BEGIN;
+ALTER TABLE relay_logs RENAME TO relay_logs_legacy;
+ALTER TABLE relay_logs_legacy DROP CONSTRAINT relay_logs_pkey;
+ALTER TABLE relay_logs_legacy ADD CONSTRAINT relay_logs_legacy_pkey PRIMARY KEY USING INDEX relay_logs_legacy_id_created;
+CREATE TABLE relay_logs (LIKE relay_logs_legacy INCLUDING DEFAULTS) PARTITION BY RANGE (created_at);
+ALTER TABLE relay_logs ADD CONSTRAINT relay_logs_pkey PRIMARY KEY (id, created_at);
+ALTER SEQUENCE relay_logs_id_seq OWNED BY relay_logs.id;
+DO $$
+DECLARE
+    upper_bound timestamptz;
+BEGIN
+    SELECT (regexp_match(pg_get_constraintdef(oid), '''([^'']+)'''))[1]::timestamptz INTO upper_bound
+    FROM pg_constraint WHERE conname = 'relay_logs_legacy_bound' AND conrelid = 'relay_logs_legacy'::regclass;
+    -- The validated bound lets the attach skip the scan, and the partition's key is attached as it matches the parent's
+    EXECUTE format('ALTER TABLE relay_logs ATTACH PARTITION relay_logs_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+                   upper_bound);
+    ALTER TABLE relay_logs_legacy DROP CONSTRAINT relay_logs_legacy_bound;
+END $$;
+CREATE TABLE relay_logs_default PARTITION OF relay_logs DEFAULT;
+COMMIT;
+"""
+
+# Copies the logs of the attached partitions back into a plain table, detached archives are left as they are
+UNPARTITION_RELAY_LOGS = """
+BEGIN;
+CREATE TABLE relay_logs_unpartitioned (LIKE relay_logs INCLUDING DEFAULTS);
+INSERT INTO relay_logs_unpartitioned SELECT * FROM relay_logs;
+ALTER SEQUENCE relay_logs_id_seq OWNED BY relay_logs_unpartitioned.id;
+DROP TABLE relay_logs;
+ALTER TABLE relay_logs_unpartitioned RENAME TO relay_logs;
+ALTER TABLE relay_logs ADD CONSTRAINT relay_logs_pkey PRIMARY KEY (id);
+COMMIT;
+"""
+
+
+def create_partitions_ahead(apps, schema_editor):
+    # The current month is held by the attached table, the months ahead are those kept by relay_log_partitions
+    RelayLogPartitionService().create_partitions()
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('skurge', '0006_relay_outbox'),
+    ]
+
+    operations = [
+        *[migrations.RunSQL(sql, reverse_sql) for sql, reverse_sql in CREATE_LEGACY_INDEXES],
+        migrations.RunSQL(ADD_LEGACY_BOUND, "ALTER TABLE relay_logs DROP CONSTRAINT IF EXISTS relay_logs_legacy_bound"),
+        migrations.RunSQL("ALTER TABLE relay_logs VALIDATE CONSTRAINT relay_logs_legacy_bound", migrations.RunSQL.noop),
+        migrations.RunSQL(PARTITION_RELAY_LOGS, UNPARTITION_RELAY_LOGS),
+        # Attaches the indexes built concurrently on the existing table, only the default partition is indexed
+        migrations.AddIndex(
+            model_name='relayeventlogs',
+            index=models.Index(fields=['source_event_name', 'created_at'], name='relay_logs_event_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='relayeventlogs',
+            index=models.Index(fields=['status', 'created_at'], name='relay_logs_status_created_idx'),
+        ),
+        # Partitions created from now on get the indexes of the partitioned table
+        migrations.RunPython(create_partitions_ahead, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+# Version of the event configs cached by the workers, see services/event_config.py. A sequence is shared by every
+# worker and node, and is bumped without taking row locks.
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skurge', '0007_relay_logs_partitioning'),
+    ]
+
+    operations = [
+        migrations.RunSQL("CREATE SEQUENCE skurge_event_config_version",
+                          "DROP SEQUENCE skurge_event_config_version"),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 11:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('skurge', '0008_event_config_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='relayoutbox',
+            name='locked_by',
+            field=models.CharField(max_length=128, null=True),
+        ),
+    ]
@@ -1,5 +1,8 @@
+import uuid
+
 from simple_history.models import HistoricalRecords
 from django.db import models
+from django.utils import timezone
 from django.contrib.postgres.fields import JSONField
 
 
@@ -33,7 +36,11 @@ class RelayEventLogs(BaseModel):
     reason = models.CharField(max_length=256, null=True)
 
     class Meta:
-        db_table = "relay_logs"
+        db_table = "relay_logs"  # Partitioned by month of created_at, see `manage.py relay_log_partitions`
+        indexes = [
+            models.Index(fields=["source_event_name", "created_at"], name="relay_logs_event_created_idx"),
+            models.Index(fields=["status", "created_at"], name="relay_logs_status_created_idx"),
+        ]
 
 
 class SourceEvent(BaseModel):
@@ -55,11 +62,15 @@ class DataProcessor(BaseModel):
     """
     data_processor table to create the corresponding relay data to be sent to all the relayers
     uses graphql query to fetch data from external clients which this sent to all the destinations
+    graphql_cache_ttl in seconds enables caching of the graphql response, responses are not cached if it is null
+    graphql_batching opts the graphql query into micro-batching with the queries of concurrent events
     """
     graphql_query = models.TextField()
     relay_data_locator = JSONField()
     default_response = JSONField(null=True)
     relay_json_schema = JSONField()
+    graphql_cache_ttl = models.PositiveIntegerField(null=True)
+    graphql_batching = models.BooleanField(default=False)
 
     data_processor_history = HistoricalRecords(excluded_fields=['is_active'])
 
@@ -85,3 +96,57 @@ class RelayProcessor(BaseModel):
 
     class Meta:
         db_table = "relay_processors"
+
+
+class QueuedEvent(BaseModel):
+    """
+    Events accepted by the relay endpoint in async mode, processed later by the event queue workers
+    The event id is handed out to the producer to look up the status of the event
+    A worker claiming the event sets locked_by and locked_until, the event is claimed again by another worker if it is
+    still processing once locked_until has passed, ie. the claiming worker crashed
+    """
+    event_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    source_event_name = models.CharField(max_length=100, null=False)
+    source_data = JSONField()
+    status = models.CharField(max_length=20, null=False, default="PENDING")
+    reason = models.CharField(max_length=256, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    locked_by = models.CharField(max_length=128, null=True)
+    locked_until = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = "event_queue"
+        indexes = [
+            # Keeps claiming cheap while processed events pile up
+            models.Index(fields=["id"], name="event_queue_claimable_idx",
+                         condition=models.Q(status__in=["PENDING", "PROCESSING"])),
+        ]
+
+
+class RelayOutbox(BaseModel):
+    """
+    Relays waiting to be delivered by the relay outbox workers
+    Entries are written along with their relay log in the same transaction and delivered off the request path, with
+    retries and exponential backoff while the destination is unavailable
+    """
+    relay_log_id = models.IntegerField(null=True)
+    source_event_name = models.CharField(max_length=100, null=False)
+    relay_type = models.CharField(max_length=20, null=False)
+    destination = models.CharField(max_length=512, null=False)
+    http_method = models.CharField(max_length=10, null=True)
+    headers = JSONField(null=True)
+    relay_data = JSONField(null=True)
+    status = models.CharField(max_length=20, null=False, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=128, null=True)
+    locked_until = models.DateTimeField(null=True)
+    last_error = models.CharField(max_length=256, null=True)
+    delivered_at = models.DateTimeField(null=True)
+
+    class Meta:
+        db_table = "relay_outbox"
+        indexes = [
+            models.Index(fields=["next_attempt_at"], name="relay_outbox_claimable_idx",
+                         condition=models.Q(status__in=["PENDING", "PROCESSING"])),
+        ]
@@ -0,0 +1,177 @@
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+
+import pika
+from pika.exceptions import AMQPConnectionError, AMQPChannelError
+from django.conf import settings
+from django.db import transaction, close_old_connections
+
+from webapp.apps.skurge.processors.event_processor import EventProcessor
+
+
+class EventConsumer:
+    """
+    Consumes source events from rabbitmq queues and runs them through the EventProcessor, run by the event_consumer
+    command.
+    Queues are declared and bound to the exchange of the event service with the routing keys configured for them, every
+    routing key maps to the source event its messages are processed as. A source_event header on the message takes
+    precedence, so wildcard bindings can carry many events. Up to PREFETCH_COUNT messages are in flight at a time,
+    processed by CONCURRENCY threads, and a message is acked only once it has been processed. Messages that can not be
+    processed, ie. without a known source event or a json body, are rejected without requeueing.
+    Messages whose processing raised are requeued until MAX_ATTEMPTS, then rejected so that they are dead-lettered if
+    the queue has a dead letter exchange. Attempts are counted by the x-delivery-count header of quorum queues, classic
+    queues only flag redelivered messages, so their messages are rejected once they fail again after a redelivery.
+    A message is settled on the channel it was delivered on, messages of a channel closed in the meantime, eg. by a
+    reconnect, are left to the broker which redelivers them.
+    """
+    DELIVERY_COUNT_HEADER = "x-delivery-count"
+    SOURCE_EVENT_HEADER = "source_event"
+
+    def __init__(self, queues=None, prefetch_count=None, concurrency=None):
+        self.config = dict(getattr(settings, "EVENT_CONSUMER", {}))
+        if prefetch_count:
+            # The prefetch count of the event_consumer command takes precedence over the settings
+            self.config["PREFETCH_COUNT"] = prefetch_count
+        self.queues = {queue: bindings for queue, bindings in self.config.get("QUEUES", {}).items()
+                       if not queues or queue in queues}
+        self.executor = ThreadPoolExecutor(max_workers=concurrency or self.config.get("CONCURRENCY", 8),
+                                           thread_name_prefix="event-consumer")
+        self.channel = None
+        self.in_flight = set()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def run(self):
+        """
+        Consumes until stopped, reconnecting with backoff whenever the connection to rabbitmq is lost
+        :return:
+        """
+        attempt = 0
+        while not self.stopped.is_set():
+            try:
+                self.consume()
+                attempt = 0
+            except (AMQPConnectionError, AMQPChannelError) as e:
+                backoff = min(self.config.get("BACKOFF", 0.5) * (2 ** attempt), self.config.get("MAX_BACKOFF", 30))
+                logging.warning("Consuming from rabbitmq failed: %s, reconnecting in %ss", str(e), backoff)
+                self.stopped.wait(backoff)
+                attempt += 1
+
+    def stop(self):
+        """
+        Stops consuming, messages in flight are processed and acked before the connection is closed
+        :return:
+        """
+        self.stopped.set()
+        if self.channel and self.channel.is_open:
+            self.channel.stop_consuming()
+
+    def consume(self):
+        """
+        Connects, binds the queues and consumes until consuming is stopped
+        :return:
+        """
+        event_service = settings.EXTERNAL_SERVICES.get("EVENT_SERVICE")
+        connection = pika.BlockingConnection(pika.URLParameters(event_service.get("url")))
+        try:
+            channel = connection.channel()
+            self.channel = channel
+            channel.basic_qos(prefetch_count=self.config.get("PREFETCH_COUNT", 50))
+            for queue, bindings in self.queues.items():
+                channel.queue_declare(queue=queue, durable=True)
+                for routing_key in bindings:
+                    channel.queue_bind(queue=queue, exchange=event_service.get("exchange"),
+                                       routing_key=routing_key)
+                channel.basic_consume(queue=queue, on_message_callback=partial(self.on_message, connection, queue))
+            logging.info("Consuming source events from queues %s", list(self.queues))
+            channel.start_consuming()
+            # Lets the messages in hand finish, their acks are sent before closing
+            with self.lock:
+                in_flight = list(self.in_flight)
+            wait(in_flight)
+            connection.process_data_events(time_limit=0)
+        finally:
+            if connection.is_open:
+                connection.close()
+
+    def on_message(self, connection, queue, channel, method, properties, body):
+        """
+        Hands the message over to the processing threads along with the connection and channel it was delivered on,
+        runs on the connection's thread
+        :return:
+        """
+        source_event = self.get_source_event(queue=queue, method=method, properties=properties)
+        try:
+            source_data = json.loads(body)
+        except ValueError:
+            source_data = None
+        if not source_event or source_data is None:
+            logging.warning("Rejecting message with routing key %s from queue %s, no source event or invalid body",
+                            method.routing_key, queue)
+            channel.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+        future = self.executor.submit(self.process, connection=connection, channel=channel,
+                                      delivery_tag=method.delivery_tag, source_event=source_event,
+                                      source_data=source_data, requeue=self.should_requeue(method, properties))
+        with self.lock:
+            self.in_flight.add(future)
+        future.add_done_callback(self.__discard)
+
+    def get_source_event(self, queue, method, properties):
+        headers = properties.headers if properties and properties.headers else {}
+        return headers.get(self.SOURCE_EVENT_HEADER) or self.queues.get(queue, {}).get(method.routing_key)
+
+    def should_requeue(self, method, properties):
+        """
+        Tells whether the message is requeued if its processing raises, or rejected as it ran out of attempts
+        :param method:
+        :param properties:
+        :return:
+        """
+        if not self.config.get("REQUEUE_ON_ERROR", True):
+            return False
+        headers = properties.headers if properties and properties.headers else {}
+        if headers.get(self.DELIVERY_COUNT_HEADER) is not None:
+            return int(headers.get(self.DELIVERY_COUNT_HEADER)) + 1 < self.config.get("MAX_ATTEMPTS", 3)
+        return not method.redelivered
+
+    def process(self, connection, channel, delivery_tag, source_event, source_data, requeue):
+        """
+        Processes the source event and acks the message, the message is nacked if processing raised
+        :return:
+        """
+        processed = False
+        try:
+            with transaction.atomic():
+                response = EventProcessor(source_event=source_event, source_data=source_data).process_event()
+            logging.info("Consumed event %s processed with status %s", source_event, response.get("status"))
+            processed = True
+        except Exception as e:
+            logging.error("Error processing consumed event %s: %s", source_event, str(e))
+        finally:
+            close_old_connections()
+        # Channels are not thread safe, the ack is sent from the connection's thread
+        try:
+            connection.add_callback_threadsafe(partial(self.__settle, channel, delivery_tag, processed, requeue))
+        except Exception as e:
+            logging.warning("Consumed event %s not settled, its connection is closed: %s", source_event, str(e))
+
+    @staticmethod
+    def __settle(channel, delivery_tag, processed, requeue):
+        if not channel.is_open:
+            # Delivery tags are only valid on their channel, the broker redelivers the message
+            logging.warning("Message %s not settled, its channel is closed", delivery_tag)
+            return
+        if processed:
+            channel.basic_ack(delivery_tag=delivery_tag)
+            return
+        if not requeue:
+            logging.error("Rejecting message %s whose processing raised", delivery_tag)
+        channel.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
+
+    def __discard(self, future):
+        with self.lock:
+            self.in_flight.discard(future)
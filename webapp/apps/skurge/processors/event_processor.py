@@ -1,7 +1,10 @@
 import logging
 
+from django.conf import settings
+
 from webapp.apps.skurge.processors.source_event import SourceEventProcessor
-from webapp.apps.skurge.processors.relay_event import RelayEventProcessor
+from webapp.apps.skurge.processors.graphql_fetch import GraphQLFetchCoalescer
+from webapp.apps.skurge.processors.execution_plan import ExecutionPlanRegistry
 from webapp.apps.skurge.services.log import RelayLogService
 
 
@@ -13,39 +16,60 @@ class EventProcessor:
     source_data = None
     relay_processors = None
 
-    def __init__(self, source_event, source_data):
+    def __init__(self, source_event, source_data, event_config=None, graphql_fetcher=None):
+        """
+        :param source_event:
+        :param source_data:
+        :param event_config: Resolved config of the source event, looked up if not given
+        :param graphql_fetcher: Fetcher to share graphql results with other events, eg. of a bulk request
+        """
         self.source_event_name = source_event
         self.source_data = source_data
+        self.event_config = event_config
+        self.graphql_fetcher = graphql_fetcher
+        self.execution = None
 
     def process_event(self):
         """
         Processes the incoming skurge event to relay it to different systems
         :return:
         """
-        error_message = self.validate_source_event()
+        error_message = self.validate_source_event(prefetch=getattr(settings, "GRAPHQL_PREFETCH", {}).get("ENABLED"))
         if error_message:
             return {"status": "FAILED", "reason": error_message}
         self.relay_event()
         return {"status": "SUCCESS"}
 
-    def validate_source_event(self):
+    def validate_source_event(self, prefetch=False):
         """
         Validates incoming event to skurge
+        :param prefetch: Launches the graphql fetches of the event as soon as its config is known, so that they run
+        concurrently with the validation. They are discarded if the validation fails
         :return:
         """
-        source_event_processor = SourceEventProcessor(self.source_event_name, self.source_data)
+        source_event_processor = SourceEventProcessor(self.source_event_name, self.source_data,
+                                                      event_config=self.event_config)
         if not source_event_processor.is_source_event_registered():
             message = "Event %s is not registered within skurge or is marked inactive" % self.source_event_name
             logging.warning(message)
             RelayLogService().log(source=self.source_event_name, status="FAILED", reason=message)
             return message
+        self.event_config = source_event_processor.event_config
+        if prefetch:
+            if not self.graphql_fetcher:
+                self.graphql_fetcher = GraphQLFetchCoalescer()
+            self.execution = ExecutionPlanRegistry().get_plan(self.event_config).prefetch(
+                source_event=self.source_event_name, source_data=self.source_data,
+                graphql_fetcher=self.graphql_fetcher)
         error_messages = source_event_processor.validate_source_data()
         if error_messages:
+            if self.execution:
+                self.execution.discard()
+                self.execution = None
             messages = ','.join(error_messages)
             RelayLogService().log(source=self.source_event_name, status="FAILED", reason=messages)
             return messages
-        source_event_id = source_event_processor.source_event_id
-        self.relay_processors = RelayEventProcessor().fetch_relay_processors(source_event_id=source_event_id)
+        self.relay_processors = source_event_processor.relay_processors
         if not self.relay_processors:
             message = "No relay event processor registered for the source event %s" % self.source_event_name
             logging.warning(message)
@@ -55,14 +79,16 @@ class EventProcessor:
 
     def relay_event(self):
         """
-        Iterates the list of relayers for the source event, prepares the payload and relays it forward.
-        Logs error for any failed relay_processor.
+        Executes the execution plan compiled from the event config, running the relayers concurrently, each one
+        preparing the payload and relaying it forward.
+        Identical graphql fetches of the relayers are executed once for the event, the ones prefetched while validating
+        are waited for.
+        Relay logs of the relayers are collected and written together once all of them are done.
         :return:
         """
-        for relay_processor in self.relay_processors:
-            try:
-                RelayEventProcessor().process_relayer(relay_processor=relay_processor, source_data=self.source_data,
-                                                      source_event=self.source_event_name)
-            except Exception as e:
-                err = "Error processing relayer: %s, source event: %s, Error: %s" % (relay_processor.get("id"), self.source_event_name, str(e))
-                logging.error(err)
+        graphql_fetcher = self.graphql_fetcher if self.graphql_fetcher else GraphQLFetchCoalescer()
+        plan = ExecutionPlanRegistry().get_plan(self.event_config)
+        relay_logs = plan.execute(source_event=self.source_event_name, source_data=self.source_data,
+                                  graphql_fetcher=graphql_fetcher, execution=self.execution)
+        RelayLogService().bulk_log([log for relay_log in relay_logs for log in relay_log.relay_logs],
+                                   outbox=[entry for relay_log in relay_logs for entry in relay_log.outbox])
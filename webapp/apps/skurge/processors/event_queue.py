@@ -0,0 +1,232 @@
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction, close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+
+from webapp.apps.skurge.constants import QueuedEventStatus
+from webapp.apps.skurge.models import QueuedEvent
+from webapp.apps.skurge.processors.event_processor import EventProcessor
+
+
+def get_worker_id():
+    return "%s:%s" % (socket.gethostname(), os.getpid())
+
+
+class QueuedEventProcessor:
+    """
+    Runs events accepted in async mode through the EventProcessor and records their outcome on the queued event.
+    An event is claimed before processing by moving it out of PENDING, so it is processed by a single worker.
+    Nothing but the EventQueueWorker claims an event again, async mode needs event queue workers running to process the
+    events not dispatched on commit and the ones left PROCESSING by a worker that died.
+    """
+
+    def process(self, queued_event_id):
+        """
+        Claims the pending event and processes it, events already claimed by another worker are skipped
+        :param queued_event_id:
+        :return: the processed queued event or None if it was not pending
+        """
+        visibility_timeout = getattr(settings, "EVENT_QUEUE", {}).get("VISIBILITY_TIMEOUT", 300)
+        now = timezone.now()
+        claimed = QueuedEvent.objects.filter(id=queued_event_id, status=QueuedEventStatus.PENDING.value).update(
+            status=QueuedEventStatus.PROCESSING.value, attempts=F("attempts") + 1, locked_by=get_worker_id(),
+            locked_until=now + timedelta(seconds=visibility_timeout), modified_at=now)
+        if not claimed:
+            return None
+        queued_event = QueuedEvent.objects.get(id=queued_event_id)
+        self.run(queued_event)
+        return queued_event
+
+    def run(self, queued_event):
+        """
+        Processes the claimed event, its relay logs and outcome are saved in a single transaction
+        The outcome is only saved while the event is still claimed by the worker, an event whose lease ran out and got
+        claimed by another worker is left to that worker
+        :param queued_event:
+        :return:
+        """
+        try:
+            with transaction.atomic():
+                response = EventProcessor(source_event=queued_event.source_event_name,
+                                          source_data=queued_event.source_data).process_event()
+                self.__save_outcome(queued_event, status=response.get("status"), reason=response.get("reason"))
+        except Exception as e:
+            message = "Error processing queued event %s: %s" % (queued_event.event_id, str(e))
+            logging.error(message)
+            self.__save_outcome(queued_event, status=QueuedEventStatus.FAILED.value, reason=message)
+
+    def __save_outcome(self, queued_event, status, reason=None):
+        queued_event.status = status
+        queued_event.reason = reason[:256] if reason else None
+        saved = QueuedEvent.objects.filter(id=queued_event.id, locked_by=queued_event.locked_by,
+                                           status=QueuedEventStatus.PROCESSING.value).update(
+            status=queued_event.status, reason=queued_event.reason, modified_at=timezone.now())
+        if not saved:
+            logging.warning("Queued event %s is no longer claimed by %s, its outcome %s is not saved",
+                            queued_event.event_id, queued_event.locked_by, status)
+
+
+class EventQueueWorkerPool:
+    """
+    Per worker thread pool processing the events accepted by the worker once their transaction commits.
+    Events are queued in the db first, those not processed here (eg. the worker was restarted) stay pending for the
+    event queue workers. The pool is tied to the process id, forked uwsgi workers start their own threads.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.config = getattr(settings, "EVENT_QUEUE", {})
+        self.pid = os.getpid()
+        self.executor = ThreadPoolExecutor(max_workers=self.config.get("WORKERS", 4), thread_name_prefix="event-queue")
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Gets the worker pool of the current worker process
+        :return:
+        """
+        instance = cls._instance
+        if instance and instance.pid == os.getpid():
+            return instance
+        with cls._instance_lock:
+            if not cls._instance or cls._instance.pid != os.getpid():
+                cls._instance = cls()
+            return cls._instance
+
+    def dispatch_on_commit(self, queued_event_id):
+        """
+        Processes the queued event on the pool once the current transaction commits
+        :param queued_event_id:
+        :return:
+        """
+        if self.config.get("DISPATCH_ON_COMMIT", True):
+            transaction.on_commit(lambda: self.executor.submit(self.__process, queued_event_id))
+
+    def __process(self, queued_event_id):
+        try:
+            QueuedEventProcessor().process(queued_event_id)
+        except Exception as e:
+            logging.error("Error dispatching queued event %s: %s", queued_event_id, str(e))
+        finally:
+            close_old_connections()
+
+
+class EventQueueWorker:
+    """
+    Worker draining the event queue, run by the event_queue_worker command.
+    Batches of claimable events are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers across
+    nodes claim disjoint batches without waiting on each other. An event is claimable if it is pending, or still
+    processing after its visibility timeout has passed as its worker crashed. The lease on the rest of the batch is
+    renewed before every event, events whose lease ran out in between and were claimed by another worker are skipped.
+    Events claimed MAX_ATTEMPTS times are failed instead of being retried forever.
+    """
+
+    def __init__(self, batch_size=None, visibility_timeout=None, poll_interval=None):
+        config = getattr(settings, "EVENT_QUEUE", {})
+        self.batch_size = batch_size or config.get("BATCH_SIZE", 50)
+        self.visibility_timeout = visibility_timeout or config.get("VISIBILITY_TIMEOUT", 300)
+        self.poll_interval = poll_interval or config.get("POLL_INTERVAL", 1)
+        self.max_attempts = config.get("MAX_ATTEMPTS", 5)
+        self.worker_id = get_worker_id()
+        self.stopped = threading.Event()
+
+    def run(self):
+        """
+        Processes batches until stopped, sleeping for the poll interval whenever the queue is empty
+        :return:
+        """
+        logging.info("Event queue worker %s started", self.worker_id)
+        while not self.stopped.is_set():
+            if not self.run_once():
+                self.stopped.wait(self.poll_interval)
+        logging.info("Event queue worker %s stopped", self.worker_id)
+
+    def stop(self):
+        """
+        Stops the worker after the event in hand, the rest of its batch is released to the other workers
+        :return:
+        """
+        self.stopped.set()
+
+    def run_once(self):
+        """
+        Claims a batch of events and processes them
+        :return: number of events processed
+        """
+        batch = self.claim_batch()
+        processor = QueuedEventProcessor()
+        processed = 0
+        for index, queued_event in enumerate(batch):
+            if self.stopped.is_set():
+                self.release(batch[index:])
+                break
+            # A slow event may have let the lease on the rest of the batch run out
+            owned = self.renew_lease(batch[index:])
+            if queued_event.id not in owned:
+                logging.warning("Queued event %s was claimed by another worker, skipping it", queued_event.event_id)
+                continue
+            processor.run(queued_event)
+            processed += 1
+        return processed
+
+    def claim_batch(self):
+        """
+        Claims the next batch of claimable events for this worker, skipping the ones other workers are claiming
+        :return: list of claimed queued events
+        """
+        now = timezone.now()
+        claimable = Q(status=QueuedEventStatus.PENDING.value) | \
+            Q(status=QueuedEventStatus.PROCESSING.value, locked_until__lt=now)
+        with transaction.atomic():
+            batch = list(QueuedEvent.objects.select_for_update(skip_locked=True).filter(claimable)
+                         .order_by("id")[:self.batch_size])
+            exhausted = [queued_event.id for queued_event in batch if queued_event.attempts >= self.max_attempts]
+            if exhausted:
+                logging.warning("Failing queued events %s after %s attempts", exhausted, self.max_attempts)
+                QueuedEvent.objects.filter(id__in=exhausted).update(
+                    status=QueuedEventStatus.FAILED.value, locked_until=None, modified_at=now,
+                    reason="Processing not completed after %s attempts" % self.max_attempts)
+            batch = [queued_event for queued_event in batch if queued_event.id not in exhausted]
+            QueuedEvent.objects.filter(id__in=[queued_event.id for queued_event in batch]).update(
+                status=QueuedEventStatus.PROCESSING.value, attempts=F("attempts") + 1, locked_by=self.worker_id,
+                locked_until=now + timedelta(seconds=self.visibility_timeout), modified_at=now)
+        for queued_event in batch:
+            queued_event.status = QueuedEventStatus.PROCESSING.value
+            queued_event.attempts += 1
+            queued_event.locked_by = self.worker_id
+        if batch:
+            logging.info("Worker %s claimed %s queued events", self.worker_id, len(batch))
+        return batch
+
+    def renew_lease(self, queued_events):
+        """
+        Extends the lease on the events still claimed by this worker
+        :param queued_events:
+        :return: ids of the events still claimed by this worker
+        """
+        with transaction.atomic():
+            owned = QueuedEvent.objects.select_for_update().filter(
+                id__in=[queued_event.id for queued_event in queued_events], locked_by=self.worker_id,
+                status=QueuedEventStatus.PROCESSING.value)
+            owned_ids = set(owned.values_list("id", flat=True))
+            QueuedEvent.objects.filter(id__in=owned_ids).update(
+                locked_until=timezone.now() + timedelta(seconds=self.visibility_timeout))
+        return owned_ids
+
+    def release(self, queued_events):
+        """
+        Hands the unprocessed claimed events back to the queue without counting the attempt
+        :param queued_events:
+        :return:
+        """
+        QueuedEvent.objects.filter(id__in=[queued_event.id for queued_event in queued_events],
+                                   locked_by=self.worker_id, status=QueuedEventStatus.PROCESSING.value).update(
+            status=QueuedEventStatus.PENDING.value, attempts=F("attempts") - 1, locked_by=None, locked_until=None)
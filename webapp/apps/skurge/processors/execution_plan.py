@@ -0,0 +1,401 @@
+import logging
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from graphql import parse
+from graphql.language import ast
+
+from webapp.apps.skurge.constants import RelayType
+from webapp.apps.skurge.common.logic import JsonLogicAnalyzer
+from webapp.apps.skurge.common.metrics import Metrics
+from webapp.apps.skurge.common.path import LocatorPlanRegistry
+from webapp.apps.skurge.common.template import TemplateRegistry
+from webapp.apps.skurge.processors.relay_event import RelayEventProcessor
+from webapp.apps.skurge.processors.fan_out import RelayFanOut
+from webapp.apps.skurge.services.log import RelayLogCollector
+
+
+class FetchNode:
+    """
+    Graphql fetch of the source data, shared by every relayer whose data processor fires the same query
+    """
+
+    def __init__(self, query, cache_ttl=None, batched=False):
+        self.query = query
+        self.cache_ttl = cache_ttl
+        self.batched = batched
+        self.response_keys = self.get_response_keys(query)
+
+    @property
+    def key(self):
+        return self.query, self.cache_ttl, self.batched
+
+    @classmethod
+    def get_response_keys(cls, query):
+        """
+        Returns the top level keys of the data fetched by the query, ie. the names or aliases of its root fields, or
+        None if the query cannot be parsed
+        :param query:
+        :return:
+        """
+        try:
+            document = parse(query)
+        except Exception:
+            return None
+        fragments = {definition.name.value: definition for definition in document.definitions
+                     if isinstance(definition, ast.FragmentDefinition)}
+        keys = set()
+        for definition in document.definitions:
+            if isinstance(definition, ast.OperationDefinition):
+                if not cls.add_response_keys(definition.selection_set, fragments, keys, set()):
+                    return None
+        return keys
+
+    @classmethod
+    def add_response_keys(cls, selection_set, fragments, keys, visited):
+        for selection in selection_set.selections:
+            if isinstance(selection, ast.Field):
+                keys.add((selection.alias or selection.name).value)
+            elif isinstance(selection, ast.InlineFragment):
+                if not cls.add_response_keys(selection.selection_set, fragments, keys, visited):
+                    return False
+            elif isinstance(selection, ast.FragmentSpread):
+                name = selection.name.value
+                if name in visited:
+                    continue
+                if name not in fragments:
+                    return False
+                visited.add(name)
+                if not cls.add_response_keys(fragments[name].selection_set, fragments, keys, visited):
+                    return False
+            else:
+                return False
+        return True
+
+
+class RelayNode:
+    """
+    Relay of the source event to a single relay processor, ie. the fetch node it depends on followed by the transform,
+    validate, route and publish stages of the relayer.
+    Relayers that can never publish, eg. event relayers without event rules, exit before fetching. Relayers routed by
+    the source data alone are routed before fetching, so that the fetch is skipped when they route nowhere.
+    """
+
+    def __init__(self, relay_processor, data_processor, fetch_node=None, error=None, route_first=False):
+        self.relay_processor = relay_processor
+        self.data_processor = data_processor
+        self.fetch_node = fetch_node
+        self.error = error
+        self.route_first = route_first
+
+    @property
+    def stages(self):
+        if self.error:
+            return ["exit"]
+        stages = ["fetch"] if self.fetch_node else []
+        if self.data_processor and self.data_processor.get("relay_data_locator"):
+            stages += ["transform", "validate"]
+        if self.route_first:
+            return ["route"] + stages + ["publish"]
+        return stages + ["route", "publish"]
+
+    def execute(self, execution, relay_log):
+        """
+        Runs the stages of the relayer, errors are logged without affecting the other relayers
+        :param execution:
+        :param relay_log:
+        :return:
+        """
+        source_event = execution.source_event
+        try:
+            if self.error:
+                logging.warning(self.error)
+                relay_log.log(source=source_event, status="FAILED", relay_data={}, reason=self.error,
+                              relay_type=self.relay_processor.get("relay_type"))
+                return
+            processor = RelayEventProcessor(graphql_fetcher=execution, relay_log_service=relay_log)
+            processor.prepare_context(source_data=execution.source_data)
+            if self.route_first and not processor.find_destination(relay_processor=self.relay_processor,
+                                                                   source_event=source_event):
+                Metrics().incr("execution_plan.skipped_fetches")
+                return
+            if self.fetch_node:
+                processor.fetch_external_data_from_graphql_server(data_processor=self.data_processor)
+            if not processor.prepare_relay_data(relay_processor=self.relay_processor,
+                                                data_processor=self.data_processor, source_event=source_event):
+                return
+            if not self.route_first and not processor.find_destination(relay_processor=self.relay_processor,
+                                                                       source_event=source_event):
+                return
+            processor.relay(relay_processor=self.relay_processor, source_event=source_event)
+        except Exception as e:
+            err = "Error processing relayer: %s, source event: %s, Error: %s" % (self.relay_processor.get("id"),
+                                                                                  source_event, str(e))
+            logging.error(err)
+            relay_log.log(source=source_event, status="FAILED", reason=err[:256],
+                          relay_type=self.relay_processor.get("relay_type"))
+
+
+class ExecutionPlan:
+    """
+    Execution plan of a source event compiled from its config, ie. a DAG of the fetch nodes of the event feeding the
+    relay nodes of its relay processors.
+    Relay processors sharing a data processor, or firing identical queries, depend on the same fetch node which is
+    fetched once per event. Relay nodes run concurrently on the fan-out pool, a single relay node runs inline.
+    """
+
+    def __init__(self, event_config):
+        self.source_event = event_config.get("source_event")
+        self.fetch_nodes = OrderedDict()
+        self.relay_nodes = [self.compile_relay_node(relay_processor)
+                            for relay_processor in event_config.get("relay_processors") or []]
+
+    def compile_relay_node(self, relay_processor):
+        """
+        Compiles the relay node of the relay processor, resolving its data processor and its fetch node
+        :param relay_processor:
+        :return:
+        """
+        data_processor = RelayEventProcessor().get_data_processor(relay_processor=relay_processor)
+        relay_type = relay_processor.get("relay_type")
+        error = None
+        if relay_type == RelayType.EVENT.value and not relay_processor.get("relay_event_rules"):
+            error = "Event rules not present in relay processor %s" % relay_processor.get("id")
+        elif relay_type == RelayType.API.value and not relay_processor.get("relay_http_endpoint_rules"):
+            error = "No valid endpoint, http request or headers found for the source event %s" % self.source_event
+
+        fetch_node = None
+        if not error and data_processor and data_processor.get("graphql_query"):
+            fetch_node = FetchNode(query=data_processor.get("graphql_query"),
+                                   cache_ttl=data_processor.get("graphql_cache_ttl"),
+                                   batched=data_processor.get("graphql_batching", False))
+            fetch_node = self.fetch_nodes.setdefault(fetch_node.key, fetch_node)
+        return RelayNode(relay_processor=relay_processor, data_processor=data_processor, fetch_node=fetch_node,
+                         error=error, route_first=bool(fetch_node) and self.is_routed_by_source_data(
+                             relay_processor=relay_processor, fetch_node=fetch_node))
+
+    def is_routed_by_source_data(self, relay_processor, fetch_node):
+        """
+        Checks statically if the destination of the relay processor is decided by the source data alone, ie. none of
+        the context data read by its rules, or by the endpoint templates of its api rules, is located at a root field
+        of the graphql query. The fetched data is layered over the source data, so any other path resolves to the
+        source data with or without the fetch
+        :param relay_processor:
+        :param fetch_node:
+        :return:
+        """
+        locator = relay_processor.get("context_data_locator")
+        if fetch_node.response_keys is None or not isinstance(locator, dict):
+            return False
+        relay_type = relay_processor.get("relay_type")
+        if relay_type == RelayType.EVENT.value:
+            context_keys = JsonLogicAnalyzer().get_data_keys(relay_processor.get("relay_event_rules"))
+        elif relay_type == RelayType.API.value:
+            rules = relay_processor.get("relay_http_endpoint_rules")
+            context_keys = JsonLogicAnalyzer().get_data_keys(rules)
+            template_keys = self.get_template_keys(rules)
+            context_keys = None if context_keys is None or template_keys is None else context_keys | template_keys
+        else:
+            return False
+
+        for field, _, getter, _ in LocatorPlanRegistry().get_plan(locator).fields:
+            if context_keys is not None and field not in context_keys:
+                continue
+            if not getter.steps or str(getter.steps[0][0]) in fetch_node.response_keys:
+                return False
+        return True
+
+    def get_template_keys(self, value):
+        """
+        Returns the keys referenced by the string templates in the value, or None if any of them is not compiled
+        :param value:
+        :return:
+        """
+        if isinstance(value, str):
+            return TemplateRegistry().get_template(value).get_keys()
+        items = value.values() if isinstance(value, dict) else value if isinstance(value, (list, tuple)) else []
+        keys = set()
+        for item in items:
+            item_keys = self.get_template_keys(item)
+            if item_keys is None:
+                return None
+            keys |= item_keys
+        return keys
+
+    def describe(self):
+        """
+        Returns the nodes of the plan, for debugging
+        :return:
+        """
+        fetch_nodes = list(self.fetch_nodes.values())
+        return {
+            "source_event": self.source_event,
+            "fetch_nodes": len(fetch_nodes),
+            "relay_nodes": [{"relay_processor": relay_node.relay_processor.get("id"),
+                             "fetch_node": fetch_nodes.index(relay_node.fetch_node) if relay_node.fetch_node else None,
+                             "stages": relay_node.stages}
+                            for relay_node in self.relay_nodes]
+        }
+
+    def execute(self, source_event, source_data, graphql_fetcher, execution=None):
+        """
+        Executes the plan for the source data
+        :param source_event:
+        :param source_data:
+        :param graphql_fetcher: Fetcher the fetch nodes are fetched with, eg. shared with the events of a bulk request
+        :param execution: Execution started by prefetch, if any
+        :return: Relay log collectors of the relay nodes
+        """
+        if not execution:
+            execution = PlanExecution(source_event=source_event, source_data=source_data,
+                                      graphql_fetcher=graphql_fetcher)
+        relay_logs = [RelayLogCollector() for _ in self.relay_nodes]
+        RelayFanOut.get_instance().run([partial(relay_node.execute, execution=execution, relay_log=relay_log)
+                                        for relay_node, relay_log in zip(self.relay_nodes, relay_logs)])
+        return relay_logs
+
+    def prefetch(self, source_event, source_data, graphql_fetcher):
+        """
+        Starts an execution of the plan by speculatively launching its fetch nodes on the fan-out pool, so that they
+        are fetched while the source data is validated. The execution is to be executed or discarded
+        :param source_event:
+        :param source_data:
+        :param graphql_fetcher:
+        :return:
+        """
+        execution = PlanExecution(source_event=source_event, source_data=source_data, graphql_fetcher=graphql_fetcher)
+        for fetch_node in self.fetch_nodes.values():
+            execution.prefetch(fetch_node)
+        return execution
+
+
+class PlanExecution:
+    """
+    State of a single execution of a plan. Every fetch node is fetched once, the relay nodes depending on it wait for
+    its result, failures included, which is shared between them and must be treated as read only.
+    """
+
+    def __init__(self, source_event, source_data, graphql_fetcher):
+        self.source_event = source_event
+        self.source_data = source_data
+        self.graphql_fetcher = graphql_fetcher
+        self.results = {}
+        self.prefetches = {}
+        self.node_locks = {}
+        self.lock = threading.Lock()
+
+    def prefetch(self, fetch_node):
+        """
+        Launches the fetch of the fetch node on the fan-out pool
+        :param fetch_node:
+        :return:
+        """
+        self.prefetches[fetch_node.key] = RelayFanOut.get_instance().submit(partial(
+            self.fetch_from_server, query=fetch_node.query, cache_ttl=fetch_node.cache_ttl,
+            batched=fetch_node.batched))
+        Metrics().incr("graphql.prefetches")
+
+    def discard(self):
+        """
+        Discards the prefetches, the ones not started yet are cancelled and the results of the others are dropped
+        :return:
+        """
+        for future in self.prefetches.values():
+            future.cancel()
+        Metrics().incr("graphql.discarded_prefetches", len(self.prefetches))
+        self.prefetches = {}
+
+    def fetch_from_server(self, query, cache_ttl=None, batched=False):
+        """
+        Fetches the query for the source data of the execution
+        :return: (result, error)
+        """
+        try:
+            return self.graphql_fetcher.fetch(query=query, variables=self.source_data, cache_ttl=cache_ttl,
+                                              batched=batched), None
+        except Exception as e:
+            return None, e
+
+    def fetch(self, query, variables, cache_ttl=None, batched=False):
+        """
+        Fetches the fetch node of the query for the source data of the execution, waiting for its prefetch if it is
+        in flight
+        :param query:
+        :param variables: Source data of the execution
+        :param cache_ttl:
+        :param batched:
+        :return:
+        """
+        key = (query, cache_ttl, batched)
+        with self.lock:
+            node_lock = self.node_locks.setdefault(key, threading.Lock())
+        with node_lock:
+            if key in self.results:
+                Metrics().incr("graphql.coalesced_fetches")
+                result, error = self.results[key]
+            else:
+                prefetch = self.prefetches.get(key)
+                # A prefetch still queued behind busy relayers is fetched here instead of being waited for
+                if prefetch and not prefetch.cancel():
+                    result, error = prefetch.result()
+                else:
+                    result, error = self.fetch_from_server(query=query, cache_ttl=cache_ttl, batched=batched)
+                self.results[key] = (result, error)
+        if error:
+            raise error
+        return result
+
+
+class ExecutionPlanRegistry:
+    """
+    Per worker registry of compiled execution plans, one per source event. Configs coming from the event config cache
+    are the same objects until the config version is bumped or their TTL runs out, so a plan is compiled once per
+    cached config and replaces the plan of the previous one. Configs loaded without the cache carry no config version,
+    they are compiled for every event without being registered.
+    """
+    MAX_SIZE = 1024
+
+    _plans = OrderedDict()
+    _lock = threading.Lock()
+
+    def get_plan(self, event_config):
+        """
+        Returns the compiled plan of the event config, compiling it on first use
+        :param event_config:
+        :return:
+        """
+        if event_config.get("version") is None:
+            Metrics().incr("execution_plan.uncached")
+            return ExecutionPlan(event_config)
+        source_event = event_config.get("source_event")
+        entry = self._plans.get(source_event)
+        if entry and entry[0] is event_config:
+            Metrics().incr("execution_plan.hits")
+            return entry[1]
+        plan = ExecutionPlan(event_config)
+        with self._lock:
+            self._plans[source_event] = (event_config, plan)
+            self._plans.move_to_end(source_event)
+            Metrics().incr("execution_plan.misses")
+            while len(self._plans) > self.MAX_SIZE:
+                self._plans.popitem(last=False)
+        logging.info("Execution plan compiled for %s at config version %s", source_event, event_config.get("version"))
+        return plan
+
+    def stats(self):
+        """
+        Returns the hit/miss counters, the plans compiled for uncached configs and the number of registered plans
+        :return:
+        """
+        metrics = Metrics()
+        return {
+            "hits": metrics.get("execution_plan.hits"),
+            "misses": metrics.get("execution_plan.misses"),
+            "uncached": metrics.get("execution_plan.uncached"),
+            "size": len(self._plans)
+        }
+
+    def clear(self):
+        with self._lock:
+            self._plans.clear()
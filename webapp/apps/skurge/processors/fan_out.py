@@ -0,0 +1,64 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+
+class RelayFanOut:
+    """
+    Runs the relayers of a source event concurrently on a thread pool shared by the worker.
+    The first relayer runs on the calling thread while the others are handed over to the pool, so an event always makes
+    progress even when the pool is busy with the relayers of concurrent events. Tasks must handle their own errors.
+    The pool is tied to the process id, forked uwsgi workers start their own threads.
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.config = getattr(settings, "RELAY_FAN_OUT", {})
+        self.pid = os.getpid()
+        self.executor = ThreadPoolExecutor(max_workers=self.config.get("MAX_WORKERS", 8),
+                                           thread_name_prefix="relay-fan-out")
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Gets the fan-out executor of the current worker process
+        :return:
+        """
+        instance = cls._instance
+        if instance and instance.pid == os.getpid():
+            return instance
+        with cls._instance_lock:
+            if not cls._instance or cls._instance.pid != os.getpid():
+                cls._instance = cls()
+            return cls._instance
+
+    def run(self, tasks):
+        """
+        Runs the tasks, concurrently if fan-out is enabled, and returns their results in order
+        :param tasks: list of callables taking no arguments
+        :return:
+        """
+        if not getattr(settings, "RELAY_FAN_OUT", {}).get("ENABLED", True) or len(tasks) < 2:
+            return [task() for task in tasks]
+        futures = [self.executor.submit(self.__run_in_pool, task) for task in tasks[1:]]
+        results = [tasks[0]()]
+        return results + [future.result() for future in futures]
+
+    def submit(self, task):
+        """
+        Runs the task on the pool, regardless of fan-out being enabled
+        :param task: callable taking no arguments
+        :return: Future of the task
+        """
+        return self.executor.submit(self.__run_in_pool, task)
+
+    def __run_in_pool(self, task):
+        try:
+            return task()
+        finally:
+            # Pool threads never hold on to a db connection opened by a task
+            close_old_connections()
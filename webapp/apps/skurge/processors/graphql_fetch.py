@@ -0,0 +1,99 @@
+import hashlib
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from webapp.apps.skurge.clients.graphql import GraphQLClient
+from webapp.apps.skurge.clients.graphql_batch import GraphQLBatcher
+from webapp.apps.skurge.common.metrics import Metrics
+
+
+class GraphQLFetchCoalescer:
+    """
+    Coalesces graphql fetches within a single source event.
+    Relayers sharing a data processor, or having identical queries, fire the same query with the same source data.
+    The first fetch for a (query, variables) pair hits the graphql server and every later one gets the same result,
+    which is shared between the relayers and must be treated as read only.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.key_locks = {}
+        self.lock = threading.Lock()
+
+    def fetch(self, query, variables, cache_ttl=None, batched=False):
+        """
+        Fetches data for the query and variables, hitting the graphql server at most once per pair
+        :param query:
+        :param variables:
+        :param cache_ttl: Seconds to cache the response across events for, not cached if empty
+        :param batched: Whether the query is micro-batched with the queries of concurrent events
+        :return:
+        """
+        serialized_variables = json.dumps(variables, sort_keys=True, default=str)
+        key = (query, serialized_variables)
+        with self.lock:
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if key in self.results:
+                Metrics().incr("graphql.coalesced_fetches")
+                result, error = self.results[key]
+            else:
+                result, error = None, None
+                try:
+                    result = GraphQLResultCache().fetch(query=query, variables=variables,
+                                                        serialized_variables=serialized_variables, ttl=cache_ttl,
+                                                        batched=batched)
+                except Exception as e:
+                    error = e
+                self.results[key] = (result, error)
+        # Failures are shared as well, a failing query is not retried by every relayer of the event
+        if error:
+            raise error
+        return result
+
+
+class GraphQLResultCache:
+    """
+    Optional cache in front of the graphql server for enrichment data of hot entities.
+    Responses are cached per query and variables for the TTL of the data processor. Storage is delegated to the django
+    cache configured in settings, the default locmem backend is bounded and evicts the least recently used responses,
+    a shared backend (eg. memcached or file based) shares the responses across workers.
+    """
+    KEY_PREFIX = "skurge:graphql:"
+
+    def __init__(self):
+        self.config = getattr(settings, "GRAPHQL_RESULT_CACHE", {})
+
+    def fetch(self, query, variables, serialized_variables, ttl=None, batched=False):
+        """
+        Returns the cached response if present else fetches it from the graphql server and caches it for ttl seconds
+        :param query:
+        :param variables:
+        :param serialized_variables:
+        :param ttl:
+        :param batched:
+        :return:
+        """
+        if not ttl or not self.config.get("ENABLED", True):
+            return self.fetch_from_server(query=query, variables=variables, batched=batched)
+
+        cache = caches[self.config.get("CACHE_ALIAS", "default")]
+        key = self.KEY_PREFIX + hashlib.sha1((query + serialized_variables).encode()).hexdigest()
+        result = cache.get(key)
+        if result is not None:
+            Metrics().incr("graphql.cache_hits")
+            logging.info("Graphql response served from cache for variables %s", serialized_variables)
+            return result
+        Metrics().incr("graphql.cache_misses")
+        result = self.fetch_from_server(query=query, variables=variables, batched=batched)
+        cache.set(key, result, timeout=ttl)
+        return result
+
+    def fetch_from_server(self, query, variables, batched=False):
+        if batched and getattr(settings, "GRAPHQL_BATCHING", {}).get("ENABLED", True):
+            return GraphQLBatcher.get_instance().fetch(query=query, variables=variables)
+        return GraphQLClient().fetch_data(query=query, variables=variables)
@@ -0,0 +1,195 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from webapp.apps.skurge.clients.event import RabbitMQClient, PublishConfirmTimeoutException
+from webapp.apps.skurge.common.util import HttpUtil
+from webapp.apps.skurge.constants import OutboxStatus, RelayType
+from webapp.apps.skurge.models import RelayOutbox, RelayEventLogs
+from webapp.apps.skurge.processors.event_queue import get_worker_id
+
+
+class RelayOutboxWorker:
+    """
+    Worker delivering the relays queued in the relay outbox, run by the relay_outbox_worker command.
+    Batches of due entries are claimed with SELECT ... FOR UPDATE SKIP LOCKED so that workers across nodes deliver
+    disjoint batches. A batch is delivered per destination: events of a routing key are published together, pipelined
+    when publisher confirms are enabled, and api relays to an endpoint share the keep-alive connection of its host.
+    Once a relay to a destination fails the rest of the destination's entries are backed off without being tried.
+    Failed entries are retried with exponential backoff until MAX_ATTEMPTS, the relay log of every entry is updated
+    with its final outcome.
+    The lease on the claimed entries is renewed before every destination and every api relay, entries whose lease ran
+    out in between and were claimed by another worker are skipped, and outcomes are only saved for the entries the
+    worker still owns.
+    """
+
+    def __init__(self, batch_size=None, poll_interval=None):
+        self.config = getattr(settings, "RELAY_OUTBOX", {})
+        self.batch_size = batch_size or self.config.get("BATCH_SIZE", 100)
+        self.poll_interval = poll_interval or self.config.get("POLL_INTERVAL", 1)
+        self.worker_id = get_worker_id()
+        self.claimed = set()  # Ids of the claimed entries not delivered or failed yet
+        self.stopped = threading.Event()
+
+    def run(self):
+        """
+        Delivers batches until stopped, sleeping for the poll interval whenever nothing is due
+        :return:
+        """
+        logging.info("Relay outbox worker started")
+        while not self.stopped.is_set():
+            if not self.run_once():
+                self.stopped.wait(self.poll_interval)
+        logging.info("Relay outbox worker stopped")
+
+    def stop(self):
+        self.stopped.set()
+
+    def run_once(self):
+        """
+        Claims a batch of due entries and delivers them grouped by destination
+        :return: number of entries claimed
+        """
+        batch = self.claim_batch()
+        destinations = OrderedDict()
+        for entry in batch:
+            destinations.setdefault((entry.relay_type, entry.destination), []).append(entry)
+        for (relay_type, destination), entries in destinations.items():
+            # Delivering the previous destinations may have let the lease on the rest of the batch run out
+            owned = self.renew_lease()
+            entries = [entry for entry in entries if entry.id in owned]
+            if not entries:
+                continue
+            if relay_type == RelayType.EVENT.value:
+                self.deliver_events(routing_key=destination, entries=entries)
+            else:
+                self.deliver_api(entries=entries)
+        self.claimed.clear()
+        return len(batch)
+
+    def claim_batch(self):
+        """
+        Claims the next batch of due entries, skipping the ones other workers are claiming
+        Entries still processing after the visibility timeout belong to a crashed worker and are claimed again
+        :return: list of claimed entries
+        """
+        now = timezone.now()
+        due = Q(status=OutboxStatus.PENDING.value, next_attempt_at__lte=now) | \
+            Q(status=OutboxStatus.PROCESSING.value, locked_until__lt=now)
+        with transaction.atomic():
+            batch = list(RelayOutbox.objects.select_for_update(skip_locked=True).filter(due)
+                         .order_by("next_attempt_at", "id")[:self.batch_size])
+            RelayOutbox.objects.filter(id__in=[entry.id for entry in batch]).update(
+                status=OutboxStatus.PROCESSING.value, attempts=F("attempts") + 1, locked_by=self.worker_id,
+                locked_until=now + timedelta(seconds=self.config.get("VISIBILITY_TIMEOUT", 300)), modified_at=now)
+        for entry in batch:
+            entry.attempts += 1
+            entry.locked_by = self.worker_id
+        self.claimed = {entry.id for entry in batch}
+        if batch:
+            logging.info("Claimed %s relay outbox entries", len(batch))
+        return batch
+
+    def deliver_events(self, routing_key, entries):
+        errors = RabbitMQClient().publish_batch(routing_key, [entry.relay_data for entry in entries])
+        delivered = [entry for entry, error in zip(entries, errors) if not error]
+        self.mark_delivered(delivered)
+        for entry, error in zip(entries, errors):
+            if error:
+                self.mark_failed(entry, error)
+
+    def deliver_api(self, entries):
+        delivered = []
+        for index, entry in enumerate(entries):
+            # Every relay may take as long as the http client's retries and timeouts
+            if entry.id not in self.renew_lease():
+                logging.warning("Relay outbox entry %s was claimed by another worker, skipping it", entry.id)
+                continue
+            try:
+                HttpUtil().publish_message(url=entry.destination, http_method=entry.http_method,
+                                           data=json.dumps(entry.relay_data), headers=entry.headers)
+                delivered.append(entry)
+            except Exception as e:
+                # Retries already happened within the http client, the endpoint is considered down for now
+                for failed_entry in entries[index:]:
+                    self.mark_failed(failed_entry, e)
+                break
+        self.mark_delivered(delivered)
+
+    def renew_lease(self):
+        """
+        Extends the lease on the claimed entries still owned by this worker, the ones claimed by another worker in the
+        meantime are given up
+        :return: ids of the entries still owned
+        """
+        if not self.claimed:
+            return set()
+        with transaction.atomic():
+            owned = set(self.get_owned(self.claimed))
+            RelayOutbox.objects.filter(id__in=owned).update(
+                locked_until=timezone.now() + timedelta(seconds=self.config.get("VISIBILITY_TIMEOUT", 300)))
+        lost = self.claimed - owned
+        if lost:
+            logging.warning("Relay outbox entries %s were claimed by another worker", sorted(lost))
+        self.claimed = owned
+        return owned
+
+    def get_owned(self, entry_ids):
+        """
+        Locks the entries still processing under this worker's claim, to be called within a transaction
+        :param entry_ids:
+        :return: list of the owned entry ids
+        """
+        owned = RelayOutbox.objects.select_for_update().filter(id__in=list(entry_ids), locked_by=self.worker_id,
+                                                               status=OutboxStatus.PROCESSING.value)
+        return list(owned.values_list("id", flat=True))
+
+    def mark_delivered(self, entries):
+        if not entries:
+            return
+        now = timezone.now()
+        with transaction.atomic():
+            owned = self.get_owned([entry.id for entry in entries])
+            RelayOutbox.objects.filter(id__in=owned).update(
+                status=OutboxStatus.DELIVERED.value, delivered_at=now, locked_until=None, modified_at=now)
+            RelayEventLogs.objects.filter(id__in=[entry.relay_log_id for entry in entries if entry.id in owned]).update(
+                status="SUCCESS", modified_at=now)
+        self.claimed.difference_update(entry.id for entry in entries)
+        if len(owned) < len(entries):
+            logging.warning("%s delivered relay outbox entries were claimed by another worker",
+                            len(entries) - len(owned))
+        logging.info("Delivered %s relay outbox entries", len(owned))
+
+    def mark_failed(self, entry, error):
+        """
+        Schedules the entry for a retry with exponential backoff, or fails it once it is out of attempts
+        :param entry:
+        :param error:
+        :return:
+        """
+        message = ("Relay to %s failed: %s" % (entry.destination, str(error)))[:256]
+        logging.warning("%s, attempt %s", message, entry.attempts)
+        self.claimed.discard(entry.id)
+        now = timezone.now()
+        owned = RelayOutbox.objects.filter(id=entry.id, locked_by=self.worker_id,
+                                           status=OutboxStatus.PROCESSING.value)
+        if entry.attempts >= self.config.get("MAX_ATTEMPTS", 10):
+            # The last publish may still be acked by the broker after its confirm timed out
+            relay_status = "UNCONFIRMED" if isinstance(error, PublishConfirmTimeoutException) else "FAILED"
+            with transaction.atomic():
+                if owned.update(status=OutboxStatus.FAILED.value, last_error=message, locked_until=None,
+                                modified_at=now):
+                    RelayEventLogs.objects.filter(id=entry.relay_log_id).update(status=relay_status, reason=message,
+                                                                                modified_at=now)
+            return
+        backoff = min(self.config.get("BACKOFF", 1) * (2 ** (entry.attempts - 1)), self.config.get("MAX_BACKOFF", 300))
+        owned.update(status=OutboxStatus.PENDING.value, last_error=message,
+                     next_attempt_at=now + timedelta(seconds=backoff), locked_by=None, locked_until=None,
+                     modified_at=now)
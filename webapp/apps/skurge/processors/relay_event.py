@@ -1,71 +1,86 @@
 import json
 import logging
-import copy
-import pydash
-import jsonschema
 
-from json_logic import jsonLogic
+from django.conf import settings
 
-from webapp.apps.skurge.models import RelayProcessor, DataProcessor
+from webapp.apps.skurge.models import DataProcessor, RelayOutbox
 from webapp.apps.skurge.constants import RelayType
 from webapp.apps.skurge.common.util import HttpUtil
+from webapp.apps.skurge.common.context import EventContext
+from webapp.apps.skurge.common.logic import JsonLogicRegistry
+from webapp.apps.skurge.common.path import LocatorPlanRegistry
+from webapp.apps.skurge.common.template import TemplateRegistry
+from webapp.apps.skurge.common.schema import SchemaValidatorRegistry
 from webapp.apps.skurge.services.log import RelayLogService
-from webapp.apps.skurge.clients.graphql import GraphQLClient
-from webapp.apps.skurge.clients.event import RabbitMQClient
-from webapp.apps.skurge.serializers.relay_processor import RelayProcessorSerializer
+from webapp.apps.skurge.clients.event import RabbitMQClient, PublishNotConfirmedException, \
+    PublishConfirmTimeoutException
+from webapp.apps.skurge.processors.graphql_fetch import GraphQLFetchCoalescer
 from webapp.apps.skurge.serializers.data_processor import DataProcessorSerializer
 
 
 class RelayEventProcessor:
-    event = None
-    endpoint = None
-    http_method = None
-    headers = {}
-    source_data = {}
-    relay_data = {}
-    external_data = {}
+    """
+    Relays a source event to the destination of a single relay processor.
+    All state is per instance, a processor is created for every relayer so that relayers can run concurrently.
+    """
 
-    def fetch_relay_processors(self, source_event_id):
+    def __init__(self, graphql_fetcher=None, relay_log_service=None):
+        self.destination = RelayDestination()
+        self.source_data = {}
+        self.relay_data = {}
+        self.external_data = {}
+        # Fetcher shared by all relayers of the source event to coalesce identical graphql fetches
+        self.graphql_fetcher = graphql_fetcher if graphql_fetcher else GraphQLFetchCoalescer()
+        self.relay_log_service = relay_log_service if relay_log_service else RelayLogService()
+
+    def prepare_context(self, source_data):
         """
-        Fetches corresponding relay processors for the source event
-        :param source_event_id:
+        Input data becomes part of out external data which can later be used as context data for payload preparation
+        or destination logic in case of API endpoint dynamic fields or finding the event name
+        The source data is shared with the other relayers of the event, it is layered under the fetched data instead of
+        being copied
+        :param source_data:
         :return:
         """
-        relay_processors = RelayProcessor.objects.filter(source_event_id=source_event_id, is_active=True,
-                                                         is_deleted=False).all()
-        if relay_processors:
-            return RelayProcessorSerializer(instance=relay_processors, many=True).data
-        return None
+        self.source_data = source_data
+        self.external_data = EventContext(self.source_data)
 
-    def process_relayer(self, relay_processor, source_data, source_event):
+    def relay(self, relay_processor, source_event):
         """
-        Prepares the relay data, evaluates the endpoint or event and publishes it to the relayed system
+        Publishes the relay data to the destination, or queues it in the relay outbox, and logs the relay
         :param relay_processor:
-        :param source_data:
         :param source_event:
         :return:
         """
-        # Input data becomes part of out external data which can later be used as context data for payload preparation
-        # or destination logic in case of API endpoint dynamic fields or finding the event name
-        self.source_data = source_data
-        self.external_data = copy.deepcopy(self.source_data)
-
-        data_processor = self.get_data_processor(relay_processor=relay_processor)
-        if data_processor:
-            self.fetch_external_data_from_graphql_server(data_processor=data_processor)
-        logging.info("External data has been prepared")
-
-        if not self.prepare_relay_data(relay_processor=relay_processor, data_processor=data_processor,
-                                       source_event=source_event):
+        destination = self.destination.name
+        if getattr(settings, "RELAY_OUTBOX", {}).get("ENABLED"):
+            # Delivered by the relay outbox workers, the outbox entry is saved along with the relay log
+            logging.info("Message to %s has been queued in the relay outbox", destination)
+            self.relay_log_service.log(source=source_event, relay_data=self.relay_data, destination=destination,
+                                       relay_type=relay_processor.get("relay_type"), status="QUEUED",
+                                       outbox_entry=self.get_outbox_entry(relay_processor=relay_processor,
+                                                                          source_event=source_event))
             return
-        if not self.find_destination(relay_processor=relay_processor, source_event=source_event):
+        try:
+            self.publish(relay_processor=relay_processor)
+        except PublishConfirmTimeoutException as e:
+            # Not a failure for sure, the broker may still ack the message, resending it may deliver it twice
+            message = "Message to %s unconfirmed: %s" % (destination, str(e))
+            logging.warning(message)
+            self.relay_log_service.log(source=source_event, relay_data=self.relay_data, destination=destination,
+                                       relay_type=relay_processor.get("relay_type"), status="UNCONFIRMED",
+                                       reason=message[:256])
+            return
+        except PublishNotConfirmedException as e:
+            message = "Message to %s not confirmed: %s" % (destination, str(e))
+            logging.warning(message)
+            self.relay_log_service.log(source=source_event, relay_data=self.relay_data, destination=destination,
+                                       relay_type=relay_processor.get("relay_type"), status="FAILED",
+                                       reason=message[:256])
             return
-
-        self.publish(relay_processor=relay_processor)
-        destination = self.event if self.event else self.endpoint
         logging.info("Message has been relayed to %s", destination)
-        RelayLogService().log(source=source_event, relay_data=self.relay_data, destination=destination,
-                              relay_type=relay_processor.get("relay_type"), status="SUCCESS")
+        self.relay_log_service.log(source=source_event, relay_data=self.relay_data, destination=destination,
+                                   relay_type=relay_processor.get("relay_type"), status="SUCCESS")
 
     def get_data_processor(self, relay_processor):
         """
@@ -75,6 +90,10 @@ class RelayEventProcessor:
         :param relay_processor:
         :return:
         """
+        # Relay processors coming from the event config cache already carry their resolved data processor
+        if "data_processor" in relay_processor:
+            return relay_processor.get("data_processor")
+
         data_processor_id = relay_processor.get("data_processor_id")
         if not data_processor_id:
             return None
@@ -86,7 +105,7 @@ class RelayEventProcessor:
 
     def fetch_external_data_from_graphql_server(self, data_processor):
         """
-        Gets the external data from graphql server if graphql query is present and updates it in the external data dict
+        Gets the external data from graphql server if graphql query is present and layers it over the external data
         Graphql query would be present if you need external data for either of the three cases
         1. Relay data preparation
         2. Event name generation
@@ -95,9 +114,11 @@ class RelayEventProcessor:
         :return:
         """
         if data_processor.get("graphql_query"):
-            graphql_data = GraphQLClient().fetch_data(query=data_processor.get("graphql_query"),
-                                                      variables=self.source_data)
-            self.external_data.update(graphql_data)
+            graphql_data = self.graphql_fetcher.fetch(query=data_processor.get("graphql_query"),
+                                                      variables=self.source_data,
+                                                      cache_ttl=data_processor.get("graphql_cache_ttl"),
+                                                      batched=data_processor.get("graphql_batching", False))
+            self.external_data = self.external_data.new_child(graphql_data)
 
     def prepare_relay_data(self, relay_processor, data_processor, source_event):
         """
@@ -119,8 +140,8 @@ class RelayEventProcessor:
             if not relay_fields:
                 message = "No conditions matched to get the relay fields/output fields mapper"
                 logging.warning(message)
-                RelayLogService().log(source=source_event, relay_data=self.relay_data, status="FAILED",
-                                      reason=message, relay_type=relay_processor.get("relay_type"))
+                self.relay_log_service.log(source=source_event, relay_data=self.relay_data, status="FAILED",
+                                           reason=message, relay_type=relay_processor.get("relay_type"))
                 return False
             self.extract_relay_data(mapper=relay_fields)
             self.add_static_data(data_processor=data_processor)
@@ -128,18 +149,18 @@ class RelayEventProcessor:
             if error_messages:
                 message = ','.join(error_messages)
                 logging.warning(message)
-                RelayLogService().log(source=source_event, relay_data=self.relay_data, status="FAILED",
-                                      reason=message, relay_type=relay_processor.get("relay_type"))
+                self.relay_log_service.log(source=source_event, relay_data=self.relay_data, status="FAILED",
+                                           reason=message, relay_type=relay_processor.get("relay_type"))
                 return False
         return True
 
     def __get_relay_fields(self, relay_field_rules):
         """
-        Uses the relay data locator(json logic) to extract out the actual relay fields
+        Uses the relay data locator(json logic) to extract out the actual relay fields, evaluated by its compiled rule
         :param relay_field_rules:
         :return:
         """
-        return jsonLogic(relay_field_rules, self.external_data)
+        return JsonLogicRegistry().apply(relay_field_rules, self.external_data)
 
     def extract_relay_data(self, mapper):
         """
@@ -147,39 +168,32 @@ class RelayEventProcessor:
         1. key path for the final output payload
         2. value path to extract out from the external data
         With this an output payload can be created which is nested and it can parse any level deep in the external data
-        looking for values
+        looking for values. The paths are parsed once per locator into its compiled plan
         :param mapper:
         :return:
         """
-        for key_path, value_path in mapper.items():
-            value = pydash.get(self.external_data, value_path, default=value_path)
-            pydash.set_(self.relay_data, key_path, value)
+        LocatorPlanRegistry().get_plan(mapper).extract(self.external_data, self.relay_data)
 
     def add_static_data(self, data_processor):
         """
         Adds default values to the final destination payload
+        String values support dynamic string formatting, they are parsed once per default response into compiled
+        templates, and strings without fields are set as they are
         :param data_processor:
         :return:
         """
         static_data = data_processor.get("default_response")
         if static_data:
-            for key_path, value in static_data.items():
-                if isinstance(value, str):
-                    value = value.format(**self.external_data)  # Supports dynamic string formatting
-                pydash.set_(self.relay_data, key_path, value)
+            TemplateRegistry().get_default_response_plan(static_data).apply(self.external_data, self.relay_data)
 
     def validate_relay_data(self, data_processor):
         """
-        Validates the destination data using the validator object
+        Validates the destination data using the compiled validator of the relay schema
         :param data_processor:
         :return:
         """
-        validator = jsonschema.Draft7Validator(data_processor.get("relay_json_schema"))
-        errors = validator.iter_errors(self.relay_data)
-        error_info = []
-        for error in errors:
-            if hasattr(error, "message"):
-                error_info.append(error.message)
+        error_info = SchemaValidatorRegistry().get_errors(schema=data_processor.get("relay_json_schema"),
+                                                          data=self.relay_data)
         if error_info:
             logging.warning("Request Validation Failed. %s", error_info)
             return error_info
@@ -202,32 +216,33 @@ class RelayEventProcessor:
             http_endpoint_map = self.process_http_endpoint_rules(relay_processor=relay_processor,
                                                                  context_data=context_data)
             if http_endpoint_map:
-                unformatted_endpoint = http_endpoint_map.get("http_endpoint", None)
-                self.http_method = http_endpoint_map.get("http_method", None)
-                self.headers = http_endpoint_map.get("headers", None)
                 # Add the dynamic part of the url from the context data
-                self.endpoint = unformatted_endpoint.format(**context_data)
+                self.destination = RelayDestination(
+                    endpoint=TemplateRegistry().format(http_endpoint_map.get("http_endpoint", None), context_data),
+                    http_method=http_endpoint_map.get("http_method", None),
+                    headers=http_endpoint_map.get("headers", None))
 
-            if not (http_endpoint_map and self.endpoint and self.http_method and self.headers):
+            destination = self.destination
+            if not (http_endpoint_map and destination.endpoint and destination.http_method and destination.headers):
                 message = "No valid endpoint, http request or headers found for the source event %s" % source_event
                 logging.warning(message)
-                RelayLogService().log(source=source_event, relay_data=self.relay_data, status="FAILED", reason=message,
-                                      relay_type=relay_processor.get("relay_type"))
+                self.relay_log_service.log(source=source_event, relay_data=self.relay_data, status="FAILED",
+                                           reason=message, relay_type=relay_processor.get("relay_type"))
                 return False
         elif relay_processor.get("relay_type") == RelayType.EVENT.value:
             if not relay_processor.get("relay_event_rules"):
                 message = "Event rules not present in relay processor %s" % relay_processor.get("id")
                 logging.warning(message)
-                RelayLogService().log(source=source_event, status="FAILED", relay_data=self.relay_data, reason=message,
-                                      relay_type=relay_processor.get("relay_type"))
+                self.relay_log_service.log(source=source_event, status="FAILED", relay_data=self.relay_data,
+                                           reason=message, relay_type=relay_processor.get("relay_type"))
                 return False
 
-            self.event = self.process_relay_rules(relay_processor=relay_processor)
-            if not self.event:
+            self.destination = RelayDestination(event=self.process_relay_rules(relay_processor=relay_processor))
+            if not self.destination.event:
                 message = "No valid relay event found for the source event %s" % source_event
                 logging.warning(message)
-                RelayLogService().log(source=source_event, relay_data=self.relay_data, status="FAILED", reason=message,
-                                      relay_type=relay_processor.get("relay_type"))
+                self.relay_log_service.log(source=source_event, relay_data=self.relay_data, status="FAILED",
+                                           reason=message, relay_type=relay_processor.get("relay_type"))
                 return False
         return True
 
@@ -239,7 +254,7 @@ class RelayEventProcessor:
         :param context_data:
         :return:
         """
-        return jsonLogic(relay_processor.get("relay_http_endpoint_rules"), context_data)
+        return JsonLogicRegistry().apply(relay_processor.get("relay_http_endpoint_rules"), context_data)
 
     def process_relay_rules(self, relay_processor):
         """
@@ -249,7 +264,7 @@ class RelayEventProcessor:
         :return:
         """
         context_data = self.get_context_data(relay_processor=relay_processor)
-        return jsonLogic(relay_processor.get("relay_event_rules"), context_data)
+        return JsonLogicRegistry().apply(relay_processor.get("relay_event_rules"), context_data)
 
     def get_context_data(self, relay_processor):
         """
@@ -257,11 +272,21 @@ class RelayEventProcessor:
         :param relay_processor:
         :return:
         """
-        context_data = {}
-        for field, path in relay_processor.get("context_data_locator").items():
-            value = pydash.get(self.external_data, path)
-            context_data[field] = value
-        return context_data
+        return LocatorPlanRegistry().get_plan(relay_processor.get("context_data_locator")).get_values(
+            self.external_data)
+
+    def get_outbox_entry(self, relay_processor, source_event):
+        """
+        Creates the relay outbox entry to deliver the relay data to the destination
+        :param relay_processor:
+        :param source_event:
+        :return:
+        """
+        relay_type = relay_processor.get("relay_type")
+        destination = self.destination
+        return RelayOutbox(source_event_name=source_event, relay_type=relay_type, relay_data=self.relay_data,
+                           destination=destination.event if relay_type == RelayType.EVENT.value else destination.endpoint,
+                           http_method=destination.http_method, headers=destination.headers)
 
     def publish(self, relay_processor):
         """
@@ -270,7 +295,23 @@ class RelayEventProcessor:
         :return:
         """
         if relay_processor.get("relay_type") == RelayType.EVENT.value:
-            RabbitMQClient().publish(self.event, self.relay_data)
+            RabbitMQClient().publish(self.destination.event, self.relay_data)
         elif relay_processor.get("relay_type") == RelayType.API.value:
-            HttpUtil().publish_message(url=self.endpoint, http_method=self.http_method, data=json.dumps(self.relay_data),
-                                       headers=self.headers)
+            HttpUtil().publish_message(url=self.destination.endpoint, http_method=self.destination.http_method,
+                                       data=json.dumps(self.relay_data), headers=self.destination.headers)
+
+
+class RelayDestination:
+    """
+    Event to raise, or api endpoint to call along with its http method and headers, for the relay data
+    """
+
+    def __init__(self, event=None, endpoint=None, http_method=None, headers=None):
+        self.event = event
+        self.endpoint = endpoint
+        self.http_method = http_method
+        self.headers = headers if headers is not None else {}
+
+    @property
+    def name(self):
+        return self.event if self.event else self.endpoint
@@ -1,7 +1,7 @@
 import logging
-import jsonschema
 
-from webapp.apps.skurge.models import SourceEvent
+from webapp.apps.skurge.common.schema import SchemaValidatorRegistry
+from webapp.apps.skurge.services.event_config import EventConfigService
 
 
 class SourceEventProcessor:
@@ -9,35 +9,35 @@ class SourceEventProcessor:
     source_event = None
     source_data = None
     input_schema = None
+    relay_processors = None
 
-    def __init__(self, source_event, source_data):
+    def __init__(self, source_event, source_data, event_config=None):
         self.source_event = source_event
         self.source_data = source_data
+        self.event_config = event_config
 
     def is_source_event_registered(self):
         """
-        Checks if source event is registered in skurge
+        Checks if source event is registered in skurge, using the event config if it was already resolved
         :return:
         """
-        registered_event = SourceEvent.objects.filter(source_event=self.source_event, is_active=True,
-                                                      is_deleted=False).first()
-        if not registered_event:
+        event_config = self.event_config
+        if not event_config:
+            event_config = EventConfigService().get_event_config(source_event=self.source_event)
+        if not event_config:
             return False
-        self.source_event_id = registered_event.id
-        self.input_schema = registered_event.input_json_schema
+        self.event_config = event_config
+        self.source_event_id = event_config.get("id")
+        self.input_schema = event_config.get("input_json_schema")
+        self.relay_processors = event_config.get("relay_processors")
         return True
 
     def validate_source_data(self):
         """
-        Validates in the source data using the validator object
+        Validates in the source data using the compiled validator of the input schema
         :return:
         """
-        validator = jsonschema.Draft7Validator(self.input_schema)
-        errors = validator.iter_errors(self.source_data)
-        error_info = []
-        for error in errors:
-            if hasattr(error, "message"):
-                error_info.append(error.message)
+        error_info = SchemaValidatorRegistry().get_errors(schema=self.input_schema, data=self.source_data)
         if error_info:
             logging.warning("Request Validation Failed. %s", error_info)
             return error_info
@@ -0,0 +1,86 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+
+from webapp.apps.skurge.models import QueuedEvent
+from webapp.apps.skurge.common.exceptions import InvalidInputException, RequestEntityTooLargeException
+from webapp.apps.skurge.processors.event_processor import EventProcessor
+from webapp.apps.skurge.processors.event_queue import EventQueueWorkerPool
+from webapp.apps.skurge.processors.graphql_fetch import GraphQLFetchCoalescer
+from webapp.apps.skurge.services.event_config import EventConfigService
+
+
+class BulkEventService:
+    """
+    Processes many source events of one or more source event names posted in a single request.
+    Configs are resolved once per source event name and graphql results are shared across all the events of the
+    request, so repeated enrichment of the same entity is fetched once. Every event is processed in its own savepoint,
+    a failing event does not affect the others.
+    """
+
+    def process_events(self, items, asynchronous=False):
+        """
+        Processes or, if asynchronous, validates and queues the events
+        :param items: list of {"source_event": <name>, "data": <source data>}
+        :param asynchronous:
+        :return: status of every event in the order of the items along with a summary
+        """
+        self.__validate_input(items)
+        event_configs = {}
+        graphql_fetcher = GraphQLFetchCoalescer()
+        results, queued = [], []
+        for index, item in enumerate(items):
+            if not isinstance(item, dict) or not item.get("source_event") or not isinstance(item.get("data"), dict):
+                results.append({"index": index, "status": "FAILED",
+                                "reason": "Item must have a source_event and a data object"})
+                continue
+            source_event = item.get("source_event")
+            if source_event not in event_configs:
+                event_configs[source_event] = EventConfigService().get_event_config(source_event=source_event)
+            event_processor = EventProcessor(source_event=source_event, source_data=item.get("data"),
+                                             event_config=event_configs[source_event],
+                                             graphql_fetcher=graphql_fetcher)
+            result = {"index": index, "source_event": source_event}
+            if asynchronous:
+                result.update(self.__validate_event(event_processor))
+                if result.get("status") == "ACCEPTED":
+                    queued.append((result, QueuedEvent(source_event_name=source_event, source_data=item.get("data"))))
+            else:
+                result.update(self.__process_event(event_processor))
+            results.append(result)
+
+        if queued:
+            queued_events = QueuedEvent.objects.bulk_create([queued_event for _, queued_event in queued])
+            for (result, _), queued_event in zip(queued, queued_events):
+                result["event_id"] = str(queued_event.event_id)
+                EventQueueWorkerPool.get_instance().dispatch_on_commit(queued_event.id)
+        return {"events": results, "summary": self.__get_summary(results)}
+
+    def __validate_input(self, items):
+        if not isinstance(items, list):
+            raise InvalidInputException("Expected a list of events")
+        max_items = getattr(settings, "BULK_EVENTS", {}).get("MAX_ITEMS", 1000)
+        if len(items) > max_items:
+            raise RequestEntityTooLargeException("At most %s events can be posted at a time" % max_items)
+
+    def __validate_event(self, event_processor):
+        error_message = event_processor.validate_source_event()
+        if error_message:
+            return {"status": "FAILED", "reason": error_message}
+        return {"status": "ACCEPTED"}
+
+    def __process_event(self, event_processor):
+        try:
+            with transaction.atomic():
+                return event_processor.process_event()
+        except Exception as e:
+            message = "Error processing event: %s" % str(e)
+            logging.error(message)
+            return {"status": "FAILED", "reason": message}
+
+    def __get_summary(self, results):
+        summary = {"total": len(results)}
+        for result in results:
+            summary[result["status"]] = summary.get(result["status"], 0) + 1
+        return summary
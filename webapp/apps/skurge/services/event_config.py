@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection, transaction
+
+from webapp.apps.skurge.common.logic import JsonLogicRegistry
+from webapp.apps.skurge.common.path import LocatorPlanRegistry
+from webapp.apps.skurge.common.template import TemplateRegistry
+from webapp.apps.skurge.models import SourceEvent, RelayProcessor, DataProcessor
+from webapp.apps.skurge.serializers.relay_processor import RelayProcessorSerializer
+from webapp.apps.skurge.serializers.data_processor import DataProcessorSerializer
+
+
+class EventConfigCache:
+    """
+    Per worker cache of fully resolved event configs keyed by source event name.
+    Every entry is tagged with the config version it was loaded at. Any committed write to source events, relay
+    processors or data processors bumps the version and thereby invalidates all the cached entries.
+    The version is kept where every worker sees the bump, a db sequence by default or a shared django cache. Workers
+    check it at most once per VERSION_CHECK_INTERVAL, entries additionally expire after the configured TTL.
+    """
+    VERSION_KEY = "skurge:event-config-version"
+    VERSION_SEQUENCE = "skurge_event_config_version"
+
+    _entries = {}
+    _version = (None, None)  # (version, monotonic time it was checked at)
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.config = getattr(settings, "EVENT_CONFIG_CACHE", {})
+
+    def is_enabled(self):
+        if not self.config.get("ENABLED", True):
+            return False
+        # A bump kept in a per process cache would only reach the worker making the write
+        return not (self.get_version_store() == "CACHE" and isinstance(self.get_version_cache(), LocMemCache))
+
+    def get_ttl(self):
+        return self.config.get("TTL", 300)
+
+    def get_version_store(self):
+        return self.config.get("VERSION_STORE", "DATABASE")
+
+    def get_version_cache(self):
+        return caches[self.config.get("VERSION_CACHE_ALIAS", "default")]
+
+    def get_version(self):
+        """
+        Returns the current config version, as last checked by the worker within the check interval
+        :return:
+        """
+        version, checked_at = EventConfigCache._version
+        if checked_at is not None and time.monotonic() - checked_at < self.config.get("VERSION_CHECK_INTERVAL", 1):
+            return version
+        if self.get_version_store() == "CACHE":
+            version = self.get_version_cache().get(self.VERSION_KEY, 0)
+        else:
+            # Sequences are not transactional, the latest value is read even from within a transaction
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT last_value, is_called FROM %s" % self.VERSION_SEQUENCE)
+                last_value, is_called = cursor.fetchone()
+            version = last_value if is_called else 0
+        EventConfigCache._version = (version, time.monotonic())
+        return version
+
+    def bump_version(self):
+        """
+        Bumps the config version, invalidating all cached configs
+        :return:
+        """
+        if self.get_version_store() == "CACHE":
+            version_cache = self.get_version_cache()
+            version_cache.add(self.VERSION_KEY, 0, timeout=None)
+            try:
+                version = version_cache.incr(self.VERSION_KEY)
+            except ValueError:
+                # Key got evicted in between, any value different from the cached entries' version will do
+                version = int(time.time())
+                version_cache.set(self.VERSION_KEY, version, timeout=None)
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT nextval(%s)", [self.VERSION_SEQUENCE])
+                version = cursor.fetchone()[0]
+        # The worker making the write sees it without waiting for the check interval
+        EventConfigCache._version = (version, time.monotonic())
+        logging.info("Event config version bumped to %s", version)
+        return version
+
+    def get(self, source_event, version):
+        """
+        Returns a tuple of (found, config) for the source event at the given version
+        :param source_event:
+        :param version:
+        :return:
+        """
+        entry = self._entries.get(source_event)
+        if not entry:
+            return False, None
+        entry_version, loaded_at, config = entry
+        if entry_version != version or time.monotonic() - loaded_at > self.get_ttl():
+            return False, None
+        return True, config
+
+    def set(self, source_event, version, config):
+        with self._lock:
+            self._entries[source_event] = (version, time.monotonic(), config)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            EventConfigCache._version = (None, None)
+
+
+class EventConfigService:
+
+    def get_event_config(self, source_event):
+        """
+        Gets the resolved config of an active source event, served from the worker cache whenever the config version
+        has not changed since it was loaded. Returns None if the event is not registered or inactive.
+        Cached configs carry the config version they were loaded at under "version".
+        The returned config is shared across requests and must be treated as read only.
+        :param source_event:
+        :return:
+        """
+        config_cache = EventConfigCache()
+        if not config_cache.is_enabled():
+            return self.load_event_config(source_event=source_event)
+
+        # Version is read before loading so that a bump during the load marks the loaded config stale
+        version = config_cache.get_version()
+        found, event_config = config_cache.get(source_event, version)
+        if found:
+            return event_config
+        event_config = self.load_event_config(source_event=source_event)
+        if event_config:
+            # Execution plans are compiled once per source event and config version
+            event_config["version"] = version
+        config_cache.set(source_event, version, event_config)
+        logging.info("Event config for %s loaded at version %s", source_event, version)
+        return event_config
+
+    def load_event_config(self, source_event):
+        """
+        Loads the source event along with its active relay processors and their data processors from db
+        :param source_event:
+        :return:
+        """
+        registered_event = SourceEvent.objects.filter(source_event=source_event, is_active=True,
+                                                      is_deleted=False).first()
+        if not registered_event:
+            return None
+        processors = RelayProcessor.objects.filter(source_event_id=registered_event.id, is_active=True,
+                                                   is_deleted=False).all()
+        relay_processors = [dict(relay_processor) for relay_processor in
+                            RelayProcessorSerializer(instance=processors, many=True).data]
+
+        data_processor_ids = {relay_processor.get("data_processor_id") for relay_processor in relay_processors
+                              if relay_processor.get("data_processor_id")}
+        data_processors = {}
+        if data_processor_ids:
+            for data_processor in DataProcessor.objects.filter(id__in=data_processor_ids).all():
+                data_processors[data_processor.id] = dict(DataProcessorSerializer(instance=data_processor,
+                                                                                  many=False).data)
+        for relay_processor in relay_processors:
+            relay_processor["data_processor"] = data_processors.get(relay_processor.get("data_processor_id"))
+        self.compile_rules(relay_processors=relay_processors)
+
+        return {
+            "id": registered_event.id,
+            "source_event": registered_event.source_event,
+            "input_json_schema": registered_event.input_json_schema,
+            "relay_processors": relay_processors
+        }
+
+    def compile_rules(self, relay_processors):
+        """
+        Compiles the jsonLogic rules, the context data locators and the default responses of the relay processors, so
+        that events are relayed with the compiled rules, paths and templates from the first one on
+        :param relay_processors:
+        :return:
+        """
+        registry = JsonLogicRegistry()
+        for relay_processor in relay_processors:
+            data_processor = relay_processor.get("data_processor") or {}
+            for rule in (relay_processor.get("relay_event_rules"), relay_processor.get("relay_http_endpoint_rules"),
+                         data_processor.get("relay_data_locator")):
+                if rule:
+                    registry.get_rule(rule)
+            if relay_processor.get("context_data_locator"):
+                LocatorPlanRegistry().get_plan(relay_processor.get("context_data_locator"))
+            if data_processor.get("default_response"):
+                TemplateRegistry().get_default_response_plan(data_processor.get("default_response"))
+
+    def invalidate(self):
+        """
+        Invalidates all cached event configs
+        :return:
+        """
+        EventConfigCache().bump_version()
+
+    def invalidate_on_commit(self):
+        """
+        Invalidates the configs cached by this worker right away, and the ones cached by every worker once the current
+        transaction commits. Bumping the version before the commit would let other workers cache the old rows under the
+        new version.
+        :return:
+        """
+        EventConfigCache().clear()
+        transaction.on_commit(self.invalidate)
@@ -0,0 +1,36 @@
+import logging
+
+from webapp.apps.skurge.models import QueuedEvent
+from webapp.apps.skurge.common.exceptions import NotFoundException
+from webapp.apps.skurge.processors.event_processor import EventProcessor
+from webapp.apps.skurge.processors.event_queue import EventQueueWorkerPool
+from webapp.apps.skurge.serializers.queued_event import QueuedEventSerializer
+
+
+class EventQueueService:
+
+    def enqueue(self, source_event, source_data):
+        """
+        Validates the incoming event and queues it for processing by the event queue workers
+        :param source_event:
+        :param source_data:
+        :return:
+        """
+        error_message = EventProcessor(source_event=source_event, source_data=source_data).validate_source_event()
+        if error_message:
+            return {"status": "FAILED", "reason": error_message}
+        queued_event = QueuedEvent.objects.create(source_event_name=source_event, source_data=source_data)
+        EventQueueWorkerPool.get_instance().dispatch_on_commit(queued_event.id)
+        logging.info("Event %s queued with id %s", source_event, queued_event.event_id)
+        return {"status": "ACCEPTED", "event_id": str(queued_event.event_id)}
+
+    def get_queued_event(self, event_id):
+        """
+        Gets the processing status of an event accepted in async mode
+        :param event_id:
+        :return:
+        """
+        queued_event = QueuedEvent.objects.filter(event_id=event_id, is_deleted=False).first()
+        if not queued_event:
+            raise NotFoundException("No event queued with id %s" % event_id)
+        return QueuedEventSerializer(instance=queued_event, many=False).data
@@ -1,13 +1,57 @@
-from webapp.apps.skurge.models import RelayEventLogs
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction, close_old_connections
+
+from webapp.apps.skurge.common.metrics import Metrics
+from webapp.apps.skurge.models import RelayEventLogs, RelayOutbox
 
 
 class RelayLogService:
 
-    def log(self, source, status, destination=None, relay_type=None, relay_data=None, reason=None):
+    def log(self, source, status, destination=None, relay_type=None, relay_data=None, reason=None, outbox_entry=None):
         """
         Logs the skurge event in db
+        :param outbox_entry: Unsaved relay outbox entry to save along with the log, for relays delivered by the outbox
         :return:
         """
+        relay_log = self.get_relay_log(source=source, status=status, destination=destination, relay_type=relay_type,
+                                       relay_data=relay_data, reason=reason)
+        if not outbox_entry and RelayLogWriter.is_enabled():
+            RelayLogWriter.get_instance().write([relay_log])
+            return
+        with transaction.atomic():
+            relay_log.save()
+            if outbox_entry:
+                outbox_entry.relay_log_id = relay_log.id
+                outbox_entry.save()
+
+    def bulk_log(self, relay_logs, outbox=None):
+        """
+        Logs the collected relay logs in db with a single insert
+        :param relay_logs: list of unsaved RelayEventLogs
+        :param outbox: list of (relay log, unsaved relay outbox entry) to save along with the logs
+        :return:
+        """
+        if not relay_logs:
+            return
+        # Logs having outbox entries are saved in the transaction of their entries
+        if not outbox and RelayLogWriter.is_enabled():
+            RelayLogWriter.get_instance().write(relay_logs)
+            return
+        with transaction.atomic():
+            RelayEventLogs.objects.bulk_create(relay_logs)
+            if outbox:
+                for relay_log, outbox_entry in outbox:
+                    outbox_entry.relay_log_id = relay_log.id
+                RelayOutbox.objects.bulk_create([outbox_entry for _, outbox_entry in outbox])
+
+    def get_relay_log(self, source, status, destination=None, relay_type=None, relay_data=None, reason=None):
         relay_logs_json = {
             "source_event_name": source,
             "destination_relay_name": destination,
@@ -16,5 +60,125 @@ class RelayLogService:
             "status": status,
             "reason": reason
         }
-        relay_log = RelayEventLogs(**relay_logs_json)
-        relay_log.save()
+        return RelayEventLogs(**relay_logs_json)
+
+
+class RelayLogCollector(RelayLogService):
+    """
+    Collects the relay logs of a relayer in memory instead of writing them one by one.
+    Relayers running on fan-out threads log through a collector so that they never touch the db, the collected logs
+    are written by the request thread within its own transaction.
+    """
+
+    def __init__(self):
+        self.relay_logs = []
+        self.outbox = []
+        self.lock = threading.Lock()
+
+    def log(self, source, status, destination=None, relay_type=None, relay_data=None, reason=None, outbox_entry=None):
+        relay_log = self.get_relay_log(source=source, status=status, destination=destination, relay_type=relay_type,
+                                       relay_data=relay_data, reason=reason)
+        with self.lock:
+            self.relay_logs.append(relay_log)
+            if outbox_entry:
+                self.outbox.append((relay_log, outbox_entry))
+
+
+class RelayLogWriter:
+    """
+    Per worker write-behind buffer for relay logs.
+    Logs are buffered in memory and written by a background thread with bulk inserts, once MAX_BATCH_SIZE logs are
+    buffered or FLUSH_INTERVAL_MS has passed, and when the worker exits. Relays do not wait on the db for their logs,
+    logs are written outside the request transaction and logs still buffered are lost if the worker is killed.
+    The buffer is bounded, once it is full new logs are dropped or, with the BLOCK policy, the caller waits for room
+    up to BLOCK_TIMEOUT before dropping them. Written, dropped and flushed counts are kept as relay_logs.* metrics.
+    """
+    DROP = "DROP"
+    BLOCK = "BLOCK"
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self.config = getattr(settings, "RELAY_LOG_WRITER", {})
+        self.max_batch_size = self.config.get("MAX_BATCH_SIZE", 500)
+        self.flush_interval = self.config.get("FLUSH_INTERVAL_MS", 1000) / 1000.0
+        self.policy = self.config.get("POLICY", self.DROP)
+        self.pid = os.getpid()
+        self.buffer = queue.Queue(maxsize=self.config.get("MAX_BUFFER_SIZE", 10000))
+        self.thread = threading.Thread(target=self.run, name="relay-log-writer", daemon=True)
+
+    @staticmethod
+    def is_enabled():
+        return getattr(settings, "RELAY_LOG_WRITER", {}).get("ENABLED", False)
+
+    @classmethod
+    def get_instance(cls):
+        """
+        Gets the started log writer of the current worker process
+        :return:
+        """
+        instance = cls._instance
+        if instance and instance.pid == os.getpid():
+            return instance
+        with cls._instance_lock:
+            if not cls._instance or cls._instance.pid != os.getpid():
+                instance = cls()
+                instance.thread.start()
+                atexit.register(instance.flush)
+                cls._instance = instance
+            return cls._instance
+
+    def write(self, relay_logs):
+        """
+        Buffers the relay logs to be written, dropping them if the buffer stays full
+        :param relay_logs:
+        :return:
+        """
+        for index, relay_log in enumerate(relay_logs):
+            try:
+                if self.policy == self.BLOCK:
+                    self.buffer.put(relay_log, timeout=self.config.get("BLOCK_TIMEOUT", 1))
+                else:
+                    self.buffer.put_nowait(relay_log)
+            except queue.Full:
+                dropped = len(relay_logs) - index
+                Metrics().incr("relay_logs.dropped", dropped)
+                logging.warning("Relay log buffer full, dropped %s relay logs", dropped)
+                return
+
+    def flush(self):
+        """
+        Waits until all buffered logs are written
+        :return:
+        """
+        self.buffer.join()
+
+    def run(self):
+        """
+        Writes the buffered logs in batches, runs on the writer thread
+        :return:
+        """
+        while True:
+            batch = [self.buffer.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self.buffer.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            self.write_batch(batch)
+
+    def write_batch(self, batch):
+        metrics = Metrics()
+        try:
+            RelayEventLogs.objects.bulk_create(batch)
+            metrics.incr("relay_logs.written", len(batch))
+            metrics.incr("relay_logs.flushes")
+        except Exception as e:
+            metrics.incr("relay_logs.dropped", len(batch))
+            logging.error("Error writing %s relay logs: %s", len(batch), str(e))
+        finally:
+            close_old_connections()
+            for _ in batch:
+                self.buffer.task_done()
@@ -95,6 +95,9 @@ class RelayEventService:
         """
         ValidityUtil().is_valid_json_schema(schema=data.get("relay_json_schema"))
         ValidityUtil().is_valid_graphql_query(query=data.get("graphql_query"))
+        cache_ttl = data.get("graphql_cache_ttl")
+        if cache_ttl is not None and (not isinstance(cache_ttl, int) or cache_ttl < 0):
+            raise InvalidInputException("Graphql cache ttl should be a non negative number of seconds")
 
     def __validate_relay_processor(self, data):
         """
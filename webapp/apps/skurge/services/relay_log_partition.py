@@ -0,0 +1,122 @@
+import logging
+import re
+from datetime import datetime, timezone
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from webapp.apps.skurge.models import RelayEventLogs
+
+
+class RelayLogPartitionService:
+    """
+    Maintains the monthly partitions of relay_logs, creating the partitions of the months ahead and dropping, or
+    detaching as archives, the partitions past retention. Run it periodically, eg. daily from cron.
+    """
+    BOUND_PATTERN = re.compile(r"FROM \((?:MINVALUE|'(?P<lower>[^']+)')\) TO \((?:MAXVALUE|'(?P<upper>[^']+)')\)")
+    PARTITION_PREFIX = "relay_logs_p"
+    ARCHIVE_PREFIX = "relay_logs_archive_"
+
+    def __init__(self, months_ahead=None, retention_months=None, archive=None):
+        """
+        :param months_ahead: Months to create partitions for beyond the current one
+        :param retention_months: Full months of logs kept before the current one
+        :param archive: Detaches expired partitions as standalone tables instead of dropping them
+        Defaults are specified in settings as RELAY_LOG_PARTITIONS
+        """
+        config = getattr(settings, "RELAY_LOG_PARTITIONS", {})
+        self.table = RelayEventLogs._meta.db_table
+        self.months_ahead = months_ahead if months_ahead is not None else config.get("MONTHS_AHEAD", 3)
+        self.retention_months = retention_months if retention_months is not None else \
+            config.get("RETENTION_MONTHS", 6)
+        self.archive = archive if archive is not None else config.get("ARCHIVE", False)
+
+    def get_partitions(self):
+        """
+        Lists the range partitions of relay_logs, the default partition is left out
+        :return: list of (name, lower bound, upper bound) by lower bound, bounds are None when unbounded
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent = %s::regclass", [self.table])
+            rows = cursor.fetchall()
+        partitions = []
+        for name, bound in rows:
+            match = self.BOUND_PATTERN.search(bound)
+            if not match:
+                continue
+            lower, upper = match.group("lower"), match.group("upper")
+            partitions.append((name, parse_datetime(lower) if lower else None,
+                               parse_datetime(upper) if upper else None))
+        return sorted(partitions, key=lambda partition: partition[1] or datetime.min.replace(tzinfo=timezone.utc))
+
+    def create_partitions(self, now=None):
+        """
+        Creates the partitions of the current month and the months ahead not covered by a partition yet
+        :param now: Time to plan the partitions from, defaults to the current time
+        :return: Names of the partitions created
+        """
+        current_month = self.get_month_start(now)
+        partitions = self.get_partitions()
+        created = []
+        for offset in range(self.months_ahead + 1):
+            month_start = current_month + relativedelta(months=offset)
+            if any(self.covers(partition, month_start) for partition in partitions):
+                continue
+            name = "%s%s" % (self.PARTITION_PREFIX, month_start.strftime("%Y_%m"))
+            # Fails if the default partition holds logs of the month, they need to be moved out first
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(
+                    "CREATE TABLE %s PARTITION OF %s FOR VALUES FROM (%%s) TO (%%s)" % (
+                        connection.ops.quote_name(name), connection.ops.quote_name(self.table)),
+                    [month_start, month_start + relativedelta(months=1)])
+            logging.info("Created relay log partition %s", name)
+            created.append(name)
+        return created
+
+    def get_expired_partitions(self, now=None):
+        """
+        Lists the partitions holding only logs older than the retention
+        :param now:
+        :return: Names of the expired partitions
+        """
+        cutoff = self.get_month_start(now) - relativedelta(months=self.retention_months)
+        return [name for name, _, upper in self.get_partitions() if upper is not None and upper <= cutoff]
+
+    def prune_partitions(self, now=None):
+        """
+        Drops the expired partitions, or detaches them and renames them as archives when archiving is enabled
+        :param now:
+        :return: Names of the partitions pruned
+        """
+        pruned = []
+        for name in self.get_expired_partitions(now):
+            with transaction.atomic(), connection.cursor() as cursor:
+                if self.archive:
+                    suffix = name[len(self.PARTITION_PREFIX):] if name.startswith(self.PARTITION_PREFIX) else \
+                        name[len(self.table) + 1:]
+                    archive = self.ARCHIVE_PREFIX + suffix
+                    cursor.execute("ALTER TABLE %s DETACH PARTITION %s" % (
+                        connection.ops.quote_name(self.table), connection.ops.quote_name(name)))
+                    cursor.execute("ALTER TABLE %s RENAME TO %s" % (
+                        connection.ops.quote_name(name), connection.ops.quote_name(archive)))
+                    logging.info("Archived relay log partition %s as %s", name, archive)
+                else:
+                    cursor.execute("DROP TABLE %s" % connection.ops.quote_name(name))
+                    logging.info("Dropped relay log partition %s", name)
+            pruned.append(name)
+        return pruned
+
+    @staticmethod
+    def covers(partition, moment):
+        _, lower, upper = partition
+        return (lower is None or lower <= moment) and (upper is None or moment < upper)
+
+    @staticmethod
+    def get_month_start(now=None):
+        now = (now or datetime.now(timezone.utc)).astimezone(timezone.utc)
+        return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
@@ -0,0 +1,16 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from webapp.apps.skurge.models import SourceEvent, RelayProcessor, DataProcessor
+from webapp.apps.skurge.services.event_config import EventConfigService
+
+
+@receiver(post_save, sender=SourceEvent)
+@receiver(post_save, sender=RelayProcessor)
+@receiver(post_save, sender=DataProcessor)
+def invalidate_event_config(sender, **kwargs):
+    """
+    Any write to the config tables, be it through SourceEventService, RelayEventService or the admin, invalidates the
+    event configs cached by the workers once committed
+    """
+    EventConfigService().invalidate_on_commit()
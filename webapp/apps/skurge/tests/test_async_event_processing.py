@@ -0,0 +1,57 @@
+import uuid
+from unittest.mock import patch
+from rest_framework.test import APITestCase
+from rest_framework import status
+from django.urls import reverse
+from webapp.apps.skurge.tests.common.util import add_sample_data, mocked_get_data_from_graphql, mocked_publish
+from webapp.apps.skurge.constants import RelayType
+from webapp.apps.skurge.models import QueuedEvent, RelayEventLogs
+from webapp.apps.skurge.processors.event_queue import QueuedEventProcessor
+
+
+class AsyncProcessEventTest(APITestCase):
+
+    def post_async_event(self, event_name, data=None):
+        return self.client.post(path=reverse(viewname='skurge-relayer', kwargs={'event_name': event_name}) + '?async=true',
+                                data=data, format='json')
+
+    @patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', mocked_publish)
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_process_event_async(self):
+        """
+            Test an event is accepted and queued in async mode, then processed by the event queue worker.
+        """
+        source_event = add_sample_data(RelayType.EVENT)[0]
+        response = self.post_async_event(source_event['source_event'], data={'user_id': 1234})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['response']['status'], 'ACCEPTED')
+        event_id = response.data['response']['event_id']
+        queued_event = QueuedEvent.objects.get(event_id=event_id)
+        self.assertEqual(queued_event.status, 'PENDING')
+        self.assertFalse(RelayEventLogs.objects.filter(source_event_name=source_event['source_event']).exists())
+
+        self.assertIsNotNone(QueuedEventProcessor().process(queued_event.id))
+        self.assertIsNone(QueuedEventProcessor().process(queued_event.id))  # Already processed
+        response = self.client.get(path=reverse(viewname='get-queued-event', kwargs={'event_id': event_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['response']['status'], 'SUCCESS')
+        self.assertEqual(response.data['response']['attempts'], 1)
+        self.assertTrue(RelayEventLogs.objects.filter(source_event_name=source_event['source_event'],
+                                                      status='SUCCESS').exists())
+
+    def test_process_event_async_with_invalid_payload(self):
+        """
+            Test an event with invalid payload is rejected in async mode without being queued.
+        """
+        source_event = add_sample_data()[0]
+        response = self.post_async_event(source_event['source_event'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['response']['status'], 'FAILED')
+        self.assertFalse(QueuedEvent.objects.exists())
+
+    def test_get_unknown_queued_event(self):
+        """
+            Test status lookup of an event id that was never queued.
+        """
+        response = self.client.get(path=reverse(viewname='get-queued-event', kwargs={'event_id': uuid.uuid4()}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,71 @@
+import json
+from unittest.mock import patch, MagicMock
+from rest_framework.test import APITestCase
+from rest_framework import status
+from django.test import override_settings
+from django.urls import reverse
+from webapp.apps.skurge.tests.common.util import add_sample_data, mocked_get_data_from_graphql, mocked_publish
+from webapp.apps.skurge.constants import RelayType
+from webapp.apps.skurge.models import QueuedEvent
+
+
+@patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', mocked_publish)
+class BulkProcessEventTest(APITestCase):
+
+    def test_bulk_process_events(self):
+        """
+            Test every event of a bulk request is processed and gets its own status.
+        """
+        source_event = add_sample_data(RelayType.EVENT)[0]['source_event']
+        events = [{"source_event": source_event, "data": {"user_id": 1234}},
+                  {"source_event": source_event, "data": {"user_id": 1234}},
+                  {"source_event": source_event, "data": {}},
+                  {"source_event": "UNREGISTERED_EVENT", "data": {"user_id": 1234}},
+                  {"data": {"user_id": 1234}}]
+        fetch_data = MagicMock(side_effect=mocked_get_data_from_graphql)
+        with patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', fetch_data):
+            response = self.client.post(path=reverse(viewname='skurge-bulk-relayer'), data=events, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['response']['events']
+        self.assertEqual([result['status'] for result in results], ['SUCCESS', 'SUCCESS', 'FAILED', 'FAILED', 'FAILED'])
+        self.assertEqual([result['index'] for result in results], list(range(5)))
+        self.assertEqual(response.data['response']['summary'], {'total': 5, 'SUCCESS': 2, 'FAILED': 3})
+        self.assertEqual(fetch_data.call_count, 1)  # Shared across the events of the request
+
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_bulk_process_ndjson_events(self):
+        """
+            Test events posted as newline delimited json.
+        """
+        source_event = add_sample_data(RelayType.EVENT)[0]['source_event']
+        body = "\n".join(json.dumps({"source_event": source_event, "data": {"user_id": user_id}})
+                         for user_id in [1, 2, 3])
+        response = self.client.post(path=reverse(viewname='skurge-bulk-relayer'), data=body,
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.data['response']['summary'], {'total': 3, 'SUCCESS': 3})
+
+        response = self.client.post(path=reverse(viewname='skurge-bulk-relayer'), data=body + "\n{",
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_queue_events(self):
+        """
+            Test valid events of a bulk request are queued in async mode.
+        """
+        source_event = add_sample_data(RelayType.EVENT)[0]['source_event']
+        events = [{"source_event": source_event, "data": {"user_id": 1234}},
+                  {"source_event": source_event, "data": {}}]
+        response = self.client.post(path=reverse(viewname='skurge-bulk-relayer') + '?async=true', data=events,
+                                    format='json')
+        results = response.data['response']['events']
+        self.assertEqual([result['status'] for result in results], ['ACCEPTED', 'FAILED'])
+        self.assertTrue(QueuedEvent.objects.filter(event_id=results[0]['event_id'], status='PENDING').exists())
+
+    @override_settings(BULK_EVENTS={"MAX_ITEMS": 1})
+    def test_bulk_process_too_many_events(self):
+        """
+            Test bulk requests beyond the max number of events are rejected.
+        """
+        events = [{"source_event": "TEST_EVENT", "data": {"user_id": user_id}} for user_id in [1, 2]]
+        response = self.client.post(path=reverse(viewname='skurge-bulk-relayer'), data=events, format='json')
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
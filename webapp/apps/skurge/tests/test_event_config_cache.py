@@ -0,0 +1,64 @@
+from rest_framework.test import APITestCase
+from rest_framework import status
+from django.db import transaction
+from django.test import TransactionTestCase
+from django.urls import reverse
+from webapp.apps.skurge.services.event_config import EventConfigService, EventConfigCache
+from webapp.apps.skurge.tests.common.util import add_sample_data, update_relay_processor
+
+
+class EventConfigCacheTest(APITestCase):
+
+    def setUp(self):
+        self.source_event, self.data_processor, self.relay_processor = add_sample_data()
+
+    def test_event_config_served_from_cache(self):
+        """
+            Test resolved event config is loaded once and then served without hitting the db.
+        """
+        event_config = EventConfigService().get_event_config(self.source_event['source_event'])
+        self.assertEqual(event_config['id'], self.source_event['id'])
+        self.assertEqual(event_config['relay_processors'][0]['data_processor']['id'], self.data_processor['id'])
+        with self.assertNumQueries(0):
+            self.assertEqual(EventConfigService().get_event_config(self.source_event['source_event']), event_config)
+
+    def test_event_config_invalidated_on_update(self):
+        """
+            Test updating a relay processor invalidates the cached event config.
+        """
+        EventConfigService().get_event_config(self.source_event['source_event'])
+        update_relay_processor(self.relay_processor['id'], {'is_active': False})
+        event_config = EventConfigService().get_event_config(self.source_event['source_event'])
+        self.assertEqual(event_config['relay_processors'], [])
+
+    def test_event_config_invalidated_on_update_through_api(self):
+        """
+            Test updating a registered event through the api invalidates the cached event config.
+        """
+        EventConfigService().get_event_config(self.source_event['source_event'])
+        self.source_event['is_active'] = False
+        response = self.client.put(path=reverse(viewname='get-update-registered-event', kwargs={'event_id': self.source_event['id']}),
+                                   data=self.source_event, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(EventConfigService().get_event_config(self.source_event['source_event']))
+
+
+class EventConfigVersionTest(TransactionTestCase):
+
+    def setUp(self):
+        self.source_event, self.data_processor, self.relay_processor = add_sample_data()
+
+    def test_version_bumped_for_every_worker_on_commit(self):
+        """
+            Test config writes bump the shared version once committed, so other workers do not cache uncommitted rows.
+        """
+        config_cache = EventConfigCache()
+        version = config_cache.get_version()
+        with transaction.atomic():
+            update_relay_processor(self.relay_processor['id'], {'is_active': False})
+            EventConfigCache._version = (None, None)  # As seen by another worker
+            self.assertEqual(config_cache.get_version(), version)
+        EventConfigCache._version = (None, None)
+        self.assertGreater(config_cache.get_version(), version)
+        self.assertEqual(EventConfigService().get_event_config(self.source_event['source_event'])['relay_processors'],
+                         [])
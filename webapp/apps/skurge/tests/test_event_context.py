@@ -0,0 +1,70 @@
+import copy
+from unittest.mock import patch
+from django.test import SimpleTestCase
+from webapp.apps.skurge.common.context import EventContext
+from webapp.apps.skurge.processors.relay_event import RelayEventProcessor
+from webapp.apps.skurge.tests.common.constants import TestData
+from webapp.apps.skurge.tests.common.util import mocked_get_data_from_graphql
+
+
+class EventContextTest(SimpleTestCase):
+
+    def test_layers_looked_up_without_copying(self):
+        """
+            Test fetched data is layered over the source data, which is neither copied nor modified.
+        """
+        source_data = {"user_id": 1234, "userDetails": {"name": "source"}, "items": [1, 2]}
+        context = EventContext(source_data)
+        fetched = context.new_child({"userDetails": {"name": "fetched"}})
+        self.assertEqual(fetched["userDetails"], {"name": "fetched"})
+        self.assertIs(fetched["items"], source_data["items"])
+        self.assertEqual(context["userDetails"], {"name": "source"})
+        self.assertEqual(set(fetched), {"user_id", "userDetails", "items"})
+
+    def test_writes_copied_into_own_layer(self):
+        """
+            Test values set on a context go to a layer of its own and keys can not be removed.
+        """
+        source_data = {"user_id": 1234}
+        context = EventContext(source_data)
+        context["user_id"] = 1
+        context.update(country_code="IN")
+        self.assertEqual((context["user_id"], context["country_code"]), (1, "IN"))
+        self.assertEqual(source_data, {"user_id": 1234})
+        with self.assertRaises(TypeError):
+            del context["user_id"]
+
+    def test_new_child_with_keyword_layer(self):
+        """
+            Test keys passed to new_child are layered like ChainMap.new_child, without updating the mapping given.
+        """
+        fetched_data = {"country_code": "IN"}
+        context = EventContext({"user_id": 1234})
+        self.assertEqual(dict(context.new_child(country_code="US")), {"user_id": 1234, "country_code": "US"})
+        child = context.new_child(fetched_data, name="user")
+        self.assertEqual(dict(child), {"user_id": 1234, "country_code": "IN", "name": "user"})
+        self.assertEqual(fetched_data, {"country_code": "IN"})
+
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_relayers_share_source_data(self):
+        """
+            Test relay data is prepared without copying or modifying the source data shared by the relayers.
+        """
+        source_data = {"user_id": 1234, "payload": {"lines": [{"sku": i} for i in range(100)]}}
+        snapshot = copy.deepcopy(source_data)
+        data_processor = TestData.get_data_processor()
+        data_processor["relay_data_locator"]["if"][1]["lines"] = "payload.lines"
+        for _ in range(2):
+            relay_event_processor = RelayEventProcessor()
+            relay_event_processor.source_data = source_data
+            relay_event_processor.external_data = EventContext(source_data)
+            relay_event_processor.fetch_external_data_from_graphql_server(data_processor=data_processor)
+            self.assertIs(relay_event_processor.external_data["payload"], source_data["payload"])
+            relay_fields = relay_event_processor._RelayEventProcessor__get_relay_fields(
+                data_processor["relay_data_locator"])
+            relay_event_processor.extract_relay_data(mapper=relay_fields)
+            # Only the located nested value is copied
+            self.assertEqual(relay_event_processor.relay_data["lines"], snapshot["payload"]["lines"])
+            self.assertIsNot(relay_event_processor.relay_data["lines"], source_data["payload"]["lines"])
+            self.assertEqual(relay_event_processor.relay_data["template_data"], {"name": "aj"})
+        self.assertEqual(source_data, snapshot)
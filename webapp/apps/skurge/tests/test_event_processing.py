@@ -1,10 +1,15 @@
-from unittest.mock import patch
+import threading
+from unittest.mock import patch, MagicMock
+from django.test import override_settings
+from django.urls import reverse
 from rest_framework.test import APITestCase
 from rest_framework import status
-from django.urls import reverse
 from webapp.apps.skurge.tests.common.util import add_sample_data, mocked_get_data_from_graphql, \
-    mocked_publish, update_relay_processor, update_data_processor
+    mocked_publish, update_relay_processor, update_data_processor, add_sample_relay_processor
 from webapp.apps.skurge.constants import RelayType
+from webapp.apps.skurge.common.metrics import Metrics
+from webapp.apps.skurge.models import RelayEventLogs
+from webapp.apps.skurge.processors.source_event import SourceEventProcessor
 
 
 class ProcessEventTest(APITestCase):
@@ -139,3 +144,127 @@ class ProcessEventTest(APITestCase):
                                     data={'user_id': 1234}, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['response']['status'], 'SUCCESS')
+
+    @patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', mocked_publish)
+    @patch('webapp.apps.skurge.common.util.HttpUtil.publish_message', mocked_publish)
+    def test_process_event_coalesces_graphql_fetches(self):
+        """
+            Test relayers sharing a data processor fetch graphql data once per event.
+        """
+        source_event, data_processor, _ = add_sample_data(RelayType.EVENT)
+        add_sample_relay_processor(source_event_id=source_event['id'], data_processor_id=data_processor['id'],
+                                   relay_type=RelayType.API)
+        coalesced_fetches = Metrics().get('graphql.coalesced_fetches')
+        fetch_data = MagicMock(side_effect=mocked_get_data_from_graphql)
+        with patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', fetch_data):
+            response = self.client.post(path=reverse(viewname='skurge-relayer', kwargs={'event_name': source_event['source_event']}),
+                                        data={'user_id': 1234}, format='json')
+        self.assertEqual(response.data['response']['status'], 'SUCCESS')
+        self.assertEqual(fetch_data.call_count, 1)
+        self.assertEqual(Metrics().get('graphql.coalesced_fetches') - coalesced_fetches, 1)
+
+    @patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', mocked_publish)
+    @patch('webapp.apps.skurge.common.util.HttpUtil.publish_message', mocked_publish)
+    def test_process_event_with_graphql_cache_ttl(self):
+        """
+            Test graphql responses are cached across events when data processor has a graphql cache ttl.
+        """
+        source_event, data_processor, _ = add_sample_data(RelayType.EVENT)
+        update_data_processor(data_processor['id'], {'graphql_cache_ttl': 60})
+        cache_hits = Metrics().get('graphql.cache_hits')
+        fetch_data = MagicMock(side_effect=mocked_get_data_from_graphql)
+        with patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', fetch_data):
+            for user_id in [4321, 4321, 9876]:
+                response = self.client.post(path=reverse(viewname='skurge-relayer', kwargs={'event_name': source_event['source_event']}),
+                                            data={'user_id': user_id}, format='json')
+                self.assertEqual(response.data['response']['status'], 'SUCCESS')
+        self.assertEqual(fetch_data.call_count, 2)
+        self.assertEqual(Metrics().get('graphql.cache_hits') - cache_hits, 1)
+
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_process_event_relays_concurrently(self):
+        """
+            Test relayers of an event run concurrently, each one publishing while the other one is in flight.
+        """
+        source_event, data_processor, _ = add_sample_data(RelayType.EVENT)
+        add_sample_relay_processor(source_event_id=source_event['id'], data_processor_id=data_processor['id'],
+                                   relay_type=RelayType.API)
+        in_flight = threading.Barrier(2, timeout=5)  # Broken if the relayers publish one after the other
+        publish = MagicMock(side_effect=lambda *args, **kwargs: in_flight.wait())
+        with patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', publish), \
+                patch('webapp.apps.skurge.common.util.HttpUtil.publish_message', publish):
+            response = self.client.post(path=reverse(viewname='skurge-relayer', kwargs={'event_name': source_event['source_event']}),
+                                        data={'user_id': 1234}, format='json')
+        self.assertEqual(response.data['response']['status'], 'SUCCESS')
+        statuses = RelayEventLogs.objects.filter(source_event_name=source_event['source_event']).values_list('status', flat=True)
+        self.assertEqual(list(statuses), ['SUCCESS', 'SUCCESS'])
+
+    @patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', mocked_publish)
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_process_event_isolates_relayer_errors(self):
+        """
+            Test a failing relayer is logged as failed without affecting the other relayers of the event.
+        """
+        source_event, data_processor, _ = add_sample_data(RelayType.EVENT)
+        add_sample_relay_processor(source_event_id=source_event['id'], data_processor_id=data_processor['id'],
+                                   relay_type=RelayType.API)
+        publish_message = MagicMock(side_effect=Exception("Connection refused"))
+        with patch('webapp.apps.skurge.common.util.HttpUtil.publish_message', publish_message):
+            response = self.client.post(path=reverse(viewname='skurge-relayer', kwargs={'event_name': source_event['source_event']}),
+                                        data={'user_id': 1234}, format='json')
+        self.assertEqual(response.data['response']['status'], 'SUCCESS')
+        relay_logs = RelayEventLogs.objects.filter(source_event_name=source_event['source_event'])
+        self.assertEqual(relay_logs.filter(status='SUCCESS', relay_type=RelayType.EVENT.value).count(), 1)
+        failed_log = relay_logs.get(status='FAILED')
+        self.assertEqual(failed_log.relay_type, RelayType.API.value)
+        self.assertIn("Connection refused", failed_log.reason)
+
+    @override_settings(GRAPHQL_PREFETCH={'ENABLED': True})
+    @patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', mocked_publish)
+    @patch('webapp.apps.skurge.common.util.HttpUtil.publish_message', mocked_publish)
+    def test_process_event_prefetches_graphql_data(self):
+        """
+            Test graphql data is fetched while the source data is validated when prefetching is enabled.
+        """
+        source_event, data_processor, _ = add_sample_data(RelayType.EVENT)
+        add_sample_relay_processor(source_event_id=source_event['id'], data_processor_id=data_processor['id'],
+                                   relay_type=RelayType.API)
+        fetch_started, in_flight = threading.Event(), []
+        validate_source_data = SourceEventProcessor.validate_source_data
+
+        def fetch_data(*args, **kwargs):
+            fetch_started.set()
+            return mocked_get_data_from_graphql(*args, **kwargs)
+
+        def validate(processor):
+            in_flight.append(fetch_started.wait(timeout=5))  # Times out if the fetch waits for the validation
+            return validate_source_data(processor)
+
+        fetch_data = MagicMock(side_effect=fetch_data)
+        prefetches = Metrics().get('graphql.prefetches')
+        with patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', fetch_data), \
+                patch.object(SourceEventProcessor, 'validate_source_data', validate):
+            response = self.client.post(path=reverse(viewname='skurge-relayer', kwargs={'event_name': source_event['source_event']}),
+                                        data={'user_id': 1234}, format='json')
+        self.assertEqual(response.data['response']['status'], 'SUCCESS')
+        self.assertEqual(in_flight, [True])
+        self.assertEqual(fetch_data.call_count, 1)
+        self.assertEqual(Metrics().get('graphql.prefetches') - prefetches, 1)
+        statuses = RelayEventLogs.objects.filter(source_event_name=source_event['source_event']).values_list('status', flat=True)
+        self.assertEqual(list(statuses), ['SUCCESS', 'SUCCESS'])
+
+    @override_settings(GRAPHQL_PREFETCH={'ENABLED': True})
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_process_event_discards_prefetch_of_invalid_payload(self):
+        """
+            Test prefetched graphql data is discarded when the source data is invalid.
+        """
+        source_event = add_sample_data()[0]
+        discarded_prefetches = Metrics().get('graphql.discarded_prefetches')
+        publish = MagicMock()
+        with patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', publish):
+            response = self.client.post(path=reverse(viewname='skurge-relayer', kwargs={'event_name': source_event['source_event']}),
+                                        data={'user_id': 'abc'}, format='json')
+        self.assertEqual(response.data['response']['status'], 'FAILED')
+        self.assertEqual(Metrics().get('graphql.discarded_prefetches') - discarded_prefetches, 1)
+        publish.assert_not_called()
@@ -0,0 +1,129 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from webapp.apps.skurge.tests.common.util import add_sample_data, mocked_get_data_from_graphql, mocked_publish
+from webapp.apps.skurge.constants import RelayType
+from webapp.apps.skurge.models import QueuedEvent
+from webapp.apps.skurge.processors.event_queue import EventQueueWorker
+
+
+def add_queued_events(source_event, count, **kwargs):
+    return [QueuedEvent.objects.create(source_event_name=source_event, source_data={'user_id': 1234}, **kwargs)
+            for _ in range(count)]
+
+
+@override_settings(EVENT_QUEUE={"MAX_ATTEMPTS": 3, "VISIBILITY_TIMEOUT": 60})
+class EventQueueWorkerTest(APITestCase):
+
+    @patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', mocked_publish)
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_worker_processes_batches(self):
+        """
+            Test the worker claims and processes pending events in batches of the batch size.
+        """
+        source_event = add_sample_data(RelayType.EVENT)[0]
+        add_queued_events(source_event['source_event'], 3)
+        worker = EventQueueWorker(batch_size=2)
+        self.assertEqual(worker.run_once(), 2)
+        self.assertEqual(worker.run_once(), 1)
+        self.assertEqual(worker.run_once(), 0)
+        self.assertEqual(QueuedEvent.objects.filter(status='SUCCESS', attempts=1).count(), 3)
+
+    def test_worker_reclaims_events_of_crashed_workers(self):
+        """
+            Test events still processing after their visibility timeout are claimed again, others are left alone.
+        """
+        expired = add_queued_events("SEND_EMAIL", 1, status='PROCESSING', attempts=1, locked_by='crashed:1',
+                                    locked_until=timezone.now() - timedelta(seconds=1))[0]
+        add_queued_events("SEND_EMAIL", 1, status='PROCESSING', attempts=1, locked_by='alive:1',
+                          locked_until=timezone.now() + timedelta(seconds=60))
+        exhausted = add_queued_events("SEND_EMAIL", 1, status='PROCESSING', attempts=3, locked_by='crashed:1',
+                                      locked_until=timezone.now() - timedelta(seconds=1))[0]
+        worker = EventQueueWorker()
+        batch = worker.claim_batch()
+        self.assertEqual([queued_event.id for queued_event in batch], [expired.id])
+        expired.refresh_from_db()
+        self.assertEqual((expired.attempts, expired.locked_by), (2, worker.worker_id))
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, 'FAILED')
+
+    def test_stopped_worker_releases_claimed_events(self):
+        """
+            Test a worker stopped in the middle of a batch hands the unprocessed events back to the queue.
+        """
+        queued_events = add_queued_events("SEND_EMAIL", 2)
+        worker = EventQueueWorker()
+        worker.stop()
+        self.assertEqual(worker.run_once(), 0)
+        for queued_event in queued_events:
+            queued_event.refresh_from_db()
+            self.assertEqual((queued_event.status, queued_event.attempts, queued_event.locked_by), ('PENDING', 0, None))
+
+    def test_worker_skips_events_claimed_by_another_worker(self):
+        """
+            Test events whose lease ran out during a slow event and were claimed again are neither processed nor saved.
+        """
+        source_event = add_sample_data(RelayType.EVENT)[0]
+        slow, reclaimed = add_queued_events(source_event['source_event'], 2)
+        worker = EventQueueWorker()
+        processed = []
+
+        def process_event(processor):
+            processed.append(processor.source_data)
+            # Another worker claims the rest of the batch, and this event, while this one is being processed
+            QueuedEvent.objects.filter(id__in=[slow.id, reclaimed.id]).update(locked_by='other:1')
+            return {"status": "SUCCESS"}
+
+        with patch('webapp.apps.skurge.processors.event_processor.EventProcessor.process_event', process_event):
+            self.assertEqual(worker.run_once(), 1)
+        self.assertEqual(len(processed), 1)
+        for queued_event in (slow, reclaimed):
+            queued_event.refresh_from_db()
+            self.assertEqual((queued_event.status, queued_event.locked_by), ('PROCESSING', 'other:1'))
+
+    @patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', mocked_publish)
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_worker_command(self):
+        """
+            Test the worker command processing a single batch.
+        """
+        source_event = add_sample_data(RelayType.EVENT)[0]
+        add_queued_events(source_event['source_event'], 2)
+        out = StringIO()
+        call_command('event_queue_worker', '--once', stdout=out)
+        self.assertIn("Processed 2 queued events", out.getvalue())
+
+
+class EventQueueSkipLockedTest(TransactionTestCase):
+
+    def test_concurrent_workers_claim_disjoint_batches(self):
+        """
+            Test events locked by a worker in the middle of claiming are skipped by the other workers.
+        """
+        locked, free = add_queued_events("SEND_EMAIL", 2)
+        row_locked, release = threading.Event(), threading.Event()
+
+        def claim_in_other_worker():
+            try:
+                with transaction.atomic():
+                    list(QueuedEvent.objects.select_for_update().filter(id=locked.id))
+                    row_locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        other_worker = threading.Thread(target=claim_in_other_worker)
+        other_worker.start()
+        row_locked.wait(5)
+        try:
+            batch = EventQueueWorker().claim_batch()
+        finally:
+            release.set()
+            other_worker.join()
+        self.assertEqual([queued_event.id for queued_event in batch], [free.id])
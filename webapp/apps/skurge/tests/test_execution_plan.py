@@ -0,0 +1,108 @@
+from unittest.mock import patch, MagicMock
+from django.test import SimpleTestCase
+from webapp.apps.skurge.constants import RelayType
+from webapp.apps.skurge.processors.execution_plan import ExecutionPlan, ExecutionPlanRegistry
+from webapp.apps.skurge.tests.common.constants import TestData
+from webapp.apps.skurge.tests.common.util import mocked_get_data_from_graphql, mocked_publish
+
+
+def get_event_config(*relay_types):
+    relay_processors = []
+    for index, relay_type in enumerate(relay_types):
+        relay_processor = TestData.get_relay_processor(relay_type=relay_type)
+        relay_processor.update({"id": index + 1, "data_processor": TestData.get_data_processor()})
+        relay_processors.append(relay_processor)
+    return {"id": 1, "source_event": "TEST_EVENT", "relay_processors": relay_processors}
+
+
+class ExecutionPlanTest(SimpleTestCase):
+
+    def setUp(self):
+        ExecutionPlanRegistry().clear()
+
+    @patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', mocked_publish)
+    @patch('webapp.apps.skurge.common.util.HttpUtil.publish_message', mocked_publish)
+    def test_relayers_share_fetch_node(self):
+        """
+            Test relayers firing the same query depend on a single fetch node fetched once per event.
+        """
+        plan = ExecutionPlan(get_event_config(RelayType.EVENT, RelayType.API))
+        self.assertEqual(plan.describe()["fetch_nodes"], 1)
+        self.assertEqual([node["stages"] for node in plan.describe()["relay_nodes"]],
+                         [["route", "fetch", "transform", "validate", "publish"],
+                          ["fetch", "transform", "validate", "route", "publish"]])
+
+        graphql_fetcher = MagicMock()
+        graphql_fetcher.fetch.side_effect = mocked_get_data_from_graphql
+        relay_logs = plan.execute(source_event="TEST_EVENT", source_data={"user_id": 1234},
+                                  graphql_fetcher=graphql_fetcher)
+        self.assertEqual(graphql_fetcher.fetch.call_count, 1)
+        self.assertEqual([log.status for relay_log in relay_logs for log in relay_log.relay_logs],
+                         ["SUCCESS", "SUCCESS"])
+
+    def test_relayer_without_rules_exits_before_fetching(self):
+        """
+            Test a relayer that can never publish is logged as failed without fetching graphql data.
+        """
+        event_config = get_event_config(RelayType.EVENT)
+        event_config["relay_processors"][0]["relay_event_rules"] = None
+        plan = ExecutionPlan(event_config)
+        self.assertEqual(plan.describe()["fetch_nodes"], 0)
+
+        graphql_fetcher = MagicMock()
+        relay_logs = plan.execute(source_event="TEST_EVENT", source_data={"user_id": 1234},
+                                  graphql_fetcher=graphql_fetcher)
+        graphql_fetcher.fetch.assert_not_called()
+        relay_log = relay_logs[0].relay_logs[0]
+        self.assertEqual(relay_log.status, "FAILED")
+        self.assertEqual(relay_log.reason, "Event rules not present in relay processor 1")
+
+    def test_plan_compiled_once_per_cached_config(self):
+        """
+            Test plans are compiled once per cached config and replaced for a reloaded one, uncached configs are not kept.
+        """
+        registry = ExecutionPlanRegistry()
+        event_config = dict(get_event_config(RelayType.EVENT), version=1)
+        plan = registry.get_plan(event_config)
+        self.assertIs(registry.get_plan(event_config), plan)
+        reloaded_plan = registry.get_plan(dict(get_event_config(RelayType.EVENT), version=2))
+        self.assertIsNot(reloaded_plan, plan)
+        self.assertIsNot(registry.get_plan(get_event_config(RelayType.EVENT)), reloaded_plan)
+        self.assertEqual(registry.stats()["size"], 1)
+
+    def test_relayer_routed_by_source_data_skips_fetch(self):
+        """
+            Test relayers routed by source data alone are routed first, skipping the fetch when they route nowhere.
+        """
+        event_config = get_event_config(RelayType.EVENT, RelayType.API)
+        event_relayer, api_relayer = event_config["relay_processors"][0], event_config["relay_processors"][1]
+        event_relayer["context_data_locator"] = {"country_code": "country_code", "name": "userDetails.name"}
+        event_relayer["relay_event_rules"] = {"if": [{"==": [{"var": "country_code"}, "IN"]}, "SEND_EMAIL"]}
+        api_relayer["context_data_locator"] = {"country_code": "country_code", "name": "userDetails.name"}
+        api_relayer["relay_http_endpoint_rules"] = {"if": [{"==": [{"var": "country_code"}, "IN"]}, {
+            "headers": {"Content-Type": "application/json"}, "http_method": "post",
+            "http_endpoint": "https://api.abc.com/{name}"}]}
+        plan = ExecutionPlan(event_config)
+        self.assertEqual([node.route_first for node in plan.relay_nodes], [True, False])
+
+        graphql_fetcher = MagicMock()
+        graphql_fetcher.fetch.side_effect = mocked_get_data_from_graphql
+        relay_logs = plan.execute(source_event="TEST_EVENT", source_data={"user_id": 1234, "country_code": "AE"},
+                                  graphql_fetcher=graphql_fetcher)
+        self.assertEqual(graphql_fetcher.fetch.call_count, 1)  # Fetched for the api relayer only
+        self.assertEqual([relay_log.relay_logs[0].status for relay_log in relay_logs], ["FAILED", "FAILED"])
+
+    def test_relayer_routed_by_fetched_data_not_routed_first(self):
+        """
+            Test relayers whose context data may come from the graphql data are routed after fetching.
+        """
+        locator = {"country_code": "country_code", "name": "userDetails.name"}
+        for context_data_locator, rules in [({"country_code": "userDetails.country_code"}, {"var": "country_code"}),
+                                            (locator, {"var": {"cat": ["count", "ry_code"]}}),
+                                            (locator, {"missing": ["country_code"]}),
+                                            (locator, {"some": [{"var": "name"}, True]}),
+                                            (None, "SEND_EMAIL")]:
+            event_config = get_event_config(RelayType.EVENT)
+            event_config["relay_processors"][0].update({"context_data_locator": context_data_locator,
+                                                        "relay_event_rules": rules})
+            self.assertFalse(ExecutionPlan(event_config).relay_nodes[0].route_first, msg=rules)
@@ -0,0 +1,48 @@
+import copy
+from concurrent.futures import Future
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+from webapp.apps.skurge.benchmarks import graphql_batching
+from webapp.apps.skurge.benchmarks.stubs import StubGraphQLServer
+from webapp.apps.skurge.clients.graphql_batch import GraphQLBatcher
+
+
+class GraphQLBatchingTest(SimpleTestCase):
+
+    def test_aliased_batching(self):
+        """
+            Test concurrent queries are merged into aliased batches and demultiplexed to the right callers.
+        """
+        result = graphql_batching.run(queries=40, concurrency=20, latency_ms=5, window_ms=20, mode=GraphQLBatcher.ALIAS)
+        self.assertEqual(result['batched']['mismatched_results'], 0)
+        self.assertLess(result['batched']['upstream_calls'], result['unbatched']['upstream_calls'])
+
+    def test_array_batching(self):
+        """
+            Test concurrent queries are sent as batched array requests and demultiplexed to the right callers.
+        """
+        result = graphql_batching.run(queries=40, concurrency=20, latency_ms=5, window_ms=20, mode=GraphQLBatcher.ARRAY)
+        self.assertEqual(result['batched']['mismatched_results'], 0)
+        self.assertLess(result['batched']['upstream_calls'], result['unbatched']['upstream_calls'])
+
+    def test_invalid_query_fails_alone(self):
+        """
+            Test a query failing validation fails its own caller only, the rest of the batch is still sent.
+        """
+        server = StubGraphQLServer().start()
+        external_services = copy.deepcopy(settings.EXTERNAL_SERVICES)
+        external_services["GRAPHQL_SERVER"]["HOST"] = server.host
+        external_services["GRAPHQL_SERVER"]["GATEWAY"] = {"ENABLED": False}
+        try:
+            for mode in (GraphQLBatcher.ALIAS, GraphQLBatcher.ARRAY):
+                batching = dict(getattr(settings, "GRAPHQL_BATCHING", {}), MODE=mode)
+                with override_settings(EXTERNAL_SERVICES=external_services, GRAPHQL_BATCHING=batching):
+                    batch = [(graphql_batching.QUERY, {"user_id": 1}, Future()),
+                             ("query { unknownField }", {}, Future()),
+                             (graphql_batching.QUERY, {"user_id": 2}, Future())]
+                    GraphQLBatcher().dispatch(batch)
+                self.assertEqual(batch[0][2].result()["userDetails"]["name"], "user-1", msg=mode)
+                self.assertIsNotNone(batch[1][2].exception(), msg=mode)
+                self.assertEqual(batch[2][2].result()["userDetails"]["name"], "user-2", msg=mode)
+        finally:
+            server.stop()
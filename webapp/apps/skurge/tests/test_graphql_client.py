@@ -0,0 +1,41 @@
+from unittest.mock import patch
+from django.test import SimpleTestCase
+from graphql import build_ast_schema, graphql, introspection_query, parse
+from graphql.execution import ExecutionResult
+from webapp.apps.skurge.clients.graphql import GraphQLClient
+from webapp.apps.skurge.tests.common.constants import TestData
+
+TEST_GRAPHQL_SCHEMA = build_ast_schema(parse("""
+    type UserDetails { name: String email: String country_code: String }
+    type Query { userDetails(user_id: ID!): UserDetails }
+    schema { query: Query }
+"""))
+
+
+class GraphQLClientTest(SimpleTestCase):
+
+    def setUp(self):
+        self.executed = []
+        GraphQLClient._pid = None  # Drops the worker's transports and schemas as if freshly forked
+
+    def mocked_execute(self, document, variable_values=None, **kwargs):
+        """
+        Helper method to mock the graphql server, answers introspection and data queries.
+        """
+        self.executed.append(variable_values)
+        if variable_values is None:
+            return graphql(TEST_GRAPHQL_SCHEMA, introspection_query)
+        return ExecutionResult(data={"userDetails": {"name": "aj", "email": "aj@abc.com", "country_code": "IN"}})
+
+    def test_schema_introspected_once(self):
+        """
+            Test schema, transport and parsed document are reused across fetches.
+        """
+        query = TestData.get_data_processor()['graphql_query']
+        with patch('gql.transport.requests.RequestsHTTPTransport.execute', self.mocked_execute):
+            first = GraphQLClient().fetch_data(query=query, variables={'user_id': 1})
+            second = GraphQLClient().fetch_data(query=query, variables={'user_id': 2})
+        self.assertEqual(first, second)
+        self.assertEqual(self.executed, [None, {'user_id': 1}, {'user_id': 2}])
+        self.assertIs(GraphQLClient().get_transport(), GraphQLClient().get_transport())
+        self.assertIs(GraphQLClient().get_document(query), GraphQLClient().get_document(query))
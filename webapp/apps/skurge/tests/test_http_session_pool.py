@@ -0,0 +1,55 @@
+import json
+from django.test import SimpleTestCase, override_settings
+from webapp.apps.skurge.benchmarks.stubs import StubAPIServer
+from webapp.apps.skurge.clients.http import HttpClient, HttpSessionPool
+from webapp.apps.skurge.common.metrics import Metrics
+
+
+@override_settings(HTTP_CLIENT={"POOL_MAXSIZE": 2, "TIMEOUT": 10, "HOSTS": {"localhost": {"TIMEOUT": 2}}})
+class HttpSessionPoolTest(SimpleTestCase):
+
+    def setUp(self):
+        HttpSessionPool._instance = None
+        Metrics().reset("http.")
+        self.server = StubAPIServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_connection_reused_across_clients(self):
+        """
+            Test requests of separate clients to the same host reuse one session and keep-alive connection.
+        """
+        url = "http://%s/notify" % self.server.host
+        for index in range(5):
+            HttpClient().post(url=url, data=json.dumps({"index": index}))
+        stats = HttpSessionPool.get_instance().stats()
+        self.assertEqual(self.server.requests, 5)
+        self.assertEqual(stats["hosts"], 1)
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["new_connections"], 1)
+        self.assertEqual(stats["reuse_ratio"], 0.8)
+
+    def test_policy_per_host(self):
+        """
+            Test every host gets its own session with the defaults overridden by the host's policy.
+        """
+        pool = HttpSessionPool.get_instance()
+        session, policy = pool.get_session("https://localhost/notify")
+        self.assertEqual(policy["TIMEOUT"], 2)
+        self.assertEqual(pool.get_session("https://localhost/other")[0], session)
+        other_session, other_policy = pool.get_session("https://api.example.com/notify")
+        self.assertNotEqual(other_session, session)
+        self.assertEqual(other_policy["TIMEOUT"], 10)
+
+    @override_settings(HTTP={"max_retries": 2, "status_forcelist": [503]})
+    def test_former_http_settings_still_read(self):
+        """
+            Test the retry settings of the former HTTP settings override the defaults but not the host's policy.
+        """
+        with override_settings(HTTP_CLIENT={"MAX_RETRIES": 5, "BACKOFF": 0.1,
+                                            "HOSTS": {"localhost": {"MAX_RETRIES": 0}}}):
+            pool = HttpSessionPool.get_instance()
+            policy = pool.get_policy("api.example.com")
+            self.assertEqual((policy["MAX_RETRIES"], policy["BACKOFF"], policy["STATUS_FORCELIST"]), (2, 0.1, [503]))
+            self.assertEqual(pool.get_policy("localhost")["MAX_RETRIES"], 0)
@@ -0,0 +1,149 @@
+import random
+import warnings
+from json_logic import jsonLogic
+from django.test import SimpleTestCase
+from webapp.apps.skurge.common.logic import JsonLogicCompiler, JsonLogicRegistry
+from webapp.apps.skurge.tests.common.constants import TestData
+
+DATA = {
+    "userDetails": {"name": "user", "email": "user@abc.com", "country_code": "IN", "age": "31", "tags": ["a", "b"]},
+    "items": [{"price": 10, "qty": 2}, {"price": 2.5, "qty": 0}, {"price": "4", "qty": 1}],
+    "count": 0,
+    "flag": False,
+    "empty": "",
+    "none": None,
+    "numbers": [1, 2, 3, 4, 5],
+}
+
+CASES = [
+    ({"var": "userDetails.name"}, DATA),
+    ({"var": ["userDetails.missing", "fallback"]}, DATA),
+    ({"var": "items.1.price"}, DATA),
+    ({"var": "items.7.price"}, {"items": {"7": {"price": 1}}}),
+    ({"var": "numbers.x"}, DATA),
+    ({"var": 1}, [10, 20]),
+    ({"var": ""}, DATA),
+    ({"var": ""}, 0),
+    ({"var": None}, DATA),
+    ({"var": {"cat": ["user", "Details.email"]}}, DATA),
+    ({"missing": ["userDetails.name", "empty", "none", "nope"]}, DATA),
+    ({"missing": [["count", "flag"]]}, DATA),
+    ({"missing_some": [1, ["nope", "userDetails.name"]]}, DATA),
+    ({"missing_some": [2, ["nope", "userDetails.name"]]}, DATA),
+    ({"if": [{"==": [{"var": "userDetails.country_code"}, "IN"]}, {"template_id": "india", "name": "userDetails.name"},
+             {"template_id": "others", "name": "userDetails.name"}]}, DATA),
+    ({"if": [{"var": "flag"}, "a", {"var": "count"}, "b", "c"]}, DATA),
+    ({"if": [{"var": "flag"}, "a"]}, DATA),
+    ({"if": []}, DATA),
+    ({"if": "constant"}, DATA),
+    ({"?:": [{"var": "count"}, "yes", "no"]}, DATA),
+    ({"and": [{"var": "userDetails.name"}, {"var": "count"}, "unreached"]}, DATA),
+    ({"and": []}, DATA),
+    ({"or": [{"var": "flag"}, {"var": "empty"}, {"var": "none"}]}, DATA),
+    ({"or": [{"var": "flag"}, {"var": "userDetails.email"}]}, DATA),
+    ({"==": [1, "1"]}, DATA),
+    ({"==": [0, False]}, DATA),
+    ({"===": [1, 1.0]}, DATA),
+    ({"!=": [{"var": "userDetails.age"}, 31]}, DATA),
+    ({"!==": ["1", 1]}, DATA),
+    ({"<": [{"var": "userDetails.age"}, 40]}, DATA),
+    ({"<": [1, {"var": "userDetails.age"}, 40]}, DATA),
+    ({"<=": [None, 1]}, DATA),
+    ({">": ["11", 2]}, DATA),
+    ({">=": [2.0, "2"]}, DATA),
+    ({"!": [{"var": "count"}]}, DATA),
+    ({"!": {"var": "count"}}, DATA),
+    ({"!!": [[]]}, DATA),
+    ({"in": [{"var": "userDetails.country_code"}, ["IN", "AE"]]}, DATA),
+    ({"in": ["ser", {"var": "userDetails.name"}]}, DATA),
+    ({"in": ["a", 1]}, DATA),
+    ({"cat": ["Hi ", {"var": "userDetails.name"}, 1, None]}, DATA),
+    ({"substr": [{"var": "userDetails.email"}, -7, 3]}, DATA),
+    ({"+": ["1.5", 2, {"var": "userDetails.age"}]}, DATA),
+    ({"-": [{"var": "count"}]}, DATA),
+    ({"*": [2, "3.5"]}, DATA),
+    ({"/": [7, 2]}, DATA),
+    ({"%": [7, 2]}, DATA),
+    ({"min": [3, "1", 2.5]}, DATA),
+    ({"max": []}, DATA),
+    ({"merge": [[1, 2], 3, [[4]]]}, DATA),
+    ({"method": [{"var": "userDetails.email"}, "split", ["@"]]}, DATA),
+    ({"map": [{"var": "items"}, {"*": [{"var": "price"}, {"var": "qty"}]}]}, DATA),
+    ({"filter": [{"var": "numbers"}, {"%": [{"var": ""}, 2]}]}, DATA),
+    ({"filter": [[0, 1, 2], {"var": ""}]}, DATA),
+    ({"filter": [{"var": "nope"}, True]}, DATA),
+    ({"reduce": [{"var": "numbers"}, {"+": [{"var": "accumulator"}, {"var": "current"}]}, 0]}, DATA),
+    ({"reduce": [{"var": "nope"}, {"+": [{"var": "accumulator"}, {"var": "current"}]}, 10]}, DATA),
+    ({"all": [{"var": "items"}, {">": [{"var": "price"}, 1]}]}, DATA),
+    ({"all": [[], True]}, DATA),
+    ({"none": [{"var": "items"}, {"==": [{"var": "qty"}, 5]}]}, DATA),
+    ({"some": [{"var": "userDetails.tags"}, {"==": [{"var": ""}, "b"]}]}, DATA),
+    ([{"var": "count"}, {"var": "flag"}, "constant"], DATA),
+    ({"template_id": "constant", "name": "userDetails.name"}, DATA),
+    ("constant", DATA),
+    ({"unknown_operator": [1]}, DATA),
+    ({"template_data.name": "userDetails.name"}, DATA),
+    ({"?:": [1, 2]}, DATA),
+    ({"/": [1, 0]}, DATA),
+    ({"var": "items.9.price"}, DATA),
+]
+
+
+class JsonLogicCompilerTest(SimpleTestCase):
+
+    def setUp(self):
+        JsonLogicRegistry().clear()
+
+    def assert_same_as_interpreter(self, rule, data):
+        try:
+            expected = jsonLogic(rule, data)
+        except Exception as e:
+            with self.assertRaises(type(e), msg=rule):
+                JsonLogicCompiler().compile(rule)(data)
+            return
+        self.assertEqual(JsonLogicCompiler().compile(rule)(data), expected, msg=rule)
+
+    def test_compiled_rules_match_interpreter(self):
+        """
+            Test compiled rules evaluate to what the json_logic interpreter returns, raising where it raises.
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for rule, data in CASES:
+                self.assert_same_as_interpreter(rule, data)
+
+    def test_random_rules_match_interpreter(self):
+        """
+            Test randomly generated rules over the operators of our configs evaluate as in the interpreter.
+        """
+        generator = random.Random(7)
+        leaves = [0, 1, 2.5, "1", "IN", "", None, True, False, [1, "a"]] + \
+                 [{"var": path} for path in ("userDetails.country_code", "userDetails.age", "count", "flag", "none",
+                                             "numbers", "numbers.2", "nope", "items.0.price")]
+        operators = ["if", "?:", "and", "or", "==", "===", "!=", "!==", "<", "<=", ">", ">=", "!", "!!", "in", "cat",
+                     "+", "min", "max", "merge", "missing"]
+
+        def generate(depth):
+            if depth == 0 or generator.random() < 0.3:
+                return generator.choice(leaves)
+            operator = generator.choice(operators)
+            arity = 3 if operator == "?:" else generator.randint(1, 3)
+            return {operator: [generate(depth - 1) for _ in range(arity)]}
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            for _ in range(2000):
+                self.assert_same_as_interpreter(generate(4), generator.choice([DATA, {}, None, {"count": 3}]))
+
+    def test_config_rules_compiled_once(self):
+        """
+            Test the rules of the configs are compiled once and then looked up by identity.
+        """
+        registry = JsonLogicRegistry()
+        rule = TestData.get_data_processor()['relay_data_locator']
+        stats = registry.stats()
+        self.assertEqual(registry.apply(rule, DATA), jsonLogic(rule, DATA))
+        self.assertIs(registry.get_rule(rule), registry.get_rule(TestData.get_data_processor()['relay_data_locator']))
+        self.assertEqual(registry.stats()['misses'] - stats['misses'], 1)
+        self.assertEqual(registry.stats()['hits'] - stats['hits'], 2)
+        self.assertEqual(registry.stats()['size'], 1)
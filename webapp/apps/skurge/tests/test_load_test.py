@@ -0,0 +1,44 @@
+from django.test import TransactionTestCase
+from webapp.apps.skurge.benchmarks import load_test
+from webapp.apps.skurge.models import SourceEvent, RelayProcessor, DataProcessor
+
+NO_LATENCY = {"graphql": {"latency_ms": 0}, "api": {"latency_ms": 0}, "broker": {"latency_ms": 0}}
+
+
+class LoadTestTest(TransactionTestCase):
+
+    def test_load_test_against_stubs(self):
+        """
+            Test the load test relays the sample event through the stub servers and reports every request.
+        """
+        result = load_test.run(rate=40, duration=0.25, concurrency=4, faults=NO_LATENCY)
+        self.assertEqual(result["requests"], 10)
+        self.assertEqual(result["succeeded"], 10)
+        self.assertEqual(result["errors"], {})
+        self.assertEqual(result["relays"]["statuses"], {"SUCCESS": 20})
+        self.assertGreaterEqual(result["stubs"]["graphql"]["requests"], 10)  # Along with the schema introspection
+        self.assertEqual(result["stubs"]["api"]["requests"], 10)
+        self.assertEqual(result["stubs"]["broker"]["published"], 10)
+        self.assertLessEqual(result["latency_ms"]["p50"], result["latency_ms"]["p99"])
+        # The sample event is registered for the run only
+        self.assertFalse(SourceEvent.objects.filter(is_deleted=False).exists() or
+                         RelayProcessor.objects.filter(is_deleted=False).exists() or
+                         DataProcessor.objects.filter(is_deleted=False).exists())
+
+    def test_load_test_reports_injected_errors(self):
+        """
+            Test errors injected by the stub servers are reported as failed relays.
+        """
+        result = load_test.run(rate=40, duration=0.25, concurrency=4,
+                               faults=dict(NO_LATENCY, api={"latency_ms": 0, "error_rate": 1}))
+        self.assertEqual(result["succeeded"], 10)
+        self.assertEqual(result["relays"]["statuses"], {"SUCCESS": 10, "FAILED": 10})
+        self.assertEqual(result["stubs"]["api"]["injected_errors"], 10)
+        self.assertIn("500 Server Error", next(iter(result["relays"]["failure_reasons"])))
+
+    def test_load_test_of_deployment_requires_event(self):
+        """
+            Test driving a running deployment needs a registered event, the sample event only exists in-process.
+        """
+        with self.assertRaises(ValueError):
+            load_test.run(url="http://skurge.example.com")
@@ -0,0 +1,72 @@
+import copy
+from collections import namedtuple
+import pydash
+from django.test import SimpleTestCase
+from webapp.apps.skurge.common.path import PathGetter, PathSetter, LocatorPlanRegistry
+from webapp.apps.skurge.tests.common.constants import TestData
+
+Point = namedtuple("Point", ["x", "y"])
+
+DATA = {
+    "userDetails": {"name": "user", "email": "user@abc.com", "tags": ["a", "b"], "address": None},
+    "items": [{"price": 10}, {"price": 2.5, "dims": [1, 2]}],
+    "1": "string key",
+    1: "int key",
+    "a.b": "escaped",
+    "point": Point(3, 4),
+    "text": "abc",
+}
+
+GET_PATHS = ["userDetails.name", "userDetails.tags.1", "userDetails.tags[0]", "userDetails.tags.5", "items[1].dims[1]",
+             "items.1.price", "items.-1.price", "1", 1, "a\\.b", "point.x", "point.1", "text.0", "userDetails.address.x",
+             "userDetails.name.upper", "missing.path", "", "items", ["items", 0, "price"], "email-template-for-india",
+             "[0]"]
+
+SET_PATHS = ["to", "template_data.name", "a.b.c", "list[0]", "list[2].name", "matrix[0][1]", "a\\.b", "existing.x",
+             "existing.y.z", "string.x", 3, ["p", "q"]]
+
+
+class LocatorPlanTest(SimpleTestCase):
+
+    def setUp(self):
+        LocatorPlanRegistry().clear()
+
+    def test_getter_matches_pydash(self):
+        """
+            Test compiled getters return what pydash.get returns, defaults included.
+        """
+        for path in GET_PATHS:
+            for default in (None, path if not isinstance(path, list) else None):
+                self.assertEqual(PathGetter(path).get(DATA, default=default), pydash.get(DATA, path, default=default),
+                                 msg=path)
+        self.assertEqual(PathGetter("x").get(None), pydash.get(None, "x"))
+
+    def test_setter_matches_pydash(self):
+        """
+            Test compiled setters build the same object as pydash.set_, one path after the other.
+        """
+        expected = {"existing": {"x": 0}, "string": "abc"}
+        actual = copy.deepcopy(expected)
+        for value, path in enumerate(SET_PATHS):
+            pydash.set_(expected, path, value)
+            PathSetter(path).set(actual, value)
+            self.assertEqual(actual, expected, msg=path)
+        self.assertEqual(PathSetter("[1].a").set([], "v"), pydash.set_([], "[1].a", "v"))
+
+    def test_plan_compiled_once_per_locator(self):
+        """
+            Test the plan of a locator is compiled once and extracts the relay data as the pydash based extraction.
+        """
+        locator = TestData.get_data_processor()['relay_data_locator']['if'][1]
+        data = {"userDetails": {"name": "user", "tags": ["a"]}}
+        expected = {}
+        for key_path, value_path in locator.items():
+            pydash.set_(expected, key_path, pydash.get(data, value_path, default=value_path))
+
+        registry = LocatorPlanRegistry()
+        stats = registry.stats()
+        self.assertEqual(registry.get_plan(locator).extract(data, {}), expected)
+        self.assertIs(registry.get_plan(locator), registry.get_plan(copy.deepcopy(locator)))
+        self.assertEqual(registry.stats()['misses'] - stats['misses'], 1)
+        self.assertEqual(registry.get_plan({"tags": "userDetails.tags", "none": "nope"}).get_values(data),
+                         {"tags": ["a"], "none": None})
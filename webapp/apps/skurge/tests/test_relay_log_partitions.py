@@ -0,0 +1,71 @@
+from dateutil.relativedelta import relativedelta
+from django.db import connection
+from django.test import TestCase
+from webapp.apps.skurge.models import RelayEventLogs
+from webapp.apps.skurge.services.log import RelayLogService
+from webapp.apps.skurge.services.relay_log_partition import RelayLogPartitionService
+
+
+class RelayLogPartitionTest(TestCase):
+
+    def setUp(self):
+        self.current_month = RelayLogPartitionService.get_month_start()
+        # The table partitioned by the migration holds the current month
+        self.current_partition = next(partition[0] for partition in RelayLogPartitionService().get_partitions()
+                                      if RelayLogPartitionService.covers(partition, self.current_month))
+
+    def test_relay_logs_partitioned_by_month(self):
+        """
+            Test relay logs are written to the partition of their month and the months ahead are partitioned.
+        """
+        RelayLogService().log(source="TEST_EVENT", status="SUCCESS")
+        partitions = RelayLogPartitionService().get_partitions()
+        for offset in range(4):
+            month_start = self.current_month + relativedelta(months=offset)
+            self.assertTrue(any(RelayLogPartitionService.covers(partition, month_start) for partition in partitions))
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM %s" % self.current_partition)
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'relay_logs'")
+            indexes = [row[0] for row in cursor.fetchall()]
+        self.assertIn("relay_logs_event_created_idx", indexes)
+        self.assertIn("relay_logs_status_created_idx", indexes)
+
+    def test_create_partitions_ahead(self):
+        """
+            Test partitions are created for the months ahead not partitioned yet, and only once.
+        """
+        service = RelayLogPartitionService(months_ahead=2)
+        later = self.current_month + relativedelta(months=4)
+        expected = ["relay_logs_p%s" % (later + relativedelta(months=offset)).strftime("%Y_%m") for offset in range(3)]
+        self.assertEqual(service.create_partitions(now=later), expected)
+        self.assertEqual(service.create_partitions(now=later), [])
+
+    def test_expired_partitions_dropped(self):
+        """
+            Test partitions past retention are dropped along with their logs.
+        """
+        RelayLogService().log(source="TEST_EVENT", status="SUCCESS")
+        service = RelayLogPartitionService(retention_months=1, archive=False)
+        later = self.current_month + relativedelta(months=3)
+        expired = service.get_expired_partitions(now=later)
+        self.assertIn(self.current_partition, expired)
+        self.assertEqual(service.prune_partitions(now=later), expired)
+        self.assertEqual(RelayEventLogs.objects.count(), 0)
+        self.assertEqual(service.get_expired_partitions(now=later), [])
+
+    def test_expired_partitions_archived(self):
+        """
+            Test partitions past retention are detached as archive tables keeping their logs.
+        """
+        RelayLogService().log(source="TEST_EVENT", status="SUCCESS")
+        service = RelayLogPartitionService(retention_months=1, archive=True)
+        pruned = service.prune_partitions(now=self.current_month + relativedelta(months=3))
+        self.assertIn(self.current_partition, pruned)
+        self.assertEqual(RelayEventLogs.objects.count(), 0)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tablename FROM pg_tables WHERE tablename LIKE 'relay_logs_archive_%'")
+            archives = [row[0] for row in cursor.fetchall()]
+            self.assertEqual(len(archives), len(pruned))
+            cursor.execute(" UNION ALL ".join("SELECT source_event_name FROM %s" % archive for archive in archives))
+            self.assertEqual(cursor.fetchall(), [("TEST_EVENT",)])
@@ -0,0 +1,42 @@
+from unittest.mock import patch
+from django.test import TransactionTestCase, override_settings
+from webapp.apps.skurge.tests.common.util import add_sample_data, mocked_get_data_from_graphql, mocked_publish
+from webapp.apps.skurge.common.metrics import Metrics
+from webapp.apps.skurge.constants import RelayType
+from webapp.apps.skurge.models import RelayEventLogs
+from webapp.apps.skurge.processors.event_processor import EventProcessor
+from webapp.apps.skurge.services.log import RelayLogService, RelayLogWriter
+
+
+@override_settings(RELAY_LOG_WRITER={"ENABLED": True, "MAX_BATCH_SIZE": 2, "FLUSH_INTERVAL_MS": 10,
+                                     "MAX_BUFFER_SIZE": 3})
+class RelayLogWriterTest(TransactionTestCase):
+
+    def setUp(self):
+        RelayLogWriter._instance = None
+        Metrics().reset("relay_logs.")
+
+    @patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', mocked_publish)
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_relay_logs_written_in_batches(self):
+        """
+            Test relay logs are buffered and written in batches of the max batch size.
+        """
+        source_event = add_sample_data(RelayType.EVENT)[0]['source_event']
+        for user_id in range(3):
+            EventProcessor(source_event=source_event, source_data={'user_id': user_id}).process_event()
+        RelayLogService().log(source="UNREGISTERED_EVENT", status="FAILED", reason="Not registered")
+        RelayLogWriter.get_instance().flush()
+        self.assertEqual(RelayEventLogs.objects.filter(source_event_name=source_event, status="SUCCESS").count(), 3)
+        self.assertEqual(RelayEventLogs.objects.filter(source_event_name="UNREGISTERED_EVENT").count(), 1)
+        self.assertEqual(Metrics().get("relay_logs.written"), 4)
+        self.assertGreaterEqual(Metrics().get("relay_logs.flushes"), 2)
+
+    def test_relay_logs_dropped_when_buffer_full(self):
+        """
+            Test relay logs beyond the buffer size are dropped while the writer is behind.
+        """
+        writer = RelayLogWriter()  # Not started, nothing is written
+        writer.write([RelayLogService().get_relay_log(source="TEST_EVENT", status="SUCCESS") for _ in range(5)])
+        self.assertEqual(writer.buffer.qsize(), 3)
+        self.assertEqual(Metrics().get("relay_logs.dropped"), 2)
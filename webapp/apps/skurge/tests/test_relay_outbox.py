@@ -0,0 +1,109 @@
+from datetime import timedelta
+from unittest.mock import patch, MagicMock
+from rest_framework.test import APITestCase
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from webapp.apps.skurge.tests.common.util import add_sample_data, mocked_get_data_from_graphql, \
+    add_sample_relay_processor
+from webapp.apps.skurge.constants import RelayType
+from webapp.apps.skurge.models import RelayOutbox, RelayEventLogs
+from webapp.apps.skurge.processors.outbox import RelayOutboxWorker
+
+
+@override_settings(RELAY_OUTBOX={"ENABLED": True, "MAX_ATTEMPTS": 2, "BACKOFF": 10})
+class RelayOutboxTest(APITestCase):
+
+    def relay_event(self, event_name, user_id=1234):
+        return self.client.post(path=reverse(viewname='skurge-relayer', kwargs={'event_name': event_name}),
+                                data={'user_id': user_id}, format='json')
+
+    def add_outbox_data(self):
+        source_event, data_processor, _ = add_sample_data(RelayType.EVENT)
+        add_sample_relay_processor(source_event_id=source_event['id'], data_processor_id=data_processor['id'],
+                                   relay_type=RelayType.API)
+        return source_event
+
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_relays_queued_with_their_logs(self):
+        """
+            Test relays are queued in the outbox along with their relay logs instead of being delivered.
+        """
+        source_event = self.add_outbox_data()
+        publish, publish_message = MagicMock(), MagicMock()
+        with patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish', publish), \
+                patch('webapp.apps.skurge.common.util.HttpUtil.publish_message', publish_message):
+            response = self.relay_event(source_event['source_event'])
+        self.assertEqual(response.data['response']['status'], 'SUCCESS')
+        self.assertFalse(publish.called or publish_message.called)
+        relay_logs = RelayEventLogs.objects.filter(source_event_name=source_event['source_event'], status='QUEUED')
+        entries = RelayOutbox.objects.filter(status='PENDING')
+        self.assertEqual(sorted(entry.relay_log_id for entry in entries), sorted(log.id for log in relay_logs))
+        self.assertEqual(sorted(entry.relay_type for entry in entries), ['API', 'EVENT'])
+
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_worker_delivers_in_batches_per_destination(self):
+        """
+            Test the worker publishes the events of a routing key together and marks the relays delivered.
+        """
+        source_event = self.add_outbox_data()
+        for user_id in [1, 2]:
+            self.relay_event(source_event['source_event'], user_id=user_id)
+        publish_batch = MagicMock(side_effect=lambda routing_key, messages: [None] * len(messages))
+        publish_message = MagicMock()
+        with patch('webapp.apps.skurge.clients.event.RabbitMQClient.publish_batch', publish_batch), \
+                patch('webapp.apps.skurge.common.util.HttpUtil.publish_message', publish_message):
+            self.assertEqual(RelayOutboxWorker().run_once(), 4)
+        publish_batch.assert_called_once()
+        self.assertEqual(len(publish_batch.call_args[0][1]), 2)
+        self.assertEqual(publish_message.call_count, 2)
+        self.assertEqual(RelayOutbox.objects.filter(status='DELIVERED').count(), 4)
+        self.assertEqual(RelayEventLogs.objects.filter(source_event_name=source_event['source_event'],
+                                                       status='SUCCESS').count(), 4)
+
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_worker_retries_with_backoff(self):
+        """
+            Test relays to an unavailable endpoint are backed off together and failed once out of attempts.
+        """
+        source_event = self.add_outbox_data()
+        for user_id in [1, 2]:
+            self.relay_event(source_event['source_event'], user_id=user_id)
+        RelayOutbox.objects.filter(relay_type='EVENT').delete()
+        publish_message = MagicMock(side_effect=Exception("503 Service Unavailable"))
+        with patch('webapp.apps.skurge.common.util.HttpUtil.publish_message', publish_message):
+            RelayOutboxWorker().run_once()
+            self.assertEqual(publish_message.call_count, 1)  # The second relay is not tried once the endpoint failed
+            entries = RelayOutbox.objects.all()
+            self.assertTrue(all(entry.status == 'PENDING' and entry.attempts == 1 and
+                                entry.next_attempt_at > timezone.now() + timedelta(seconds=5) for entry in entries))
+            self.assertEqual(RelayOutboxWorker().run_once(), 0)  # Not due yet
+
+            entries.update(next_attempt_at=timezone.now())
+            RelayOutboxWorker().run_once()
+        self.assertEqual(RelayOutbox.objects.filter(status='FAILED').count(), 2)
+        failed_logs = RelayEventLogs.objects.filter(source_event_name=source_event['source_event'], status='FAILED')
+        self.assertEqual(failed_logs.count(), 2)
+        self.assertIn("503 Service Unavailable", failed_logs.first().reason)
+
+    @patch('webapp.apps.skurge.clients.graphql.GraphQLClient.fetch_data', mocked_get_data_from_graphql)
+    def test_worker_skips_entries_claimed_by_another_worker(self):
+        """
+            Test entries whose lease ran out during a slow relay and were claimed again are neither delivered nor marked.
+        """
+        source_event = self.add_outbox_data()
+        for user_id in [1, 2]:
+            self.relay_event(source_event['source_event'], user_id=user_id)
+        RelayOutbox.objects.filter(relay_type='EVENT').delete()
+
+        def publish_message(**kwargs):
+            # Another worker claims the batch while the first relay is in flight
+            RelayOutbox.objects.update(locked_by='other:1')
+
+        publish_message = MagicMock(side_effect=publish_message)
+        with patch('webapp.apps.skurge.common.util.HttpUtil.publish_message', publish_message):
+            self.assertEqual(RelayOutboxWorker().run_once(), 2)
+        self.assertEqual(publish_message.call_count, 1)
+        self.assertEqual(RelayOutbox.objects.filter(status='PROCESSING', locked_by='other:1').count(), 2)
+        self.assertEqual(RelayEventLogs.objects.filter(source_event_name=source_event['source_event'], relay_type='API',
+                                                       status='QUEUED').count(), 2)
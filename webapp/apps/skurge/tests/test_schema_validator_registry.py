@@ -0,0 +1,43 @@
+from unittest.mock import patch
+from django.test import SimpleTestCase
+from webapp.apps.skurge.common.schema import SchemaValidatorRegistry
+from webapp.apps.skurge.tests.common.constants import TestData
+
+
+class SchemaValidatorRegistryTest(SimpleTestCase):
+
+    def setUp(self):
+        SchemaValidatorRegistry().clear()
+
+    def test_validator_built_once_per_schema_content(self):
+        """
+            Test equal schemas share one compiled validator and are counted as hits.
+        """
+        registry = SchemaValidatorRegistry()
+        stats = registry.stats()
+        validator = registry.get_validator(TestData.get_source_event()['input_json_schema'])
+        self.assertIs(registry.get_validator(TestData.get_source_event()['input_json_schema']), validator)
+        self.assertEqual(registry.stats()['misses'] - stats['misses'], 1)
+        self.assertEqual(registry.stats()['hits'] - stats['hits'], 1)
+        self.assertEqual(registry.stats()['size'], 1)
+
+    def test_validation_errors(self):
+        """
+            Test validation error messages are returned for invalid data only.
+        """
+        schema = TestData.get_source_event()['input_json_schema']
+        self.assertEqual(SchemaValidatorRegistry().get_errors(schema, {'user_id': 1234}), [])
+        self.assertEqual(len(SchemaValidatorRegistry().get_errors(schema, {})), 1)
+
+    def test_identity_hits_keep_validators_cached(self):
+        """
+            Test schemas looked up by identity are kept as recently used and are not evicted in insertion order.
+        """
+        registry = SchemaValidatorRegistry()
+        hot_schema = {"type": "object", "required": ["id"]}
+        validator = registry.get_validator(hot_schema)
+        with patch.object(registry._cache, "max_size", 2):
+            registry.get_validator({"type": "object", "required": ["a"]})
+            registry.get_validator(hot_schema)
+            registry.get_validator({"type": "object", "required": ["b"]})
+            self.assertIs(registry.get_validator(dict(hot_schema)), validator)
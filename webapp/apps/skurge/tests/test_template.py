@@ -0,0 +1,70 @@
+from collections import namedtuple
+import pydash
+from django.test import SimpleTestCase
+from webapp.apps.skurge.common.template import Template, TemplateRegistry
+from webapp.apps.skurge.tests.common.constants import TestData
+
+Point = namedtuple("Point", ["x", "y"])
+
+DATA = {
+    "userDetails": {"name": "user", "email": "user@abc.com", "tags": ["a", "b"]},
+    "country_code": "IN",
+    "amount": 1234.5,
+    "point": Point(3, 4),
+}
+
+TEMPLATES = ["care@abc.com", "", "{userDetails[email]}", "https://api.abc.com/{country_code}/users/{userDetails[name]}",
+             "{{literal}} {country_code}", "{{}}", "{amount:,.2f}", "{country_code!r}", "{userDetails[tags][1]:>4}",
+             "{point.x}-{point[1]}", "{userDetails}", "{missing}", "{}", "{0}", "{country_code!x}", "{amount:{width}}",
+             "{unclosed", "closed}", "{userDetails[missing]}", "{point.z}"]
+
+
+class TemplateTest(SimpleTestCase):
+
+    def setUp(self):
+        TemplateRegistry().clear()
+
+    def test_templates_match_str_format(self):
+        """
+            Test compiled templates format as str.format with the data as keyword arguments, raising where it raises.
+        """
+        for template in TEMPLATES:
+            try:
+                expected = template.format(**DATA)
+            except Exception as e:
+                with self.assertRaises(type(e), msg=template):
+                    Template(template).render(DATA)
+                continue
+            self.assertEqual(Template(template).render(DATA), expected, msg=template)
+
+    def test_constants_not_formatted(self):
+        """
+            Test templates without fields are detected as constants.
+        """
+        self.assertTrue(Template("care@abc.com").is_constant)
+        self.assertTrue(Template("{{escaped}}").is_constant)
+        self.assertEqual(Template("{{escaped}}").render({}), "{escaped}")
+        self.assertFalse(Template("{userDetails[email]}").is_constant)
+
+    def test_default_response_plan(self):
+        """
+            Test the default response plan sets the same values as formatting every string of the default response.
+        """
+        default_response = dict(TestData.get_data_processor()['default_response'], **{"meta.retries": 3})
+        expected = {}
+        for key_path, value in default_response.items():
+            pydash.set_(expected, key_path, value.format(**DATA) if isinstance(value, str) else value)
+        registry = TemplateRegistry()
+        plan = registry.get_default_response_plan(default_response)
+        self.assertEqual(plan.apply(DATA, {}), expected)
+        self.assertIs(registry.get_default_response_plan(default_response), plan)
+
+    def test_default_response_plan_does_not_share_nested_defaults(self):
+        """
+            Test keys set under a dict default do not leak into the cached default response.
+        """
+        default_response = {"meta": {"source": "skurge"}, "meta.retries": 3}
+        plan = TemplateRegistry().get_default_response_plan(default_response)
+        self.assertEqual(plan.apply(DATA, {}), {"meta": {"source": "skurge", "retries": 3}})
+        self.assertEqual(plan.apply(DATA, {}), {"meta": {"source": "skurge", "retries": 3}})
+        self.assertEqual(default_response, {"meta": {"source": "skurge"}, "meta.retries": 3})
@@ -23,6 +23,10 @@ router = routers.DefaultRouter()
 urlpatterns = [
     # Event processing through config driven process
     path('api/v1/relay-event/<slug:event_name>', views.EventProcessorView.as_view(http_method_names=['post']), name='skurge-relayer'),
+    # Bulk event processing, events posted as a json array or ndjson
+    path('api/v1/relay-events', views.BulkEventProcessorView.as_view(http_method_names=['post']), name='skurge-bulk-relayer'),
+    # Status of an event accepted in async mode
+    path('api/v1/queued-event/<uuid:event_id>', views.QueuedEventView.as_view(http_method_names=['get']), name='get-queued-event'),
     # Registers an event in skurge
     path('api/v1/register-event', views.SourceEventView.as_view(http_method_names=['post']), name='register-event'),
     # Get all registered events
@@ -1,11 +1,16 @@
 import logging
 
+from rest_framework import status
+from rest_framework.parsers import JSONParser
 from rest_framework.views import APIView
 
 from webapp.apps.skurge.common.util import APIResponse
+from webapp.apps.skurge.common.parsers import NDJSONParser
 from webapp.apps.skurge.processors.event_processor import EventProcessor
 from webapp.apps.skurge.services.source_event import SourceEventService
 from webapp.apps.skurge.services.relay_event import RelayEventService
+from webapp.apps.skurge.services.event_queue import EventQueueService
+from webapp.apps.skurge.services.bulk_event import BulkEventService
 
 
 class EventProcessorView(APIView):
@@ -13,17 +18,56 @@ class EventProcessorView(APIView):
     def post(self, request, event_name=None):
         """
         Processes incoming events and relays it forward to multiple systems
+        With ?async=true the event is only validated and queued, it is accepted with the event id to look it up
         :param request:
         :param event_name:
         :return:
         """
         logging.info("Received request for event %s to be processed by skurge v1 with data %s", event_name, request.data)
+        if request.query_params.get("async") == "true":
+            response = EventQueueService().enqueue(source_event=event_name, source_data=request.data)
+            logging.info("Event queued by skurge with response %s", response)
+            if response.get("status") == "ACCEPTED":
+                return APIResponse.send(response, code=status.HTTP_202_ACCEPTED)
+            return APIResponse.send(response)
         base_processor = EventProcessor(source_event=event_name, source_data=request.data)
         response = base_processor.process_event()
         logging.info("Event processed by skurge successfully")
         return APIResponse.send(response)
 
 
+class BulkEventProcessorView(APIView):
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def post(self, request):
+        """
+        Processes a list of incoming events, posted as a json array or as ndjson, and returns the status of each one
+        With ?async=true the events are only validated and queued
+        :param request:
+        :return:
+        """
+        logging.info("Received request to process events in bulk")
+        response = BulkEventService().process_events(items=request.data,
+                                                     asynchronous=request.query_params.get("async") == "true")
+        logging.info("Bulk events processed by skurge with summary %s", response.get("summary"))
+        return APIResponse.send(response)
+
+
+class QueuedEventView(APIView):
+
+    def get(self, request, event_id):
+        """
+        Gets the processing status of an event accepted in async mode
+        :param request:
+        :param event_id:
+        :return:
+        """
+        logging.info("Request received to get status of queued event %s", event_id)
+        response = EventQueueService().get_queued_event(event_id=event_id)
+        logging.info("Get queued event response %s", response)
+        return APIResponse.send(response)
+
+
 class RegisteredEventsView(APIView):
 
     def get(self, request):
@@ -136,6 +136,167 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Cache settings
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'skurge-default',
+    },
+    'graphql': {  # Graphql responses of data processors having graphql_cache_ttl set
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'skurge-graphql',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,  # Least recently used responses are culled beyond this
+        }
+    }
+}
+
+# Per worker cache of resolved event configs used on the relay hot path
+
+EVENT_CONFIG_CACHE = {
+    'ENABLED': True,
+    'TTL': 300,  # Max seconds a worker serves a config without seeing a version bump
+    'VERSION_STORE': 'DATABASE',  # Where the config version bumped on every committed config write is kept, DATABASE
+    # or CACHE. The cache needs a backend shared by all workers (eg. memcached), the config cache is disabled otherwise
+    'VERSION_CACHE_ALIAS': 'default',  # Cache holding the config version when stored in CACHE
+    'VERSION_CHECK_INTERVAL': 1,  # Seconds a worker reuses the version it last read, config writes show up after this
+}
+
+# Per worker graphql client, see clients/graphql.py
+
+GRAPHQL_CLIENT = {
+    'TIMEOUT': 30,  # Seconds
+    'POOL_CONNECTIONS': 1,  # Number of hosts to keep connection pools for
+    'POOL_MAXSIZE': 10,  # Keep-alive connections per host
+    'SCHEMA_REFRESH_INTERVAL': 600,  # Seconds after which the server schema is introspected again
+    'VALIDATE_QUERIES': True,  # Validates queries against the introspected schema before sending them
+    'MAX_DOCUMENTS': 512,  # Parsed query documents kept per worker
+}
+
+# Cache of graphql responses, enabled per data processor by its graphql_cache_ttl
+
+GRAPHQL_RESULT_CACHE = {
+    'ENABLED': True,
+    'CACHE_ALIAS': 'graphql',
+}
+
+# Micro-batching of graphql queries, enabled per data processor by graphql_batching
+
+GRAPHQL_BATCHING = {
+    'ENABLED': True,
+    'MODE': 'ALIAS',  # ALIAS merges queries into one aliased operation, ARRAY sends a batched array request
+    'WINDOW_MS': 5,  # Queries issued within the window are shipped together
+    'MAX_BATCH_SIZE': 25,
+    'DISPATCH_WORKERS': 4,  # Batches in flight at a time per worker
+    'TIMEOUT': 30,  # Seconds a caller waits for its result
+}
+
+# Speculative graphql fetches of an event, launched while the source data is validated, see processors/execution_plan.py
+
+GRAPHQL_PREFETCH = {
+    'ENABLED': False,  # Fetches are discarded when validation fails, which costs a wasted query per invalid event
+}
+
+# Bulk event processing endpoint
+
+BULK_EVENTS = {
+    'MAX_ITEMS': 1000,  # Events accepted per request
+}
+
+# Concurrent relayers of a source event, see processors/fan_out.py
+
+RELAY_FAN_OUT = {
+    'ENABLED': True,
+    'MAX_WORKERS': 8,  # Threads per worker running relayers, shared by all in flight events
+}
+
+# Events accepted by the relay endpoint in async mode, see processors/event_queue.py
+
+EVENT_QUEUE = {
+    'DISPATCH_ON_COMMIT': True,  # Processes accepted events on threads of the accepting worker
+    'WORKERS': 4,  # Threads per worker processing accepted events
+    # Event queue workers, see `manage.py event_queue_worker`
+    'BATCH_SIZE': 50,  # Events claimed at a time by a worker
+    'VISIBILITY_TIMEOUT': 300,  # Seconds after which events of a crashed worker are claimed again
+    'POLL_INTERVAL': 1,  # Seconds a worker sleeps when the queue is empty
+    'MAX_ATTEMPTS': 5,  # Events claimed this many times without completing are failed
+}
+
+# Relays delivered off the request path by `manage.py relay_outbox_worker`, see processors/outbox.py
+
+RELAY_OUTBOX = {
+    'ENABLED': False,  # Queues relays in the outbox instead of delivering them while processing the event
+    'BATCH_SIZE': 100,  # Entries claimed at a time by a worker
+    'POLL_INTERVAL': 1,  # Seconds a worker sleeps when nothing is due
+    'VISIBILITY_TIMEOUT': 300,  # Seconds after which entries of a crashed worker are claimed again
+    'MAX_ATTEMPTS': 10,  # Relays failing this many times are given up and logged as failed
+    'BACKOFF': 1,  # Seconds before the first retry, doubled on every retry
+    'MAX_BACKOFF': 300,
+}
+
+# Source events consumed from rabbitmq by `manage.py event_consumer`, see processors/event_consumer.py
+
+EVENT_CONSUMER = {
+    'QUEUES': {},  # Queue -> {routing key: source event}, eg. {'skurge-users': {'user.created': 'USER_CREATED'}}
+    'PREFETCH_COUNT': 50,  # Messages in flight at a time per consumer
+    'CONCURRENCY': 8,  # Threads per consumer processing messages
+    'REQUEUE_ON_ERROR': True,  # Requeues messages whose processing raised, eg. while the db is unavailable
+    'MAX_ATTEMPTS': 3,  # Deliveries of a failing message before it is rejected, ie. dead-lettered
+    'BACKOFF': 0.5,  # Seconds before reconnecting, doubled on every attempt
+    'MAX_BACKOFF': 30,
+}
+
+# Write-behind buffer for relay logs, see services/log.py
+
+RELAY_LOG_WRITER = {
+    'ENABLED': False,  # Writes relay logs in the background instead of within the request
+    'MAX_BATCH_SIZE': 500,  # Logs written per bulk insert
+    'FLUSH_INTERVAL_MS': 1000,  # Max time a log waits in the buffer
+    'MAX_BUFFER_SIZE': 10000,  # Logs buffered per worker
+    'POLICY': 'DROP',  # DROP new logs when the buffer is full, or BLOCK the relay until there is room
+    'BLOCK_TIMEOUT': 1,  # Seconds to wait for room with the BLOCK policy before dropping
+}
+
+# Monthly partitions of relay_logs maintained by `manage.py relay_log_partitions`, see services/relay_log_partition.py
+
+RELAY_LOG_PARTITIONS = {
+    'MONTHS_AHEAD': 3,  # Months to create partitions for beyond the current one
+    'RETENTION_MONTHS': 6,  # Full months of logs kept before the current one, older partitions are pruned
+    'ARCHIVE': False,  # Detaches expired partitions as relay_logs_archive_* tables instead of dropping them
+}
+
+# Per worker pool of http sessions for api relays, one per destination host, see clients/http.py
+
+HTTP_CLIENT = {
+    'POOL_MAXSIZE': 10,  # Keep-alive connections per host
+    'POOL_BLOCK': False,  # Waits for a free connection instead of opening a throwaway one beyond the pool size
+    'KEEP_ALIVE': True,
+    'TIMEOUT': 60,  # Seconds
+    'MAX_RETRIES': 5,
+    'BACKOFF': 0.1,  # Backoff factor for the exponential backoff between retries
+    'STATUS_FORCELIST': [500, 501, 502, 503],  # Statuses on which idempotent requests are retried
+    'HOSTS': {},  # Per host overrides of the above, eg. {'api.example.com': {'TIMEOUT': 5, 'MAX_RETRIES': 0}}
+}
+# The former HTTP settings, ie. HTTP = {'max_retries': 5, 'backoff': 0.1, 'status_forcelist': [500]}, are still read
+# and take precedence over MAX_RETRIES, BACKOFF and STATUS_FORCELIST above
+
+# Per worker rabbitmq publisher, see clients/event.py
+
+RABBITMQ_PUBLISHER = {
+    'CONNECTION_POOL_SIZE': 4,  # Connections per worker, ie. messages published in parallel
+    'MAX_RETRIES': 3,  # Reconnect attempts per message while the broker is unavailable
+    'BACKOFF': 0.1,  # Seconds, doubled on every retry
+    'MAX_BACKOFF': 2,
+    'CONFIRMS': {  # Publisher confirms, messages are pipelined and confirmed in batches
+        'ENABLED': False,
+        'BATCH_SIZE': 100,  # Buffered messages are published once this many are waiting
+        'MAX_WAIT_MS': 5,  # or once the first of them waited this long
+        'TIMEOUT': 10,  # Seconds to wait for the confirm before the relay is logged as failed
+    },
+}
+
 # Logger settings
 
 LOGGING = {